@@ -7,10 +7,14 @@
 #  out-of-box. Functions in this class are named wrapped_name with name being the same
 #  as the original wrf-python implementation
 
+import os
 import numpy as np
 import xarray
 import dask.array as da
 from wrf.constants import default_fill
+import PyPostTools
+# The split file helpers are shared with the driver (scripts/Wait.py), PyPostTools puts its directory on the path
+import Wait
 
 #make_dataset() - A useful tool to create an empty xarray dataset from set parameters
 def make_dataset(daskArray, start, elapsedHours):
@@ -142,4 +146,77 @@ def fetch_variable(daskArray, varName, include_time=False, include_meta=False):
 	else:
 		subArray2 = subArray.data
 		
-	return subArray2 if include_time else subArray2.squeeze()
\ No newline at end of file
+	return subArray2 if include_time else subArray2.squeeze()
+
+"""
+This block of code reads the split history files WRF writes with io_form_history 102 (One file per rank, IE: wrfout_d01_2019-05-26_00_00_00_0012)
+ as a single dataset, without joining them first. Each file holds the patch of its rank, placed in the domain by the
+ WEST-EAST_PATCH_START_UNSTAG / SOUTH-NORTH_PATCH_START_UNSTAG attributes (1-based). The patches are opened lazily and put
+ together with dask, so every variable has one chunk per patch and nothing is read until it is computed.
+"""
+#open_history() - Opens a history file, or puts its patches together when WRF wrote it split (See open_split_dataset())
+def open_history(name):
+	if os.path.exists(name):
+		return xarray.open_mfdataset(name, parallel=False, combine='by_coords')
+	patches = Wait.split_files(name)
+	if not patches:
+		raise IOError("No history file or split patches found for " + name)
+	return open_split_dataset(patches)
+
+#patch_grid() - Places the patches in the domain, returns the patch datasets as rows (south_north) of columns (west_east)
+def patch_grid(patches):
+	columns = sorted(set(int(p.attrs["WEST-EAST_PATCH_START_UNSTAG"]) for p in patches))
+	rows = sorted(set(int(p.attrs["SOUTH-NORTH_PATCH_START_UNSTAG"]) for p in patches))
+	grid = [[None] * len(columns) for r in rows]
+	for p in patches:
+		r = rows.index(int(p.attrs["SOUTH-NORTH_PATCH_START_UNSTAG"]))
+		c = columns.index(int(p.attrs["WEST-EAST_PATCH_START_UNSTAG"]))
+		if grid[r][c] is not None:
+			raise ValueError("Two patches start at west_east " + str(columns[c]) + ", south_north " + str(rows[r]))
+		grid[r][c] = p
+	if any(p is None for row in grid for p in row):
+		raise ValueError("The patches do not cover the domain, " + str(len(patches)) + " files for " + str(len(rows)) + " x " + str(len(columns)) + " patches")
+	# Each patch must start where the one before it ended
+	for r in range(1, len(rows)):
+		if int(grid[r-1][0].attrs["SOUTH-NORTH_PATCH_END_UNSTAG"]) + 1 != rows[r]:
+			raise ValueError("Missing patches in south_north before " + str(rows[r]))
+	for c in range(1, len(columns)):
+		if int(grid[0][c-1].attrs["WEST-EAST_PATCH_END_UNSTAG"]) + 1 != columns[c]:
+			raise ValueError("Missing patches in west_east before " + str(columns[c]))
+	return grid
+
+#stitch_variable() - Puts one variable of every patch together, returns (dims, dask array)
+def stitch_variable(grid, varName):
+	first = grid[0][0][varName]
+	dims = first.dims
+	weAxis = next((dims.index(d) for d in dims if d in ("west_east", "west_east_stag")), None)
+	snAxis = next((dims.index(d) for d in dims if d in ("south_north", "south_north_stag")), None)
+	if weAxis is None and snAxis is None:
+		# Not decomposed (IE: Times, ZNU), every patch holds the whole variable
+		return dims, first.data
+	rows = grid if snAxis is not None else grid[:1]
+	stitched = []
+	for row in rows:
+		cells = [p[varName].data for p in (row if weAxis is not None else row[:1])]
+		stitched.append(da.concatenate(cells, axis=weAxis) if len(cells) > 1 else cells[0])
+	return dims, (da.concatenate(stitched, axis=snAxis) if len(stitched) > 1 else stitched[0])
+
+#open_split_dataset() - Opens the patch files of one split history file as one dataset, with one dask chunk per patch
+def open_split_dataset(patches):
+	# chunks={} keeps every variable of a file in a single chunk
+	grid = patch_grid([xarray.open_dataset(p, chunks={}) for p in patches])
+	first = grid[0][0]
+	xrOut = xarray.Dataset(attrs=dict(first.attrs))
+	for varName in first.variables:
+		if varName in first.dims:
+			continue
+		dims, data = stitch_variable(grid, varName)
+		xrOut[varName] = xarray.Variable(dims, data, attrs=first[varName].attrs, encoding=first[varName].encoding)
+	xrOut = xrOut.set_coords([c for c in first.coords if c in xrOut.variables])
+	# The dataset now holds the whole domain, as a joined file would
+	for dim, size in [("WEST-EAST", int(first.attrs["WEST-EAST_GRID_DIMENSION"])), ("SOUTH-NORTH", int(first.attrs["SOUTH-NORTH_GRID_DIMENSION"]))]:
+		xrOut.attrs[dim + "_PATCH_START_UNSTAG"] = 1
+		xrOut.attrs[dim + "_PATCH_END_UNSTAG"] = size - 1
+		xrOut.attrs[dim + "_PATCH_START_STAG"] = 1
+		xrOut.attrs[dim + "_PATCH_END_STAG"] = size
+	return xrOut
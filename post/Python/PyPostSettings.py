@@ -9,6 +9,9 @@ import time
 import os
 import PyPostTools
 
+# defaults: The values used for settings missing from python_post_control.txt (Settings added after a control file was written)
+defaults = {"follow_stable_seconds": "60", "follow_timeout": "180"}
+
 # PyPostSettings: Class responsible for obtaining information from the control file and parsing it to classes that need the information
 class PyPostSettings():
 	settings = {}
@@ -48,6 +51,9 @@ class PyPostSettings():
 			self.logger.write("***FAIL*** Program critical variables missing, check for existence of python_post_control.txt, abort.")
 			return False
 		else:
+			for key in defaults:
+				if key not in self.settings:
+					self.settings[key] = defaults[key]
 			self.settings["headdir"] = curDir[:curDir.rfind('/')] + '/'
 			return True
         
@@ -12,6 +12,12 @@ import time
 import threading
 import subprocess
 
+# The driver's scripts/ directory, the wrfout follower (Wait.OutputFollower) and the split file helpers are shared with it. The post job
+#  sets PYTHON_POST_SCRIPTS_DIR (See PreparePyJob.job_commands()), otherwise the scripts/ directory next to post/ is used.
+scriptsDir = os.path.abspath(os.environ.get("PYTHON_POST_SCRIPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts")))
+if scriptsDir not in sys.path:
+	sys.path.append(scriptsDir)
+
 #CD: Current Directory management, see https://stackoverflow.com/a/13197763/7537290 for implementation. This is used to maintain the overall OS CWD while allowing embedded changes.
 class cd:
     """Context manager for changing the current working directory"""
@@ -97,7 +103,8 @@ def write_job_file(host, scheduler_port=None, project_name=None, queue=None, nod
 		target_file.write("#COBALT --attrs mcdram=cache:numa=quad" + '\n' + '\n')
 		target_file.write("source activate run-wrf\n")
 		target_file.write("ulimit -c unlimited\n")
-		target_file.write("export PYTHONPATH=${PYTHONPATH}:/projects/climate_severe/wrf-run/post/Python/" + '\n\n')		
+		target_file.write("export PYTHONPATH=${PYTHONPATH}:/projects/climate_severe/wrf-run/post/Python/" + '\n')
+		target_file.write("export PYTHON_POST_SCRIPTS_DIR=" + scriptsDir + '\n\n')		
 		target_file.write("aprun -n ${COBALT_JOBSIZE} -N " + str(nProcs) + " -d " + str(nThreads) + " -j 1 dask-worker " + str(host) + ":" + str(scheduler_port) + " \\" + "\n")
 		target_file.write(" --nprocs " + str(nProcs) + " --nthreads " + str(nThreads) + " --death-timeout 180 --no-dashboard" + "\n")
 	return True
@@ -111,7 +111,7 @@ class Routines(PyPostTools.Singleton):
 			self.theta_e_levels = self.iterative_add(self.theta_e_levels, self.pySet.fetch("theta_e_levels"))
 		if(self.pySet.fetch("plot_rh_and_wind") == '1'):
 			self.need_RH = True
-			self.rh_levels = self.iterative_add(self.rh_levels, self.fetch("rh_and_wind_levels"))
+			self.rh_levels = self.iterative_add(self.rh_levels, self.pySet.fetch("rh_and_wind_levels"))
 		if(self.pySet.fetch("plot_500_rel_vort") == '1'):
 			self.need_relvort = True
 		if(self.pySet.fetch("plot_CAPE") == '1'):
@@ -15,8 +15,9 @@ class Application():
 	
 		#NOTE: If you're looking to automate (CRON) jobs, use this portion of the code to update control.txt
 		
-		#Run the script
-		os.system("nohup " + curDir + "/scripts/Application.py")
+		#Run the script, --resume picks up an interrupted run of the same forecast (See README.md)
+		args = " --resume" if "--resume" in sys.argv[1:] else ""
+		os.system("nohup " + curDir + "/scripts/Application.py" + args)
 
 if __name__ == "__main__":
 	pInst = Application()
\ No newline at end of file
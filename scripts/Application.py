@@ -6,35 +6,55 @@
 
 import sys
 import os
+import glob
 import datetime
 import ApplicationSettings
 import ModelData
 import Scheduler
 import Cleanup
+import Decomposition
+import IOForms
+import IOVars
+import FileOps
+import Telemetry
 import Template
 import Jobs
+import Pipeline
+import Quilting
+import RunState
 import Tools
 
-# Application: Class responsible for running the program steps.
+# Application: Class responsible for running the program steps. Started with --resume, the steps recorded as completed in the
+#  run_state.json of the forecast are skipped and jobs still in the queue are followed instead of being submitted again.
 class Application():		
+	# The sample namelist and the .exe files of the WRF run directory, these are not staged from wrfrunfiles
+	skippedRunFiles = ["namelist.input", "wrf.exe", "real.exe", "ndown.exe", "tc.exe"]
 	
 	def __init__(self):
 		curDir = os.path.dirname(os.path.abspath(__file__)) 
 		logger = Tools.loggedPrint.instance()
+		resume = "--resume" in sys.argv[1:]
 	
-		logger.write("Initializing WRF Auto-Run Program")
+		logger.write("Initializing WRF Auto-Run Program" + (" (Resuming)" if resume else ""))
 		#Step 1: Load program settings
 		logger.write(" 1. Loading program settings, setting up directories")
 		settings = ApplicationSettings.AppSettings()
 		modelParms = ModelData.ModelDataParameters(settings.fetch("modeldata"))
-		scheduleParms = Scheduler.Scheduler_Settings(settings.fetch("jobscheduler"))
+		scheduleParms = Scheduler.Scheduler_Settings(settings.fetch("jobscheduler"), settings.fetch("scheduler_bin_dir"))
 		if not scheduleParms.validScheduler():
 			sys.exit("Program failed at step 1, job scheduler: " + settings.fetch("jobscheduler") + ", is not defined in the program.")	
 		if not modelParms.validModel():
 			sys.exit("Program failed at step 1, model data source: " + settings.fetch("modeldata") + ", is not defined in the program.")
 		logger.write(" - Settings loaded, model data source " + settings.fetch("modeldata") + " applied to the program.")
+		state = RunState.RunState(settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8], resume)
+		if state.is_complete("cleanup"):
+			logger.write(" 1. Every step of this forecast completed in an earlier run, nothing to resume")
+			return
 		prc = Cleanup.PostRunCleanup(settings)
-		prc.performClean(cleanAll = False, cleanOutFiles = True, cleanErrorFiles = True, cleanInFiles = True, cleanBdyFiles = False, cleanWRFOut = False, cleanModelData = False)
+		if not resume:
+			prc.performClean(cleanAll = False, cleanOutFiles = True, cleanErrorFiles = True, cleanInFiles = True, cleanBdyFiles = False, cleanWRFOut = False, cleanModelData = False)
+		else:
+			logger.write(" 1. Resuming, the files of the earlier run have been left in place")
 		mParms = modelParms.fetch()
 		if(settings.fetch("run_prerunsteps") == '1'):
 			Tools.popen(settings, "mkdir " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8])
@@ -43,38 +63,70 @@ class Application():
 			Tools.popen(settings, "mkdir " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/postprd")	
 		else:
 			logger.write(" 1. run_prerunsteps is turned off, directories have not been created")
+		if(settings.fetch("walltime_advisor") in ['1', '2']):
+			logger.write("  - Checking the walltimes against the runtimes of earlier runs")
+			Telemetry.Advisor(settings, Telemetry.StageHistory(settings)).advise()
+		if(settings.fetch("io_advisor") in ['1', '2']):
+			logger.write("  - Sizing the I/O quilt servers and striping from the output of the run")
+			Quilting.QuiltAdvisor(settings).advise()
 		logger.write("  - Checking if WRF Node decomposition is required")
 		save_nproc_x = -1
 		save_nproc_y = -1
 		if(settings.fetch("wrf_detect_proc_count") == '1'):
 			logger.write("   - Yes.")
-			det = Tools.detect_ideal_processors(int(settings.fetch("e_we")), 
-												int(settings.fetch("e_sn")), 
-												int(settings.fetch("num_wrf_nodes")), 
-												int(settings.fetch("wrf_mpi_ranks_per_node")), 
-												int(settings.fetch("wrf_nio_groups")), 
-												int(settings.fetch("wrf_nio_tasks_per_group")))
+			det = Decomposition.plan_decomposition(int(settings.fetch("e_we")), 
+												   int(settings.fetch("e_sn")), 
+												   int(settings.fetch("num_wrf_nodes")), 
+												   int(settings.fetch("wrf_mpi_ranks_per_node")), 
+												   int(settings.fetch("wrf_nio_groups")), 
+												   int(settings.fetch("wrf_nio_tasks_per_group")),
+												   int(settings.fetch("wrf_numtiles")))
 			if(det is None):
 				logger.write(" 1. Failed to find a decomposition given the input settings in control.txt, please adjust your settings")
 				sys.exit("")
-			save_nproc_x = det[0]
-			save_nproc_y = det[1]
-			logger.write("   - Found a viable decomposition, X: " + str(save_nproc_x) + ", Y: " + str(save_nproc_y) + ".")
+			save_nproc_x = det.nprocX
+			save_nproc_y = det.nprocY
+			logger.write("   - Found a viable decomposition, " + det.describe() + ".")
+			if(det.nioGroups != int(settings.fetch("wrf_nio_groups"))):
+				logger.write("   - No decomposition fits with " + settings.fetch("wrf_nio_groups") + " I/O groups, using " + str(det.nioGroups) + ".")
+				settings.override("wrf_nio_groups", str(det.nioGroups))
+				settings.add_replacementKey("[wrf_nio_groups]", str(det.nioGroups))
 		else:
 			logger.write("   - No.")
 		logger.write(" 1. Done.")
 		#Step 2: Download Data Files
 		logger.write(" 2. Downloading Model Data Files")
 		modelData = ModelData.ModelData(settings, modelParms)
-		if(settings.fetch("run_prerunsteps") == '1'):
-			modelData.fetchFiles()
+		concurrent = (settings.fetch("concurrent_stages") == '1' and settings.fetch("single_allocation_job") != '1' 
+					  and settings.fetch("chain_jobs") != '1')
+		if concurrent:
+			logger.write(" 2. concurrent_stages is set, the model data will be downloaded alongside the geogrid job")
+		elif(settings.fetch("run_prerunsteps") == '1'):
+			self.fetch_model_data(settings, modelData, state)
 		else:
 			logger.write(" 2. run_prerunsteps is turned off, model data has not been downloaded")
 		logger.write(" 2. Done")
 		#Step 3: Generate run files
 		logger.write(" 3. Generating job files and creating templated files")
+		if(int(settings.fetch("wrf_segments")) > 1 and (settings.fetch("single_allocation_job") == '1' or settings.fetch("chain_jobs") == '1')):
+			# The chain and the allocation job run wrf.exe as one step, a restart-chunked run needs the driver to follow each segment
+			logger.write(" 3. wrf_segments is not used with single_allocation_job or chain_jobs, wrf.exe will run as a single job")
+			settings.override("wrf_segments", "1")
+		if(settings.fetch("io_benchmark") in ['1', '2'] and (settings.fetch("single_allocation_job") == '1' or settings.fetch("chain_jobs") == '1')):
+			logger.write(" 3. io_benchmark is not used with single_allocation_job or chain_jobs")
+			settings.override("io_benchmark", "0")
 		if(settings.fetch("use_io_vars") == '1'):
-			Tools.popen(settings, "cp " + settings.fetch("headdir") + "io_vars/IO_VARS.txt " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/IO_VARS.txt")			
+			ioVarsPath = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/IO_VARS.txt"
+			generated = False
+			if(settings.fetch("io_vars_generate") == '1'):
+				try:
+					IOVars.write_io_vars(settings, ioVarsPath)
+					generated = True
+				except Exception as e:
+					# Any failure of the generator (IE: An ImportError from the post-processing modules) falls back to the stock file
+					logger.write(" 3. Could not write IO_VARS.txt from the post-processing products (" + type(e).__name__ + ": " + str(e) + "), using io_vars/IO_VARS.txt")
+			if not generated:
+				Tools.popen(settings, "cp " + settings.fetch("headdir") + "io_vars/IO_VARS.txt " + ioVarsPath)
 		# Check if we are using LFS / quilting
 		if(int(settings.fetch("wrf_nio_groups")) * int(settings.fetch("wrf_nio_tasks_per_group")) == 0):
 			settings.add_replacementKey("[io_form_geogrid]", 2)
@@ -87,17 +139,23 @@ class Application():
 		settings.add_replacementKey("[num_metgrid_levels]", mParms["MetgridLevels"])
 		tWrite = Template.Template_Writer(settings)
 		# RF: Additional namelist settings based on IO selections
+		ioForms = IOForms.select_io_forms(settings)
+		logger.write(" 3. I/O forms: " + ", ".join(key + " " + ioForms[key] for key, exe, entry in IOForms.streams))
+		settings.add_replacementKey("[io_form_restart]", ioForms["wrf_io_form_restart"])
 		if(int(settings.fetch("wrf_nio_groups")) * int(settings.fetch("wrf_nio_tasks_per_group")) == 0):
 			# We use parallel netCDF for everything
 			settings.add_replacementKey("[io_form_history]", str("11"))
-			settings.add_replacementKey("[io_form_restart]", str("2"))
 			settings.add_replacementKey("[io_form_auxinput1]", str("2"))
 			settings.add_replacementKey("[io_form_auxhist2]", str("11"))
 			settings.add_replacementKey("[io_form_auxhist5]", str("11"))
 			settings.add_replacementKey("[io_form_auxhist23]", str("11"))		
 		else:
-			settings.add_replacementKey("[io_form_history]", str("102"))
-			settings.add_replacementKey("[io_form_restart]", str("2"))
+			if(settings.fetch("post_run_unipost") == '1'):
+				# UPP needs whole wrfout files, the quilt servers write them with serial netCDF (The Python post-processor reads split files in place)
+				settings.add_replacementKey("[io_form_history]", str("2"))
+				logger.write(" 3. wrfout files are written whole (io_form_history 2) with quilting, UPP cannot read split files")
+			else:
+				settings.add_replacementKey("[io_form_history]", str("102"))
 			settings.add_replacementKey("[io_form_auxinput1]", str("2"))
 			settings.add_replacementKey("[io_form_auxhist2]", str("11"))
 			settings.add_replacementKey("[io_form_auxhist5]", str("11"))
@@ -113,88 +171,141 @@ class Application():
 			# RF 10/19: real.exe requires nproc_x/nproc_y to be -1, update the settings
 			settings.add_replacementKey("[nproc_x]", str("-1"))
 			settings.add_replacementKey("[nproc_y]", str("-1"))
-			# RF 2/12: For real.exe, these need to be 2, WRF can use 11
-			settings.add_replacementKey("[io_form_input]", str("2"))
-			settings.add_replacementKey("[io_form_boundary]", str("2"))			
+			# RF 2/12: real.exe and wrf.exe each use their own io_form for wrfinput / wrfbdy (See IOForms.select_io_forms())
+			settings.add_replacementKey("[io_form_input]", ioForms["real_io_form_input"])
+			settings.add_replacementKey("[io_form_boundary]", ioForms["real_io_form_boundary"])
 			tWrite.generateTemplatedFile(settings.fetch("headdir") + "templates/namelist.input.template", "namelist.input")
 		else:
 			logger.write(" 3. run_prerunsteps is turned off, template files have not been created")
-		if(self.write_job_files(settings, mParms, scheduleParms) == False):
+		# RF 10/19: wrf.exe uses its own nproc_x/nproc_y and IO settings, its namelist is written now as namelist.input.wrf and
+		#  swapped in by wrf.job, this way every job file is valid from the moment it is written.
+		settings.add_replacementKey("[nproc_x]", str(save_nproc_x))
+		settings.add_replacementKey("[nproc_y]", str(save_nproc_y))
+		settings.add_replacementKey("[io_form_input]", ioForms["wrf_io_form_input"])
+		settings.add_replacementKey("[io_form_boundary]", ioForms["wrf_io_form_boundary"])
+		tWrite.generateTemplatedFile(settings.fetch("headdir") + "templates/namelist.input.template", "namelist.input.wrf")
+		segmentNamelists = []
+		if(len(Jobs.wrf_segments(settings)) > 1):
+			# A restart-chunked run (wrf_segments) uses one namelist per segment, derived from namelist.input.wrf
+			segmentNamelists = Jobs.write_segment_namelists(settings, "namelist.input.wrf")
+			logger.write(" 3. wrf_segments is set, wrf.exe will run as " + str(len(segmentNamelists)) + " restart-chunked jobs")
+		jobs = Jobs.JobSteps(settings, modelParms, scheduleParms, state)
+		post = Jobs.Postprocessing_Steps(settings, modelParms, scheduleParms, jobs.tracker, state)
+		jobs.check_geo_em_cache()
+		jobs.check_wps_cache()
+		if(self.write_job_files(settings, mParms, scheduleParms, post, jobs.cachedSteps) == False):
 			logger.write(" 3. Failed to generate job files... abort")
 			sys.exit("")
+		# Recovery writes the job files again when it moves a failed wrf.exe run to more nodes
+		jobs.recovery.rewriteJobs = lambda: self.write_job_files(settings, mParms, scheduleParms, post, jobs.cachedSteps)
 		if(self.write_helper_scripts(settings, mParms, scheduleParms) == False):
 			logger.write(" 3. Failed to generate helper scripts... abort")
 			sys.exit("")
 		logger.write(" 3. Copying WPS/WRF run files to output directory")
-		# Copy important files to the directory
-		Tools.popen(settings, "cp " + settings.fetch("headdir") + "run_files/* " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output")
-		# Copy required WRF files
-		Tools.popen(settings, "cp " + settings.fetch("wrfrunfiles") + "* " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output")
-		# Note, we need to remove the .exe files and sample namelist and then recopy from the head dir.
-		Tools.popen(settings, "rm " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/namelist.input")
-		Tools.popen(settings, "rm " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/wrf.exe")
-		Tools.popen(settings, "rm " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/real.exe")
-		Tools.popen(settings, "rm " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/ndown.exe")
-		Tools.popen(settings, "rm " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/tc.exe")
-		# Copy the .exe files if needed
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		ops = FileOps.FileOps(settings, "run files")
+		# The sample namelist and the .exe files of the WRF run directory are not used, remove any left from an earlier run and skip them
+		#  when copying, the .exe files are copied from the head dir below.
+		skipped = self.skippedRunFiles
+		for fName in skipped:
+			ops.delete(runDir + "/output/" + fName)
+		# Important files, the required WRF files (Tables), and the .exe files if needed
+		sources = [(settings.fetch("headdir") + "run_files/*", runDir + "/output", None),
+				   (settings.fetch("wrfrunfiles") + "*", runDir + "/output", skipped)]
 		if(settings.fetch("need_copy_exe") == '1'):
-			Tools.popen(settings, "cp " + settings.fetch("wrfexecutables") + "*.exe " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output")
-			# Grab our WPS executables
-			# Tools.popen(settings, "cp " + settings.fetch("wpsdirectory") + "link_grib.csh " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]) # Now written by this script
-			Tools.popen(settings, "cp " + settings.fetch("wpsdirectory") + "geogrid.exe " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8])
-			Tools.popen(settings, "cp " + settings.fetch("wpsdirectory") + "ungrib.exe " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8])
-			Tools.popen(settings, "cp " + settings.fetch("wpsdirectory") + "metgrid.exe " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8])
-		# Finally, move the generated files to the run directory		
-		Tools.popen(settings, "mv namelist.input " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output")		
+			sources.append((settings.fetch("wrfexecutables") + "*.exe", runDir + "/output", None))
+			# Grab our WPS executables (link_grib.csh is written by this script)
+			sources.append((settings.fetch("wpsdirectory") + "geogrid.exe", runDir, None))
+			sources.append((settings.fetch("wpsdirectory") + "ungrib.exe", runDir, None))
+			sources.append((settings.fetch("wpsdirectory") + "metgrid.exe", runDir, None))
+		# None of these are written to by the programs, so they can be linked to the install instead of copied (run_file_staging)
+		staging = settings.fetch("run_file_staging")
+		for pattern, target, exclude in sources:
+			if staging in ["symlink", "hardlink"]:
+				ops.link(pattern, target, exclude, hard = (staging == "hardlink"))
+			else:
+				ops.copy(pattern, target, exclude)
+		# Finally, move the generated files to the run directory (The namelists are the only staged files that change per run)
+		ops.move("namelist.input", runDir + "/output")
+		ops.move("namelist.input.wrf", runDir + "/output")
+		for segmentNamelist in segmentNamelists:
+			ops.move(segmentNamelist, runDir + "/output")
+		ops.run()
 		logger.write(" 3. Done")
 		#Step 4: Run the WRF steps
 		logger.write(" 4. Run WRF Steps")
-		jobs = Jobs.JobSteps(settings, modelParms, scheduleParms)
-		logger.write("  4.a. Checking for geogrid flag...")
-		Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
-		if(settings.fetch("run_geogrid") == '1'):
-			logger.write("  4.a. Geogrid flag is set, preparing geogrid job.")
-			jobs.run_geogrid()
-			logger.write("  4.a. Geogrid job Done")
-		else:
-			logger.write("  4.a. Geogrid flag is not set, skipping step")
-		logger.write("  4.a. Done")
-		logger.write("  4.b. Running pre-processing executables")	
-		Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
-		if(settings.fetch("run_preprocessing_jobs") == '1'):
-			if(jobs.run_preprocessing() == False):
-				logger.write("   4.b. Error in pre-processing jobs")
-				logger.close()		
-				sys.exit("   4.b. ERROR: Pre-processing jobs failed, check error logs")
-		else:
-			logger.write("  4.b. run_preprocessing_jobs is turned off, skiping this step")
-		Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
-		logger.write("  4.b. Done")
-		logger.write("  4.c. Running WRF Model")
-		logger.write("   4.c. > Updating settings for nproc_x/nproc_y")
-		# RF 10/19: Now nuke the real.exe namelist file and load in the wrf settings, then run.	
-		settings.add_replacementKey("[nproc_x]", str(save_nproc_x))
-		settings.add_replacementKey("[nproc_y]", str(save_nproc_y))
-		settings.add_replacementKey("[io_form_input]", str("2"))
-		settings.add_replacementKey("[io_form_boundary]", str("2"))
-		tWrite.generateTemplatedFile(settings.fetch("headdir") + "templates/namelist.input.template", "namelist.input")	
-		Tools.popen(settings, "mv namelist.input " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output/namelist.input")
-		logger.write("   4.c. > Starting wrf.exe job process")
-		if(settings.fetch("run_wrf") == '1'):
-			if(jobs.run_wrf() == False):
-				logger.write("   4.c. Error at WRF.exe")
-				logger.close()		
-				sys.exit("   4.c. ERROR: wrf.exe process failed to complete, check error file.")	
+		if(settings.fetch("single_allocation_job") == '1'):
+			logger.write("  4. single_allocation_job is set, running all steps inside a single job")
+			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
+			if(jobs.run_single_allocation(post) == False):
+				logger.write("  4. Error in the single allocation job")
+				logger.close()
+				sys.exit("  4. ERROR: Single allocation job failed, check error logs")
+		elif concurrent:
+			logger.write("  4. concurrent_stages is set, running the remaining steps as a pipeline")
+			pipeline = self.build_pipeline(settings, mParms, modelData, jobs, post, prc, state)
+			if(pipeline.run() == False):
+				post.stop_following(False)
+				logger.write("  4. Error in the pipeline, see the stage summary above")
+				logger.close()
+				sys.exit("  4. ERROR: Pipeline failed, check error logs")
+			logger.write("All Steps Completed.")
+			logger.write("Program execution complete.")
+			logger.close()
+			return
+		elif(settings.fetch("chain_jobs") == '1'):
+			logger.write("  4. chain_jobs is set, submitting all jobs as a dependency chain")
+			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
+			if(settings.fetch("run_postprocessing") == '1' and settings.fetch("run_wrf") == '1'):
+				post.start_following(leadMinutes = int(settings.fetch("geogrid_walltime")) + int(settings.fetch("prerun_walltime")))
+			if(jobs.run_chain(post) == False):
+				post.stop_following(False)
+				logger.write("  4. Error in the job chain, remaining jobs have been removed from the queue")
+				logger.close()
+				sys.exit("  4. ERROR: Job chain failed, check error logs")
 		else:
-			logger.write("  4.c. run_wrf is turned off, skiping wrf.exe process")				
-		logger.write("  4.c. Done")
+			logger.write("  4.a. Checking for geogrid flag...")
+			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
+			if(settings.fetch("run_geogrid") == '1'):
+				logger.write("  4.a. Geogrid flag is set, preparing geogrid job.")
+				if(jobs.run_geogrid() == False):
+					logger.write("   4.a. Error in geogrid job")
+					logger.close()
+					sys.exit("   4.a. ERROR: Geogrid job failed, check error logs")
+				logger.write("  4.a. Geogrid job Done")
+			else:
+				logger.write("  4.a. Geogrid flag is not set, skipping step")
+			logger.write("  4.a. Done")
+			logger.write("  4.b. Running pre-processing executables")	
+			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
+			if(settings.fetch("run_preprocessing_jobs") == '1'):
+				if(jobs.run_preprocessing() == False):
+					logger.write("   4.b. Error in pre-processing jobs")
+					logger.close()		
+					sys.exit("   4.b. ERROR: Pre-processing jobs failed, check error logs")
+			else:
+				logger.write("  4.b. run_preprocessing_jobs is turned off, skiping this step")
+			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
+			logger.write("  4.b. Done")
+			logger.write("  4.c. Running WRF Model")
+			logger.write("   4.c. > Starting wrf.exe job process")
+			if(settings.fetch("run_wrf") == '1'):
+				if(settings.fetch("run_postprocessing") == '1'):
+					post.start_following()
+				if(jobs.run_wrf() == False):
+					post.stop_following(False)
+					logger.write("   4.c. Error at WRF.exe")
+					logger.close()		
+					sys.exit("   4.c. ERROR: wrf.exe process failed to complete, check error file.")	
+			else:
+				logger.write("  4.c. run_wrf is turned off, skiping wrf.exe process")				
+			logger.write("  4.c. Done")
 		logger.write(" 4. Done")
 		#Step 5: Run postprocessing steps
 		if(settings.fetch("run_postprocessing") == '1'):
 			logger.write(" 5. Running post-processing")
-			post = Jobs.Postprocessing_Steps(settings, modelParms)
 			Tools.Process.instance().HoldUntilOpen(breakTime = 86400)
-			if(post.prepare_postprocessing() == False):
+			if(not post.submitted() and post.prepare_postprocessing() == False):
 				logger.write("   5. Error initializing post-processing")
 				logger.close()			
 				sys.exit("   5. ERROR: post-processing process failed to initialize, check error file.")
@@ -209,265 +320,535 @@ class Application():
 		#Step 6: Cleanup
 		logger.write(" 6. Cleaning Temporary Files")
 		prc.performClean(cleanAll = False, cleanOutFiles = True, cleanErrorFiles = True, cleanInFiles = True, cleanBdyFiles = True, cleanWRFOut = False, cleanModelData = True)
+		state.finished("cleanup", True)
 		logger.write(" 6. Done")		
 		#Done.
 		logger.write("All Steps Completed.")
 		logger.write("Program execution complete.")
 		logger.close()
 		
+	# build_pipeline: Describes steps 2 through 6 as a graph of stages. geogrid only needs the job files, so it runs while the
+	#  model data is downloading, and every ungrib job starts once the download completes, without waiting on geogrid.
+	def build_pipeline(self, settings, mParms, modelData, jobs, post, prc, state):
+		def run_post():
+			if(post.prepare_postprocessing() == False):
+				return False
+			return post.run_postprocessing()
+		def run_cleanup():
+			prc.performClean(cleanAll = False, cleanOutFiles = True, cleanErrorFiles = True, cleanInFiles = True, cleanBdyFiles = True, cleanWRFOut = False, cleanModelData = True)
+			state.finished("cleanup", True)
+		runPrerun = settings.fetch("run_preprocessing_jobs") == '1'
+		jobs.prepare_stages()
+		pipeline = Pipeline.Pipeline()
+		pipeline.add("download", lambda: self.fetch_model_data(settings, modelData, state), enabled = settings.fetch("run_prerunsteps") == '1' and not jobs.ungrib_cached())
+		pipeline.add("geogrid", jobs.run_geogrid_stage, enabled = settings.fetch("run_geogrid") == '1')
+		ungribStages = []
+		for ext in mParms["FileExtentions"]:
+			pipeline.add("ungrib." + ext, lambda ext = ext: jobs.run_ungrib(ext), ["download"], enabled = runPrerun and ("ungrib." + ext) not in jobs.cachedSteps)
+			ungribStages.append("ungrib." + ext)
+		pipeline.add("metgrid", jobs.run_metgrid, ["geogrid"] + ungribStages, enabled = runPrerun and "metgrid" not in jobs.cachedSteps)
+		pipeline.add("real", jobs.run_real, ["metgrid"], enabled = runPrerun)
+		pipeline.add("wrf", jobs.run_wrf, ["real"], enabled = settings.fetch("run_wrf") == '1')
+		runPost = settings.fetch("run_postprocessing") == '1'
+		pipeline.add("post.follow", post.start_following, ["real"], enabled = runPost and settings.fetch("run_wrf") == '1' and post.follows())
+		pipeline.add("post", run_post, ["wrf", "post.follow"], enabled = runPost)
+		pipeline.add("cleanup", run_cleanup, ["post"])
+		return pipeline
+		
+	# fetch_model_data: Downloads the model data, unless the run being resumed already did and the files are unchanged
+	def fetch_model_data(self, settings, modelData, state):
+		if state.is_complete("download"):
+			Tools.loggedPrint.instance().write(" 2. The model data was downloaded in an earlier run of this forecast, skipping")
+			return True
+		result = modelData.fetchFiles()
+		if(settings.fetch("debugmode") != '1'):
+			dataDir = settings.fetch("datadir") + '/' + settings.fetch("modeldata") + '/' + settings.fetch("starttime")
+			state.finished("download", result is not False, sorted(glob.glob(dataDir + "/*")))
+		return result
+		
 	def write_helper_scripts(self, settings, mParms, scheduleParms):
 		logger = Tools.loggedPrint.instance()
 		logger.write("  -> Writing helper scripts")
-		with Tools.cd(settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]):
-			logger.write("  -- writing link_grib.csh")
-			with open("link_grib.csh", 'w') as target_file:
-				target_file.write("#!/bin/csh -f\n\n")
-				target_file.write("set alpha = ( A B C D E F G H I J K L M N O P Q R S T U V W X Y Z )\n")
-				target_file.write("set i1 = 1\n")
-				target_file.write("set i2 = 1\n")
-				target_file.write("set i3 = 1\n\n")
-				
-				target_file.write("if ( ( ${#argv} == 1) || ( ( ${#argv} == 2) && ( ${2} == \".\" ) ) ) then\n\n")
-				target_file.write("   rm -f GRIBFILE.??? >& /dev/null\n\n")
-				target_file.write("   foreach f ( ${1}* )\n\n")
-				target_file.write("      ln -sf ${f} GRIBFILE.$alpha[$i3]$alpha[$i2]$alpha[$i1]\n")
-				target_file.write("      @ i1 ++\n\n")
-				target_file.write("      if ( $i1 > 26 ) then\n")
-				target_file.write("         set i1 = 1\n")
-				target_file.write("         @ i2 ++\n")
-				target_file.write("         if ( $i2 > 26 ) then\n")
-				target_file.write("            set i2 = 1\n")
-				target_file.write("            @ i3 ++\n")
-				target_file.write("            if ( $i3 > 26 ) then\n")
-				target_file.write("               echo \"RAN OUT OF GRIB FILE SUFFIXES!\"\n")
-				target_file.write("            endif\n")
-				target_file.write("         endif\n")
-				target_file.write("      endif\n\n")
-				target_file.write("   end\n")
-				target_file.write("else if ( ${#argv} > 1 ) then\n\n")
-				target_file.write("   rm -f GRIBFILE.??? >& /dev/null\n\n")
-				target_file.write("   foreach f ( $* )\n\n")
-				target_file.write("      if ( $f != \".\" ) then\n")
-				target_file.write("         ln -sf ${f} GRIBFILE.$alpha[$i3]$alpha[$i2]$alpha[$i1]\n")
-				target_file.write("         @ i1 ++\n\n")
-				target_file.write("         if ( $i1 > 26 ) then\n")
-				target_file.write("            set i1 = 1\n")
-				target_file.write("            @ i2 ++\n")
-				target_file.write("            if ( $i2 > 26 ) then\n")
-				target_file.write("               set i2 = 1\n")
-				target_file.write("               @ i3 ++\n")
-				target_file.write("               if ( $i3 > 26 ) then\n")
-				target_file.write("                  echo \"RAN OUT OF GRIB FILE SUFFIXES!\"\n")
-				target_file.write("               endif\n")
-				target_file.write("            endif\n")
-				target_file.write("         endif\n")
-				target_file.write("      endif\n\n")
-				target_file.write("   end\n")
-				target_file.write("else if ( ${#argv} == 0 ) then\n")
-				target_file.write("   echo \" \"\n")
-				target_file.write("   echo \" \"\n")
-				target_file.write("   echo \"   Please provide some GRIB data to link\"\n")
-				target_file.write("   echo \"   usage: $0 path_to_grib_data/grib_data_root\"\n")
-				target_file.write("   echo \" \"\n")
-				target_file.write("   echo \" \"\n")
-				target_file.write("endif\n")
-				
-			Tools.popen(settings, "chmod +x link_grib.csh")
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		logger.write("  -- writing link_grib.csh")
+		with open(runDir + "/link_grib.csh", 'w') as target_file:
+			target_file.write("#!/bin/csh -f\n\n")
+			target_file.write("set alpha = ( A B C D E F G H I J K L M N O P Q R S T U V W X Y Z )\n")
+			target_file.write("set i1 = 1\n")
+			target_file.write("set i2 = 1\n")
+			target_file.write("set i3 = 1\n\n")
+			
+			target_file.write("if ( ( ${#argv} == 1) || ( ( ${#argv} == 2) && ( ${2} == \".\" ) ) ) then\n\n")
+			target_file.write("   rm -f GRIBFILE.??? >& /dev/null\n\n")
+			target_file.write("   foreach f ( ${1}* )\n\n")
+			target_file.write("      ln -sf ${f} GRIBFILE.$alpha[$i3]$alpha[$i2]$alpha[$i1]\n")
+			target_file.write("      @ i1 ++\n\n")
+			target_file.write("      if ( $i1 > 26 ) then\n")
+			target_file.write("         set i1 = 1\n")
+			target_file.write("         @ i2 ++\n")
+			target_file.write("         if ( $i2 > 26 ) then\n")
+			target_file.write("            set i2 = 1\n")
+			target_file.write("            @ i3 ++\n")
+			target_file.write("            if ( $i3 > 26 ) then\n")
+			target_file.write("               echo \"RAN OUT OF GRIB FILE SUFFIXES!\"\n")
+			target_file.write("            endif\n")
+			target_file.write("         endif\n")
+			target_file.write("      endif\n\n")
+			target_file.write("   end\n")
+			target_file.write("else if ( ${#argv} > 1 ) then\n\n")
+			target_file.write("   rm -f GRIBFILE.??? >& /dev/null\n\n")
+			target_file.write("   foreach f ( $* )\n\n")
+			target_file.write("      if ( $f != \".\" ) then\n")
+			target_file.write("         ln -sf ${f} GRIBFILE.$alpha[$i3]$alpha[$i2]$alpha[$i1]\n")
+			target_file.write("         @ i1 ++\n\n")
+			target_file.write("         if ( $i1 > 26 ) then\n")
+			target_file.write("            set i1 = 1\n")
+			target_file.write("            @ i2 ++\n")
+			target_file.write("            if ( $i2 > 26 ) then\n")
+			target_file.write("               set i2 = 1\n")
+			target_file.write("               @ i3 ++\n")
+			target_file.write("               if ( $i3 > 26 ) then\n")
+			target_file.write("                  echo \"RAN OUT OF GRIB FILE SUFFIXES!\"\n")
+			target_file.write("               endif\n")
+			target_file.write("            endif\n")
+			target_file.write("         endif\n")
+			target_file.write("      endif\n\n")
+			target_file.write("   end\n")
+			target_file.write("else if ( ${#argv} == 0 ) then\n")
+			target_file.write("   echo \" \"\n")
+			target_file.write("   echo \" \"\n")
+			target_file.write("   echo \"   Please provide some GRIB data to link\"\n")
+			target_file.write("   echo \"   usage: $0 path_to_grib_data/grib_data_root\"\n")
+			target_file.write("   echo \" \"\n")
+			target_file.write("   echo \" \"\n")
+			target_file.write("endif\n")
+			
+		Tools.popen(settings, "chmod +x " + runDir + "/link_grib.csh")
 		logger.write("  -> Helper scripts successfully generated")
 		return True
 		
-	def write_job_files(self, settings, mParms, scheduleParms):
-		logger = Tools.loggedPrint.instance()
-		logger.write("  -> Writing job files")
-		with Tools.cd(settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]):
-			# Write geogrid.job
-			logger.write("  -- writing geogrid.job")
-			with open("geogrid.job", 'w') as target_file:
-				target_file.write(scheduleParms.fetch()["header-type"] + '\n')
-				if scheduleParms.fetch()["header-jobname"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobname"] + " WRF_GEOGRID" + '\n')
-				if scheduleParms.fetch()["header-account"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-account"] + " " + settings.fetch("accountname") + '\n')		
-					
-				if(scheduleParms.getScheduler() == "PBS"):
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " 
-					+ scheduleParms.fetch()["header-nodes"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("num_geogrid_nodes") 
-					+ ":" + scheduleParms.fetch()["header-tasks"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("geogrid_mpi_ranks_per_node") + '\n')
-				else:
-					if scheduleParms.fetch()["header-nodes"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-nodes"] + scheduleParms.fetch()["header-sep"] + settings.fetch("num_geogrid_nodes") + '\n')
-					if scheduleParms.fetch()["header-tasks"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-tasks"] + scheduleParms.fetch()["header-sep"] + settings.fetch("geogrid_mpi_ranks_per_node") + '\n')
+	# write_job_header: Writes the scheduler directives of a job file
+	def write_job_header(self, target_file, settings, scheduleParms, jobName, nodes, ranksPerNode, walltime, queue):
+		target_file.write(scheduleParms.job_header(settings.fetch("accountname"), jobName, nodes, ranksPerNode, walltime, queue))
+			
+	# write_subset_exports: Inside the single allocation job, restricts the COBALT MPI settings to the first nodes of the allocation
+	def write_subset_exports(self, target_file, settings, nodes):
+		if settings.fetch("jobscheduler") == "COBALT":
+			target_file.write("export n_nodes=" + str(nodes) + "\n")
+			target_file.write("export n_mpi_ranks=$(($n_nodes * $n_mpi_ranks_per_node))\n")
+			
+	# write_run_command: Writes the launcher line for an executable, when inAllocation is set the stage is reported to the status log
+	def write_run_command(self, target_file, settings, scheduleParms, exe, pidName, stage = None, inAllocation = False):
+		if inAllocation:
+			target_file.write("stage_begin " + stage + '\n')
+		if(settings.fetch("need_copy_exe") == '1'):
+			target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./" + exe + " &" + '\n')
+		else:
+			target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " " + exe + " &" + '\n')
+		target_file.write("PID_" + pidName + "=$!" + '\n')
+		target_file.write("wait $PID_" + pidName + '\n')
+		if inAllocation:
+			target_file.write("stage_end " + stage + " $?" + '\n')
+			
+	def node_local(self, settings):
+		return settings.fetch("node_local_dir") not in [None, "none"]
+		
+	# write_node_local_list: Writes the list of files a job broadcasts to node-local storage, one "<source> <link>" pair per line. These
+	#  are the WRF tables (Staged the same way as step 3, later sources replace earlier ones) and the executables in exes.
+	def write_node_local_list(self, settings, listName, exes):
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		files = {}
+		for source in sorted(glob.glob(settings.fetch("headdir") + "run_files/*")):
+			files[runDir + "/output/" + os.path.basename(source)] = source
+		for source in sorted(glob.glob(settings.fetch("wrfrunfiles") + "*")):
+			if os.path.basename(source) not in self.skippedRunFiles:
+				files[runDir + "/output/" + os.path.basename(source)] = source
+		if(settings.fetch("need_copy_exe") == '1'):
+			for source, link in exes:
+				files[link] = source
+		with open(listName, 'w') as target_file:
+			for link in sorted(files):
+				if os.path.isfile(files[link]):
+					target_file.write(files[link] + " " + link + '\n')
+		
+	# write_node_local_steps: Copies the files in listFile to node_local_dir on every node of the job (Through bcastcmd when the
+	#  scheduler has one) and points the run directory at the local copies, so the ranks do not all open the executables and tables
+	#  on the parallel file system at start up. The path is the same on every node, so one set of links serves all of them.
+	def write_node_local_steps(self, target_file, settings, scheduleParms, listFile):
+		target_file.write("NODE_LOCAL=" + settings.fetch("node_local_dir") + "/wrf_" + settings.fetch("starttime") + "_$$\n")
+		target_file.write(scheduleParms.fetch()["nodecmd"] + " mkdir -p $NODE_LOCAL\n")
+		if scheduleParms.fetch()["bcastcmd"] is not None:
+			target_file.write("while read src dst; do " + scheduleParms.fetch()["bcastcmd"] + " \"$src\" \"$NODE_LOCAL/$(basename $dst)\"; done < " + listFile + "\n")
+		else:
+			target_file.write(scheduleParms.fetch()["nodecmd"] + " /bin/bash -c \"while read src dst; do cp -L \\$src $NODE_LOCAL/\\$(basename \\$dst); done < " + listFile + "\"\n")
+		target_file.write("while read src dst; do ln -sf \"$NODE_LOCAL/$(basename $dst)\" \"$dst\"; done < " + listFile + "\n\n")
+		
+	# write_node_local_cleanup: Points the run directory back at the shared files and removes the node-local copies
+	def write_node_local_cleanup(self, target_file, settings, scheduleParms, listFile):
+		target_file.write("while read src dst; do ln -sf \"$src\" \"$dst\"; done < " + listFile + "\n")
+		target_file.write(scheduleParms.fetch()["nodecmd"] + " rm -rf $NODE_LOCAL\n")
+		
+	def write_geogrid_steps(self, target_file, settings, scheduleParms, inAllocation = False):
+		target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "\n\n")
+		
+		if scheduleParms.fetch()["extra-exports"] is not None:
+			# COBALT has some extra job related parameters to set.
+			settings.add_replacementKey("[ranks_per_node]", settings.fetch("geogrid_mpi_ranks_per_node"))
+			settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+			settings.add_replacementKey("[threads_per_core]", 2)
+			settings.add_replacementKey("[threads_skipped_per_rank]", 1)
+			target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
+		
+		target_file.write("\n")
+		if inAllocation:
+			self.write_subset_exports(target_file, settings, settings.fetch("num_geogrid_nodes"))
+		settings.add_replacementKey("[total_processors]", int(settings.fetch("geogrid_mpi_ranks_per_node")) * int(settings.fetch("num_geogrid_nodes")))
+		if not inAllocation:
+			if(settings.fetch("need_copy_exe") == '1'):
+				target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./geogrid.exe" + '\n')
+			else:
+				target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " geogrid.exe" + '\n')
+		else:
+			self.write_run_command(target_file, settings, scheduleParms, "geogrid.exe", "Geogrid", "geogrid", inAllocation)
+			
+	# write_prerun_steps: Writes the ungrib, metgrid, and real.exe steps, steps listed in cached (IE: ungrib.3D, metgrid) have had
+	#  their output linked from the cache and are left out
+	def write_prerun_steps(self, target_file, settings, mParms, scheduleParms, inAllocation = False, cached = None):
+		cached = cached if cached is not None else []
+		target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "\n")
+		
+		if scheduleParms.fetch()["extra-exports"] is not None:
+			# COBALT has some extra job related parameters to set.
+			settings.add_replacementKey("[ranks_per_node]", settings.fetch("prerun_mpi_ranks_per_node"))
+			settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+			settings.add_replacementKey("[threads_per_core]", 2)
+			settings.add_replacementKey("[threads_skipped_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+			target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]) + '\n')
+		if self.node_local(settings):
+			self.write_node_local_steps(target_file, settings, scheduleParms, settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/node_local_prerun.txt")
+			
+		if any(("ungrib." + ext) not in cached for ext in mParms["FileExtentions"]):
+			target_file.write("./link_grib.csh " + settings.fetch("datadir") + '/' + settings.fetch("modeldata") + '/' + settings.fetch("starttime") + '/' + '\n')
+		i = 0
+		for ext in mParms["FileExtentions"]:
+			if ("ungrib." + ext) in cached:
+				i += 1
+				continue
+			target_file.write("cp " + mParms["VTable"][i] + " Vtable" + '\n')
+			target_file.write("cp namelist.wps." + ext + " namelist.wps" + '\n')
+			
+			settings.add_replacementKey("[total_processors]", "1")
+			if settings.fetch("jobscheduler") == "COBALT":
+				# For ungrib we reduce the node count to 1 each, this needs to be reset in the env vars here.
+				target_file.write("export n_mpi_ranks=1\nexport n_mpi_ranks_per_node=1\n")
+			self.write_run_command(target_file, settings, scheduleParms, "ungrib.exe", "Ungrib", "ungrib." + ext, inAllocation)
+			i += 1
+		# The next process is metgrid.			
+		settings.add_replacementKey("[total_processors]", int(settings.fetch("prerun_mpi_ranks_per_node")) * int(settings.fetch("num_prerun_nodes")))
+		
+		target_file.write("\n")
+		if settings.fetch("jobscheduler") == "COBALT":
+			# If we set the MPI stuff on COBALT, reset it back to what we expect here.
+			target_file.write("export n_mpi_ranks=$COBALT_JOBSIZE\n")
+			target_file.write("export n_mpi_ranks_per_node=" + settings.fetch("prerun_mpi_ranks_per_node") + "\n")	
+		if inAllocation:
+			self.write_subset_exports(target_file, settings, settings.fetch("num_prerun_nodes"))
 
-				if scheduleParms.fetch()["header-jobtime"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobtime"] + scheduleParms.fetch()["header-sep"] + scheduleParms.convert_to_timestring(settings.fetch("geogrid_walltime")) + '\n')
-				if scheduleParms.fetch()["header-jobqueue"] is not None:
-					# RF: Eventually I may change this for different schedulers, but for now this is fine.
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobqueue"] + " debug-cache-quad")
+		if "metgrid" not in cached:
+			if cached:
+				target_file.write("cp namelist.wps." + mParms["FileExtentions"][0] + " namelist.wps" + '\n')
+			self.write_run_command(target_file, settings, scheduleParms, "metgrid.exe", "Metgrid", "metgrid", inAllocation)
+			target_file.write("\n")
+		# Finally, run the real.exe process
+		target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + '/' + "output\n\n")
+		if inAllocation:
+			# real.exe does not always return a failing exit code, confirm the run from its log before moving on.
+			target_file.write("stage_begin real\n")
+			target_file.write("rm -f rsl.out.* rsl.error.*\n")
+		self.write_run_command(target_file, settings, scheduleParms, "real.exe", "Real")
+		if inAllocation:
+			target_file.write("grep -q \"SUCCESS COMPLETE REAL_EM\" rsl.out.0000\n")
+			target_file.write("stage_end real $?\n")
+		if self.node_local(settings):
+			self.write_node_local_cleanup(target_file, settings, scheduleParms, settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/node_local_prerun.txt")
+		target_file.write("\n")
+		
+	# write_wrf_steps: segment is the number of the segment the job runs in a restart-chunked run (wrf_segments), its rsl files and the
+	#  exit code of wrf.exe are moved to wrf_seg<k> before the job ends, the next segment may start in output right after
+	def write_wrf_steps(self, target_file, settings, scheduleParms, inAllocation = False, segment = None):
+		if int(settings.fetch("lfs_stripe_count")) > 0:
+			target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + '/' + "wrfout\n\n")	
 
-				target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
-				target_file.write("ulimit -s unlimited\n")	
+		target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output\n")
+		if(settings.fetch("chain_jobs") == '1' or inAllocation):
+			# In a job chain (Or single allocation) the driver may not have collected the real.exe logs yet, save them before wrf.exe replaces them.
+			target_file.write("if [ -f rsl.out.0000 ]; then\n")
+			target_file.write("  mv rsl.out.0000 ../real_log.txt\n")
+			target_file.write("  mv rsl.error.0000 ../real_error_log.txt\n")
+			target_file.write("fi\n")
+			target_file.write("rm -f rsl.out.* rsl.error.*\n")
+			target_file.write("touch ../wrf_job_started\n")
+		if segment is not None:
+			target_file.write("rm -rf ../wrf_seg" + str(segment) + "\n")
+			target_file.write("cp namelist.input.wrf.seg" + str(segment) + " namelist.input\n")
+		else:
+			target_file.write("cp namelist.input.wrf namelist.input\n")
+		if self.node_local(settings):
+			self.write_node_local_steps(target_file, settings, scheduleParms, settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/node_local_wrf.txt")
 
-				target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "\n\n")
-				
-				if scheduleParms.fetch()["extra-exports"] is not None:
-					# COBALT has some extra job related parameters to set.
-					settings.add_replacementKey("[ranks_per_node]", settings.fetch("geogrid_mpi_ranks_per_node"))
-					settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
-					settings.add_replacementKey("[threads_per_core]", 2)
-					settings.add_replacementKey("[threads_skipped_per_rank]", 1)
-					target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
-				
+		if scheduleParms.fetch()["extra-exports"] is not None:
+			# COBALT has some extra job related parameters to set.
+			settings.add_replacementKey("[ranks_per_node]", settings.fetch("wrf_mpi_ranks_per_node"))
+			settings.add_replacementKey("[omp_threads_per_rank]", 1)
+			settings.add_replacementKey("[threads_per_core]", 2)
+			settings.add_replacementKey("[threads_skipped_per_rank]", 1)
+			target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
+		
+		if int(settings.fetch("lfs_stripe_count")) > 0:
+			target_file.write("export MPICH_MPIIO_HINTS=\"wrfinput*:striping_factor=" + settings.fetch("lfs_stripe_count") + ",\\\n")
+			target_file.write("wrfbdy*:striping_factor=" + settings.fetch("lfs_stripe_count") + ",wrfout*:striping_factor=" + settings.fetch("lfs_stripe_count") + "\"\n\n")
+		
+		settings.add_replacementKey("[total_processors]", int(settings.fetch("wrf_mpi_ranks_per_node")) * int(settings.fetch("num_wrf_nodes")))
+		if not inAllocation:
+			if(settings.fetch("need_copy_exe") == '1'):
+				target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./wrf.exe" + '\n')
+			else:
+				target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " wrf.exe" + '\n')
+			if segment is not None:
+				target_file.write("grep -q \"SUCCESS COMPLETE WRF\" rsl.out.0000\n")
+				target_file.write("SEGMENT_CODE=$?\n")
+				target_file.write("mkdir -p ../wrf_seg" + str(segment) + "\n")
+				target_file.write("mv rsl.out.* rsl.error.* ../wrf_seg" + str(segment) + "/\n")
+				target_file.write("echo $SEGMENT_CODE > ../wrf_seg" + str(segment) + "/exit_code.tmp\n")
+				target_file.write("mv ../wrf_seg" + str(segment) + "/exit_code.tmp ../wrf_seg" + str(segment) + "/exit_code\n")
+		else:
+			target_file.write("\nstage_begin wrf\n")
+			self.write_run_command(target_file, settings, scheduleParms, "wrf.exe", "WRF")
+			target_file.write("grep -q \"SUCCESS COMPLETE WRF\" rsl.out.0000\n")
+			target_file.write("stage_end wrf $?\n")
+		if self.node_local(settings):
+			self.write_node_local_cleanup(target_file, settings, scheduleParms, settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/node_local_wrf.txt")
+		if segment is not None:
+			# A failed segment fails its job, the scheduler then drops the segments held on it
+			target_file.write("exit $SEGMENT_CODE\n")
+			
+	# write_io_benchmark_steps: One short wrf.exe run per io_form of the benchmark (io_benchmark), each run's rsl.out.0000 is kept as
+	#  iobench_<form>.log and every file it wrote (Named iobench_*) is removed before the next one
+	def write_io_benchmark_steps(self, target_file, settings, scheduleParms):
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		target_file.write("cd " + runDir + "/output\n")
+		if scheduleParms.fetch()["extra-exports"] is not None:
+			settings.add_replacementKey("[ranks_per_node]", settings.fetch("wrf_mpi_ranks_per_node"))
+			settings.add_replacementKey("[omp_threads_per_rank]", 1)
+			settings.add_replacementKey("[threads_per_core]", 2)
+			settings.add_replacementKey("[threads_skipped_per_rank]", 1)
+			target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
+		settings.add_replacementKey("[total_processors]", int(settings.fetch("wrf_mpi_ranks_per_node")) * int(settings.fetch("num_wrf_nodes")))
+		exe = "./wrf.exe" if settings.fetch("need_copy_exe") == '1' else "wrf.exe"
+		for form in sorted(IOForms.IOBenchmark(settings, runDir).benchmark_runs(), key = int):
+			target_file.write("\ncp namelist.input.iobench." + form + " namelist.input\n")
+			target_file.write("rm -f rsl.out.* rsl.error.*\n")
+			target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " " + exe + '\n')
+			target_file.write("mv rsl.out.0000 ../iobench_" + form + ".log\n")
+			target_file.write("rm -f rsl.out.* rsl.error.* iobench_*\n")
+		target_file.write("cp namelist.input.wrf namelist.input\n")
+			
+	# allocation_walltime: The single allocation job needs to cover the walltime of every stage it runs
+	def allocation_walltime(self, settings):
+		walltime = int(settings.fetch("prerun_walltime")) + int(settings.fetch("wrf_walltime"))
+		if(settings.fetch("run_geogrid") == '1'):
+			walltime += int(settings.fetch("geogrid_walltime"))
+		if(settings.fetch("run_postprocessing") == '1'):
+			if(settings.fetch("post_run_unipost") == '1'):
+				walltime += int(settings.fetch("upp_walltime"))
+			elif(settings.fetch("post_run_python") == '1'):
+				walltime += int(settings.fetch("python_walltime"))
+		return walltime
+		
+	# write_allocation_job: Writes allocation.job, which runs every enabled step inside a single batch job on the WRF node set.
+	#  geogrid, ungrib, metgrid and real.exe use the first nodes of the allocation (Their own node counts), wrf.exe and post-processing
+	#  use all of them. Each stage writes a STAGE <name> BEGIN/END <code> line to allocation_status.log for the driver to follow.
+	def write_allocation_job(self, settings, mParms, scheduleParms, post = None, cached = None):
+		logger = Tools.loggedPrint.instance()
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		logger.write("  -- writting allocation.job")
+		with open(runDir + "/allocation.job", 'w') as target_file:
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_ALLOCATION", settings.fetch("num_wrf_nodes"), 
+								  settings.fetch("wrf_mpi_ranks_per_node"), self.allocation_walltime(settings), "default")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")
+			if int(settings.fetch("lfs_stripe_count")) > 0:
+				target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + runDir + '/' + "output\n\n")
+			
+			target_file.write("STATUS_LOG=" + runDir + "/allocation_status.log\n")
+			target_file.write("rm -f $STATUS_LOG\n")
+			target_file.write("stage_begin() {\n")
+			target_file.write("  echo \"STAGE $1 BEGIN $(date +%s)\" >> $STATUS_LOG\n")
+			target_file.write("}\n")
+			target_file.write("stage_end() {\n")
+			target_file.write("  echo \"STAGE $1 END $2 $(date +%s)\" >> $STATUS_LOG\n")
+			target_file.write("  if [ \"$2\" != \"0\" ]; then\n")
+			target_file.write("    echo \"ALLOCATION FAILED $1 $2\" >> $STATUS_LOG\n")
+			target_file.write("    exit $2\n")
+			target_file.write("  fi\n")
+			target_file.write("}\n\n")
+			
+			if(settings.fetch("run_geogrid") == '1'):
+				self.write_geogrid_steps(target_file, settings, scheduleParms, inAllocation = True)
 				target_file.write("\n")
-				settings.add_replacementKey("[total_processors]", int(settings.fetch("geogrid_mpi_ranks_per_node")) * int(settings.fetch("num_geogrid_nodes")))
-				if(settings.fetch("need_copy_exe") == '1'):
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./geogrid.exe" + '\n')
-				else:
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " geogrid.exe" + '\n')
-			logger.write("  -- Done")
-			# Write prerun.job
-			logger.write("  -- writting prerun.job")
-			with open("prerun.job", 'w') as target_file:
-				target_file.write(scheduleParms.fetch()["header-type"] + '\n')
-				if scheduleParms.fetch()["header-jobname"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobname"] + " WRF_PREPROCESSING" + '\n')
-				if scheduleParms.fetch()["header-account"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-account"] + " " + settings.fetch("accountname") + '\n')
-
-				if(scheduleParms.getScheduler() == "PBS"):
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " 
-					+ scheduleParms.fetch()["header-nodes"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("num_prerun_nodes") 
-					+ ":" + scheduleParms.fetch()["header-tasks"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("prerun_mpi_ranks_per_node") + '\n')
-				else:					
-					if scheduleParms.fetch()["header-nodes"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-nodes"] + scheduleParms.fetch()["header-sep"] + settings.fetch("num_prerun_nodes") + '\n')
-					if scheduleParms.fetch()["header-tasks"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-tasks"] + scheduleParms.fetch()["header-sep"] + settings.fetch("prerun_mpi_ranks_per_node") + '\n')
-
-				if scheduleParms.fetch()["header-jobtime"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobtime"] + scheduleParms.fetch()["header-sep"] + scheduleParms.convert_to_timestring(settings.fetch("prerun_walltime")) + '\n')
-				if scheduleParms.fetch()["header-jobqueue"] is not None:
-					# RF: Eventually I may change this for different schedulers, but for now this is fine.
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobqueue"] + " debug-cache-quad")
-				
+			if(settings.fetch("run_preprocessing_jobs") == '1'):
+				self.write_prerun_steps(target_file, settings, mParms, scheduleParms, inAllocation = True, cached = cached)
+			if(settings.fetch("run_wrf") == '1'):
+				self.write_wrf_steps(target_file, settings, scheduleParms, inAllocation = True)
+				target_file.write("\n")
+			if(post is not None and settings.fetch("run_postprocessing") == '1'):
+				postCommands = post.allocation_commands()
+				if postCommands is not None:
+					target_file.write("stage_begin post\n")
+					target_file.write(postCommands)
+					target_file.write("stage_end post $?\n\n")
+			target_file.write("echo \"ALLOCATION COMPLETE\" >> $STATUS_LOG\n")
+		logger.write("  -- Done")
+		
+	# write_stage_jobs: Writes the job files used when the steps run as a pipeline (concurrent_stages). Each file extension of the
+	#  model data gets its own ungrib job running in ungrib_<ext>, so they do not overwrite each other's Vtable and namelist.wps.
+	#  metgrid and real.exe get separate jobs so that metgrid can start as soon as geogrid and every ungrib job are done.
+	def write_stage_jobs(self, settings, mParms, scheduleParms):
+		logger = Tools.loggedPrint.instance()
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		i = 0
+		for ext in mParms["FileExtentions"]:
+			logger.write("  -- writting ungrib_" + ext + ".job")
+			with open(runDir + "/ungrib_" + ext + ".job", 'w') as target_file:
+				self.write_job_header(target_file, settings, scheduleParms, "WRF_UNGRIB_" + ext, 1, 1, settings.fetch("prerun_walltime"), "debug-cache-quad")
 				target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
 				target_file.write("ulimit -s unlimited\n")
-				if int(settings.fetch("lfs_stripe_count")) > 0:
-					target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + '/' + "output\n\n")	
-					
-				target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "\n")
-				
+				target_file.write("mkdir -p " + runDir + "/ungrib_" + ext + "\n")
+				target_file.write("cd " + runDir + "/ungrib_" + ext + "\n")
 				if scheduleParms.fetch()["extra-exports"] is not None:
 					# COBALT has some extra job related parameters to set.
-					settings.add_replacementKey("[ranks_per_node]", settings.fetch("prerun_mpi_ranks_per_node"))
+					settings.add_replacementKey("[ranks_per_node]", 1)
 					settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
 					settings.add_replacementKey("[threads_per_core]", 2)
-					settings.add_replacementKey("[threads_skipped_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
-					target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
-					
-				target_file.write("./link_grib.csh " + settings.fetch("datadir") + '/' + settings.fetch("modeldata") + '/' + settings.fetch("starttime") + '/' + '\n')
-				i = 0
-				for ext in mParms["FileExtentions"]:
-					target_file.write("cp " + mParms["VTable"][i] + " Vtable" + '\n')
-					target_file.write("cp namelist.wps." + ext + " namelist.wps" + '\n')
-					
-					settings.add_replacementKey("[total_processors]", "1")
-					if settings.fetch("jobscheduler") == "COBALT":
-						# For ungrib we reduce the node count to 1 each, this needs to be reset in the env vars here.
-						target_file.write("export n_mpi_ranks=1\nexport n_mpi_ranks_per_node=1\n")
-					if(settings.fetch("need_copy_exe") == '1'):
-						target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./ungrib.exe &" + '\n')
-					else:
-						target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ungrib.exe &" + '\n')						
-					target_file.write("PID_Ungrib=$!" + '\n')
-					target_file.write("wait $PID_Ungrib" + '\n')
-					i += 1
-				# The next process is metgrid.			
-				settings.add_replacementKey("[total_processors]", int(settings.fetch("prerun_mpi_ranks_per_node")) * int(settings.fetch("num_prerun_nodes")))
-				
-				target_file.write("\n")
-				if settings.fetch("jobscheduler") == "COBALT":
-					# If we set the MPI stuff on COBALT, reset it back to what we expect here.
-					target_file.write("export n_mpi_ranks=$COBALT_JOBSIZE\n")
-					target_file.write("export n_mpi_ranks_per_node=" + settings.fetch("prerun_mpi_ranks_per_node") + "\n")	
-
-				if(settings.fetch("need_copy_exe") == '1'):
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./metgrid.exe &" + '\n')
-				else:
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " metgrid.exe &" + '\n')
-				target_file.write("PID_Metgrid=$!" + '\n')
-				target_file.write("wait $PID_Metgrid" + "\n\n")	
-				# Finally, run the real.exe process
-				target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + '/' + "output\n\n")
+					settings.add_replacementKey("[threads_skipped_per_rank]", 1)
+					target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]) + '\n')
+				target_file.write("../link_grib.csh " + settings.fetch("datadir") + '/' + settings.fetch("modeldata") + '/' + settings.fetch("starttime") + '/' + '\n')
+				target_file.write("cp ../" + mParms["VTable"][i] + " Vtable" + '\n')
+				target_file.write("cp ../namelist.wps." + ext + " namelist.wps" + '\n')
 				if(settings.fetch("need_copy_exe") == '1'):
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./real.exe &" + '\n')
-				else:
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " real.exe &" + '\n')
-				target_file.write("PID_Real=$!" + '\n')
-				target_file.write("wait $PID_Real" + "\n\n")
-			logger.write("  -- Done")	
-			# Write wrf.job
-			logger.write("  -- writting wrf.job")
-			with open("wrf.job", 'w') as target_file:		
-				target_file.write(scheduleParms.fetch()["header-type"] + '\n')
-				if scheduleParms.fetch()["header-jobname"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobname"] + " WRF_MODEL" + '\n')
-				if scheduleParms.fetch()["header-account"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-account"] + " " + settings.fetch("accountname") + '\n')
-					
-				if(scheduleParms.getScheduler() == "PBS"):
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " 
-					+ scheduleParms.fetch()["header-nodes"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("num_wrf_nodes") + ":" 
-					+ scheduleParms.fetch()["header-tasks"] 
-					+ scheduleParms.fetch()["header-sep"] 
-					+ settings.fetch("wrf_mpi_ranks_per_node") + '\n')
-				else:					
-					if scheduleParms.fetch()["header-nodes"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-nodes"] + scheduleParms.fetch()["header-sep"] + settings.fetch("num_wrf_nodes") + '\n')
-					if scheduleParms.fetch()["header-tasks"] is not None:
-						target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-tasks"] + scheduleParms.fetch()["header-sep"] + settings.fetch("wrf_mpi_ranks_per_node") + '\n')
-
-				if scheduleParms.fetch()["header-jobtime"] is not None:
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobtime"] + scheduleParms.fetch()["header-sep"] + scheduleParms.convert_to_timestring(settings.fetch("wrf_walltime")) + '\n')
-				if scheduleParms.fetch()["header-jobqueue"] is not None:
-					# RF: Eventually I may change this for different schedulers, but for now this is fine.
-					target_file.write(scheduleParms.fetch()["header-tag"] + " " + scheduleParms.fetch()["header-jobqueue"] + " default")
-
+					target_file.write("ln -sf ../ungrib.exe ungrib.exe\n")
+				settings.add_replacementKey("[total_processors]", "1")
+				self.write_run_command(target_file, settings, scheduleParms, "ungrib.exe", "Ungrib")
+				# The intermediate files use the extension as the prefix, metgrid reads them from the run directory.
+				target_file.write("mv " + ext + ":* ..\n")
+				target_file.write("touch output_ready\n")
+			logger.write("  -- Done")
+			i += 1
+		logger.write("  -- writting metgrid.job")
+		with open(runDir + "/metgrid.job", 'w') as target_file:
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_METGRID", settings.fetch("num_prerun_nodes"), 
+								  settings.fetch("prerun_mpi_ranks_per_node"), settings.fetch("prerun_walltime"), "debug-cache-quad")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")
+			target_file.write("cd " + runDir + "\n")
+			if scheduleParms.fetch()["extra-exports"] is not None:
+				# COBALT has some extra job related parameters to set.
+				settings.add_replacementKey("[ranks_per_node]", settings.fetch("prerun_mpi_ranks_per_node"))
+				settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+				settings.add_replacementKey("[threads_per_core]", 2)
+				settings.add_replacementKey("[threads_skipped_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+				target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]) + '\n')
+			target_file.write("cp namelist.wps." + mParms["FileExtentions"][0] + " namelist.wps" + '\n')
+			settings.add_replacementKey("[total_processors]", int(settings.fetch("prerun_mpi_ranks_per_node")) * int(settings.fetch("num_prerun_nodes")))
+			self.write_run_command(target_file, settings, scheduleParms, "metgrid.exe", "Metgrid")
+		logger.write("  -- Done")
+		logger.write("  -- writting real.job")
+		with open(runDir + "/real.job", 'w') as target_file:
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_REAL", settings.fetch("num_prerun_nodes"), 
+								  settings.fetch("prerun_mpi_ranks_per_node"), settings.fetch("prerun_walltime"), "debug-cache-quad")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")
+			if int(settings.fetch("lfs_stripe_count")) > 0:
+				target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + runDir + '/' + "output\n\n")	
+			target_file.write("cd " + runDir + "/output\n")
+			if scheduleParms.fetch()["extra-exports"] is not None:
+				# COBALT has some extra job related parameters to set.
+				settings.add_replacementKey("[ranks_per_node]", settings.fetch("prerun_mpi_ranks_per_node"))
+				settings.add_replacementKey("[omp_threads_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+				settings.add_replacementKey("[threads_per_core]", 2)
+				settings.add_replacementKey("[threads_skipped_per_rank]", settings.fetch("prerun_mpi_threads_per_rank"))
+				target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]) + '\n')
+			if self.node_local(settings):
+				self.write_node_local_steps(target_file, settings, scheduleParms, runDir + "/node_local_prerun.txt")
+			settings.add_replacementKey("[total_processors]", int(settings.fetch("prerun_mpi_ranks_per_node")) * int(settings.fetch("num_prerun_nodes")))
+			self.write_run_command(target_file, settings, scheduleParms, "real.exe", "Real")
+			if self.node_local(settings):
+				self.write_node_local_cleanup(target_file, settings, scheduleParms, runDir + "/node_local_prerun.txt")
+		logger.write("  -- Done")
+		
+	def write_job_files(self, settings, mParms, scheduleParms, post = None, cached = None):
+		logger = Tools.loggedPrint.instance()
+		logger.write("  -> Writing job files")
+		# Every path is absolute, the pipeline stages (And Recovery, which writes the job files again from the wrf stage) share the working directory
+		runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		if self.node_local(settings):
+			logger.write("  -- writing node_local_prerun.txt, node_local_wrf.txt")
+			self.write_node_local_list(settings, runDir + "/node_local_prerun.txt", [(settings.fetch("wrfexecutables") + "real.exe", runDir + "/output/real.exe"),
+																			(settings.fetch("wpsdirectory") + "metgrid.exe", runDir + "/metgrid.exe")])
+			self.write_node_local_list(settings, runDir + "/node_local_wrf.txt", [(settings.fetch("wrfexecutables") + "wrf.exe", runDir + "/output/wrf.exe")])
+		# Write geogrid.job
+		logger.write("  -- writing geogrid.job")
+		with open(runDir + "/geogrid.job", 'w') as target_file:
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_GEOGRID", settings.fetch("num_geogrid_nodes"), 
+								  settings.fetch("geogrid_mpi_ranks_per_node"), settings.fetch("geogrid_walltime"), "debug-cache-quad")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")	
+			self.write_geogrid_steps(target_file, settings, scheduleParms)
+		logger.write("  -- Done")
+		# Write prerun.job
+		logger.write("  -- writting prerun.job")
+		with open(runDir + "/prerun.job", 'w') as target_file:
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_PREPROCESSING", settings.fetch("num_prerun_nodes"), 
+								  settings.fetch("prerun_mpi_ranks_per_node"), settings.fetch("prerun_walltime"), "debug-cache-quad")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")
+			if int(settings.fetch("lfs_stripe_count")) > 0:
+				target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + runDir + '/' + "output\n\n")	
+			self.write_prerun_steps(target_file, settings, mParms, scheduleParms, cached = cached)
+		logger.write("  -- Done")	
+		# Write wrf.job
+		logger.write("  -- writting wrf.job")
+		with open(runDir + "/wrf.job", 'w') as target_file:		
+			self.write_job_header(target_file, settings, scheduleParms, "WRF_MODEL", settings.fetch("num_wrf_nodes"), 
+								  settings.fetch("wrf_mpi_ranks_per_node"), settings.fetch("wrf_walltime"), "default")
+			target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+			target_file.write("ulimit -s unlimited\n")
+			self.write_wrf_steps(target_file, settings, scheduleParms)
+		logger.write("  -- Done")
+		if(settings.fetch("io_benchmark") in ['1', '2']):
+			logger.write("  -- writting iobench.job")
+			with open(runDir + "/iobench.job", 'w') as target_file:
+				self.write_job_header(target_file, settings, scheduleParms, "WRF_IOBENCH", settings.fetch("num_wrf_nodes"), 
+									  settings.fetch("wrf_mpi_ranks_per_node"), settings.fetch("io_benchmark_walltime"), "default")
 				target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
 				target_file.write("ulimit -s unlimited\n")
-				if int(settings.fetch("lfs_stripe_count")) > 0:
-					target_file.write("lfs setstripe -c " + settings.fetch("lfs_stripe_count") + " " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + '/' + "wrfout\n\n")	
-
-				target_file.write("cd " + settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8] + "/output\n")
-
-				if scheduleParms.fetch()["extra-exports"] is not None:
-					# COBALT has some extra job related parameters to set.
-					settings.add_replacementKey("[ranks_per_node]", settings.fetch("wrf_mpi_ranks_per_node"))
-					settings.add_replacementKey("[omp_threads_per_rank]", 1)
-					settings.add_replacementKey("[threads_per_core]", 2)
-					settings.add_replacementKey("[threads_skipped_per_rank]", 1)
-					target_file.write(settings.replace(scheduleParms.fetch()["extra-exports"]))
-				
-				if int(settings.fetch("lfs_stripe_count")) > 0:
-					target_file.write("export MPICH_MPIIO_HINTS=\"wrfinput*:striping_factor=" + settings.fetch("lfs_stripe_count") + ",\\\n")
-					target_file.write("wrfbdy*:striping_factor=" + settings.fetch("lfs_stripe_count") + ",wrfout*:striping_factor=" + settings.fetch("lfs_stripe_count") + "\"\n\n")
-				
-				settings.add_replacementKey("[total_processors]", int(settings.fetch("wrf_mpi_ranks_per_node")) * int(settings.fetch("num_wrf_nodes")))
-				if(settings.fetch("need_copy_exe") == '1'):
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " ./wrf.exe" + '\n')
-				else:
-					target_file.write(scheduleParms.fetch()["runcmd"] + " " + settings.replace(scheduleParms.fetch()["subargs"]) + " wrf.exe" + '\n')
+				self.write_io_benchmark_steps(target_file, settings, scheduleParms)
+			logger.write("  -- Done")
+		segments = Jobs.wrf_segments(settings)
+		if len(segments) > 1:
+			for k, (segStart, segHours) in enumerate(segments):
+				logger.write("  -- writting wrf_seg" + str(k) + ".job")
+				with open(runDir + "/wrf_seg" + str(k) + ".job", 'w') as target_file:
+					self.write_job_header(target_file, settings, scheduleParms, "WRF_MODEL_" + str(k), settings.fetch("num_wrf_nodes"), 
+										  settings.fetch("wrf_mpi_ranks_per_node"), str(Jobs.segment_walltime(settings, segHours)), "default")
+					target_file.write("\n\nsource " + settings.fetch("sourcefile") + '\n')
+					target_file.write("ulimit -s unlimited\n")
+					self.write_wrf_steps(target_file, settings, scheduleParms, segment = k)
 			logger.write("  -- Done")
+		if(settings.fetch("single_allocation_job") == '1'):
+			self.write_allocation_job(settings, mParms, scheduleParms, post, cached)
+		if(settings.fetch("concurrent_stages") == '1'):
+			self.write_stage_jobs(settings, mParms, scheduleParms)
 		logger.write("  -> All file write operations complete")	
 		return True
 		
@@ -9,6 +9,22 @@ import time
 import os
 import Tools
 
+# defaults: The values used for settings missing from control.txt, so a control.txt written before a setting was added still runs.
+#  These match the values in control.txt, except that wrf_recovery_attempts is 0 (An old configuration does not rerun failed jobs).
+defaults = {"scheduler_bin_dir": "none", "cache_dir": "none", "geo_em_cache_gb": "20", "ungrib_cache_gb": "50", "met_em_cache_gb": "50",
+			"fileops_threads": "8", "run_file_staging": "copy", "node_local_dir": "none", "telemetry_file": "none", "walltime_advisor": "0",
+			"walltime_advisor_margin": "1.25", "walltime_advisor_target": "0", "walltime_advisor_max_nodes": "256", "wrf_timing": "1",
+			"wrf_timing_interval": "60", "wrf_progress_interval": "600", "wrf_stability_check": "1", "wrf_stability_action": "warn",
+			"wrf_stability_cfl_steps": "10", "wrf_stability_max_w": "100", "wrf_stability_dt_factor": "0.75", "wrf_stability_retries": "2",
+			"rsl_archive": "1", "wrf_segments": "1", "wrf_segment_walltime": "0", "wrf_recovery_attempts": "0",
+			"wrf_recovery_node_factor": "1.5", "wrf_recovery_max_nodes": "0", "wrf_recovery_restart_interval": "180",
+			"real_io_form_input": "2", "real_io_form_boundary": "2", "wrf_io_form_input": "2", "wrf_io_form_boundary": "2",
+			"wrf_io_form_restart": "2", "io_form_auto_ranks": "512", "io_benchmark": "0", "io_benchmark_minutes": "10",
+			"io_benchmark_walltime": "30", "io_advisor": "0", "io_advisor_bandwidth": "500", "io_advisor_task_mb": "256",
+			"io_advisor_stripe_mb": "1024", "io_advisor_max_stripes": "64", "chain_jobs": "0", "single_allocation_job": "0",
+			"concurrent_stages": "0", "post_follow_wrf": "0", "io_vars_generate": "0", "upp_mpi_ranks_per_node": "32", "upp_follow_wrf": "0",
+			"upp_max_concurrent": "4", "upp_follow_stable_seconds": "60"}
+
 # AppSettings: Class responsible for obtaining information from the control file and parsing it to classes that need the information
 class AppSettings():
 	startTime = ""
@@ -42,6 +58,10 @@ class AppSettings():
 			self.logger.write("Program critical variables missing, check for existence of control.txt, abort.")
 			return False
 		else:
+			for key in defaults:
+				if key not in self.settings:
+					self.settings[key] = defaults[key]
+					self.logger.write("Setting (" + key + ") is not in control.txt, using the default: " + defaults[key])
 			self.settings["headdir"] = curDir[:curDir.rfind('/')] + '/'
 			return True
         
@@ -52,6 +72,17 @@ class AppSettings():
 			print("Key (" + str(key) + ") does not exist")
 			return None    
 			
+	# override: Changes a setting after control.txt has been read (IE: A step the program has decided to skip)
+	def override(self, key, value):
+		self.settings[key] = value
+		self.logger.write("Setting (" + key + ") changed to " + str(value))
+			
+	# apply_setting: Changes a setting along with its template key when the job templates use one (IE: A value chosen by an advisor)
+	def apply_setting(self, key, value):
+		self.override(key, value)
+		if ("[" + key + "]") in self.replacementKeys:
+			self.add_replacementKey("[" + key + "]", value)
+			
 	def add_replacementKey(self, key, value):
 		self.replacementKeys[key] = value
 		self.logger.write("Additional replacement key added: " + str(key) + " = " + str(value))
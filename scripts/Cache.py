@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# Cache.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to keep the output of the WPS programs between runs, so a step can be skipped when its inputs have not changed
+
+import os
+import glob
+import shutil
+import hashlib
+import time
+import Tools
+
+# namelist_block: Returns the lines of the &name block of a namelist file, or an empty list if the block is not present
+def namelist_block(path, name):
+	lines = []
+	inBlock = False
+	with open(path, 'r') as source_file:
+		for line in source_file:
+			line = line.strip()
+			if line.lower() == "&" + name.lower():
+				inBlock = True
+			elif inBlock and line.startswith("/"):
+				break
+			elif inBlock and line:
+				lines.append(line)
+	return lines
+
+# namelist_value: Returns the value of a single namelist entry (IE: io_form_geogrid = 2, returns 2)
+def namelist_value(path, name):
+	with open(path, 'r') as source_file:
+		for line in source_file:
+			tokens = line.split("=", 1)
+			if len(tokens) == 2 and tokens[0].strip().lower() == name.lower():
+				return tokens[1].strip().rstrip(',').strip("'")
+	return None
+
+# set_namelist_value: Replaces the value of a single namelist entry, keeping the padding of the line, returns False if it is not present
+def set_namelist_value(path, name, value):
+	with open(path, 'r') as source_file:
+		lines = source_file.readlines()
+	found = False
+	for i, line in enumerate(lines):
+		tokens = line.split("=", 1)
+		if len(tokens) == 2 and tokens[0].strip().lower() == name.lower():
+			lines[i] = tokens[0] + "= " + str(value) + ",\n"
+			found = True
+	if found:
+		with open(path, 'w') as target_file:
+			target_file.writelines(lines)
+	return found
+
+# file_digest: Hashes the contents of a file (Used to key on tables such as the Vtable)
+def file_digest(path):
+	digest = hashlib.sha1()
+	with open(path, 'rb') as source_file:
+		for chunk in iter(lambda: source_file.read(1048576), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+# make_key: Hashes the strings that describe the inputs of a step into a cache key
+def make_key(parts):
+	return hashlib.sha1("\n".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+# FileCache: A directory of entries, each one named by the key of the inputs its files were made from. An entry can only be used once
+#  all of its files have been copied in (.complete marker). The marker is touched every time the entry is used, and once the cache is
+#  over its size limit the least recently used entries are removed first. The cache is off if cache_dir is none or the size limit is 0.
+#  Runs get hard links to the files of an entry (See link()), so an entry can be removed while a run still uses its files.
+class FileCache:
+	aSet = None
+	name = ""
+	root = None
+	maxBytes = 0
+	logger = None
+
+	def __init__(self, settings, name, sizeKey):
+		self.aSet = settings
+		self.name = name
+		self.logger = Tools.loggedPrint.instance()
+		cacheDir = settings.fetch("cache_dir")
+		self.root = None if cacheDir is None or cacheDir.lower() == "none" else cacheDir + '/' + name
+		self.maxBytes = float(settings.fetch(sizeKey)) * 1024 * 1024 * 1024
+
+	def enabled(self):
+		return self.root is not None and self.maxBytes > 0
+
+	def entry(self, key):
+		return self.root + '/' + key
+
+	def has(self, key):
+		return self.enabled() and os.path.exists(self.entry(key) + "/.complete")
+
+	def files(self, key):
+		return sorted(f for f in os.listdir(self.entry(key)) if f != ".complete")
+
+	# link: Hard links every file of an entry into targetDir (Copies it when targetDir is on another filesystem), returns the names
+	#  of the files. The run keeps its own link to each file, so evict() removing the entry while the run reads it leaves the run's
+	#  files in place (A symbolic link would be left dangling).
+	def link(self, key, targetDir):
+		names = self.files(key)
+		copied = 0
+		for fName in names:
+			target = targetDir + '/' + fName
+			if os.path.lexists(target):
+				os.remove(target)
+			try:
+				os.link(self.entry(key) + '/' + fName, target)
+			except OSError:
+				shutil.copy2(self.entry(key) + '/' + fName, target)
+				copied += 1
+		os.utime(self.entry(key) + "/.complete")
+		self.logger.write("FileCache(" + self.name + "): Linked " + str(len(names) - copied) + " files from entry " + key[:12] +
+						  ("" if copied == 0 else ", copied " + str(copied) + " (Another filesystem)"))
+		return names
+
+	# store: Copies the files in fList into a new entry, the files are copied to a temporary directory first so a partial copy
+	#  is never used by another run
+	def store(self, key, fList, description = ""):
+		if not self.enabled() or not fList or self.has(key):
+			return False
+		tmpDir = self.entry(key) + ".tmp" + str(os.getpid())
+		try:
+			os.makedirs(tmpDir, exist_ok = True)
+			for fPath in fList:
+				shutil.copy2(fPath, tmpDir + '/' + os.path.basename(fPath))
+			with open(tmpDir + "/.complete", 'w') as target_file:
+				target_file.write(description + '\n')
+			os.rename(tmpDir, self.entry(key))
+		except OSError as e:
+			self.logger.write("FileCache(" + self.name + "): Could not store entry " + key[:12] + ": " + str(e))
+			shutil.rmtree(tmpDir, ignore_errors = True)
+			return False
+		self.logger.write("FileCache(" + self.name + "): Stored " + str(len(fList)) + " files as entry " + key[:12])
+		self.evict()
+		return True
+
+	def size(self, path):
+		total = 0
+		for fPath in glob.glob(path + "/*") + [path + "/.complete"]:
+			try:
+				total += os.path.getsize(fPath)
+			except OSError:
+				pass
+		return total
+
+	# evict: Removes the least recently used entries until the cache fits in its size limit, the newest entry is always kept
+	def evict(self):
+		entries = []
+		for path in glob.glob(self.root + "/*/.complete"):
+			entryDir = os.path.dirname(path)
+			entries.append((os.path.getmtime(path), entryDir, self.size(entryDir)))
+		entries.sort()
+		total = sum(e[2] for e in entries)
+		while total > self.maxBytes and len(entries) > 1:
+			lastUsed, entryDir, entrySize = entries.pop(0)
+			self.logger.write("FileCache(" + self.name + "): Removing entry " + os.path.basename(entryDir)[:12] + " (Last used " +
+							  time.strftime('%Y-%m-%d %H:%M', time.localtime(lastUsed)) + ") to stay under the size limit")
+			shutil.rmtree(entryDir, ignore_errors = True)
+			total -= entrySize
@@ -7,7 +7,7 @@
 import sys
 import os
 import ApplicationSettings
-import Tools
+import FileOps
 
 class PostRunCleanup():
 	sObj = None
@@ -20,6 +20,7 @@ class PostRunCleanup():
 		dataDir = self.sObj.fetch("datadir") + '/' + self.sObj.fetch("modeldata") + sTime
 		wrfDir = self.sObj.fetch("wrfdir") + '/' + sTime[0:8]
 		outDir = wrfDir + "/output"
+		ops = FileOps.FileOps(self.sObj, "performClean")
 		if(cleanAll == True):
 			cleanOutFiles = True
 			cleanErrorFiles = True
@@ -27,65 +28,70 @@ class PostRunCleanup():
 			cleanWRFOut = True
 			cleanModelData = True
 		if(cleanOutFiles == True):
-			Tools.popen(self.sObj, "rm " + wrfDir + "/geogrid.log.*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/metgrid.log.*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/ungrib.log*")
-			Tools.popen(self.sObj, "rm " + outDir + "/rsl.out.*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/GEOGRID.o*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/METGRID.o*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/UNGRIB.o*") #This shouldn't be needed, but in the event we use a job for ungrib.
-			Tools.popen(self.sObj, "rm " + outDir + "/REAL.o*")
-			Tools.popen(self.sObj, "rm " + outDir + "/WRF.o*")
+			ops.delete(wrfDir + "/geogrid.log.*")
+			ops.delete(wrfDir + "/metgrid.log.*")
+			ops.delete(wrfDir + "/ungrib.log*")
+			ops.delete(outDir + "/rsl.out.*")
+			ops.delete(wrfDir + "/GEOGRID.o*")
+			ops.delete(wrfDir + "/METGRID.o*")
+			ops.delete(wrfDir + "/UNGRIB.o*") #This shouldn't be needed, but in the event we use a job for ungrib.
+			ops.delete(outDir + "/REAL.o*")
+			ops.delete(outDir + "/WRF.o*")
 		if(cleanErrorFiles == True):
-			Tools.popen(self.sObj, "rm " + outDir + "/rsl.error.*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/GEOGRID.e*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/METGRID.e*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/UNGRIB.e*") #This shouldn't be needed, but in the event we use a job for ungrib.
-			Tools.popen(self.sObj, "rm " + outDir + "/REAL.e*")
-			Tools.popen(self.sObj, "rm " + outDir + "/WRF.e*")	
+			ops.delete(outDir + "/rsl.error.*")
+			ops.delete(wrfDir + "/GEOGRID.e*")
+			ops.delete(wrfDir + "/METGRID.e*")
+			ops.delete(wrfDir + "/UNGRIB.e*") #This shouldn't be needed, but in the event we use a job for ungrib.
+			ops.delete(outDir + "/REAL.e*")
+			ops.delete(outDir + "/WRF.e*")	
 		if(cleanBdyFiles == True):
-			Tools.popen(self.sObj, "rm " + outDir + "/met_em*")
-			Tools.popen(self.sObj, "rm " + outDir + "/wrfinput*")
-			Tools.popen(self.sObj, "rm " + outDir + "/wrfbdy*")		
-			Tools.popen(self.sObj, "rm " + outDir + "/geo_em.d01.nc*")
+			ops.delete(outDir + "/met_em*")
+			ops.delete(outDir + "/wrfinput*")
+			ops.delete(outDir + "/wrfbdy*")		
+			ops.delete(outDir + "/geo_em.d01.nc*")
 		if(cleanInFiles == True):
-			Tools.popen(self.sObj, "rm " + wrfDir + "/GRIBFILE.*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/3D:*")
-			Tools.popen(self.sObj, "rm " + wrfDir + "/FLX:*")
-			Tools.popen(self.sObj, "rm " + outDir + "/FILE:*")
-			Tools.popen(self.sObj, "rm " + outDir + "/aero*")
-			Tools.popen(self.sObj, "rm " + outDir + "/bulk*")
-			Tools.popen(self.sObj, "rm " + outDir + "/CAM*")
-			Tools.popen(self.sObj, "rm " + outDir + "/capacity.asc")
-			Tools.popen(self.sObj, "rm " + outDir + "/CCN*")
-			Tools.popen(self.sObj, "rm " + outDir + "/CLM*")
-			Tools.popen(self.sObj, "rm " + outDir + "/co2_trans")
-			Tools.popen(self.sObj, "rm " + outDir + "/coeff*")
-			Tools.popen(self.sObj, "rm " + outDir + "/constants.asc")
-			Tools.popen(self.sObj, "rm " + outDir + "/create_p3_lookupTable_1.f90")
-			Tools.popen(self.sObj, "rm " + outDir + "/ETA*")
-			Tools.popen(self.sObj, "rm " + outDir + "/GEN*")
-			Tools.popen(self.sObj, "rm " + outDir + "/grib*")
-			Tools.popen(self.sObj, "rm " + outDir + "/kernels*")
-			Tools.popen(self.sObj, "rm " + outDir + "/LANDUSE.TBL")
-			Tools.popen(self.sObj, "rm " + outDir + "/masses.asc")
-			Tools.popen(self.sObj, "rm " + outDir + "/MPTABLE.TBL")
-			Tools.popen(self.sObj, "rm " + outDir + "/ozone*")
-			Tools.popen(self.sObj, "rm " + outDir + "/p3_lookup_table_1.dat")
-			Tools.popen(self.sObj, "rm " + outDir + "/RRTM*")
-			Tools.popen(self.sObj, "rm " + outDir + "/RRTMG*")
-			Tools.popen(self.sObj, "rm " + outDir + "/SOILPARM.TBL")
-			Tools.popen(self.sObj, "rm " + outDir + "/termvels.asc")
-			Tools.popen(self.sObj, "rm " + outDir + "/tr*")
-			Tools.popen(self.sObj, "rm " + outDir + "/URB*")
-			Tools.popen(self.sObj, "rm " + outDir + "/VEG*")
-			Tools.popen(self.sObj, "rm " + outDir + "/wind-turbine-1.tbl")
-			Tools.popen(self.sObj, "rm " + outDir + "/real.exe")
-			Tools.popen(self.sObj, "rm " + outDir + "/tc.exe")
-			Tools.popen(self.sObj, "rm " + outDir + "/wrf.exe")
+			ops.delete(wrfDir + "/GRIBFILE.*")
+			ops.delete(wrfDir + "/3D:*")
+			ops.delete(wrfDir + "/FLX:*")
+			ops.delete(wrfDir + "/ungrib_*", recursive = True)
+			ops.delete(outDir + "/FILE:*")
+		if(cleanInFiles == True and self.sObj.fetch("run_file_staging") not in ["symlink", "hardlink"]):
+			# The WRF run files and executables staged in step 3, links to the install (run_file_staging) take no space and are replaced
+			#  when the same run directory is staged again, so they are left in place
+			ops.delete(outDir + "/aero*")
+			ops.delete(outDir + "/bulk*")
+			ops.delete(outDir + "/CAM*")
+			ops.delete(outDir + "/capacity.asc")
+			ops.delete(outDir + "/CCN*")
+			ops.delete(outDir + "/CLM*")
+			ops.delete(outDir + "/co2_trans")
+			ops.delete(outDir + "/coeff*")
+			ops.delete(outDir + "/constants.asc")
+			ops.delete(outDir + "/create_p3_lookupTable_1.f90")
+			ops.delete(outDir + "/ETA*")
+			ops.delete(outDir + "/GEN*")
+			ops.delete(outDir + "/grib*")
+			ops.delete(outDir + "/kernels*")
+			ops.delete(outDir + "/LANDUSE.TBL")
+			ops.delete(outDir + "/masses.asc")
+			ops.delete(outDir + "/MPTABLE.TBL")
+			ops.delete(outDir + "/ozone*")
+			ops.delete(outDir + "/p3_lookup_table_1.dat")
+			ops.delete(outDir + "/RRTM*")
+			ops.delete(outDir + "/RRTMG*")
+			ops.delete(outDir + "/SOILPARM.TBL")
+			ops.delete(outDir + "/termvels.asc")
+			ops.delete(outDir + "/tr*")
+			ops.delete(outDir + "/URB*")
+			ops.delete(outDir + "/VEG*")
+			ops.delete(outDir + "/wind-turbine-1.tbl")
+			ops.delete(outDir + "/real.exe")
+			ops.delete(outDir + "/tc.exe")
+			ops.delete(outDir + "/wrf.exe")
 		if(cleanWRFOut == True):
-			Tools.popen(self.sObj, "rm " + outDir + "/wrfout*")
-			Tools.popen(self.sObj, "rm " + outDir + "/wrfrst*")
+			ops.delete(outDir + "/wrfout*")
+			ops.delete(outDir + "/wrfrst*")
 		if(cleanModelData == True):
-			Tools.popen(self.sObj, "rm -r " + dataDir)
+			ops.delete(dataDir, recursive = True)
+		ops.run()
 		return None
\ No newline at end of file
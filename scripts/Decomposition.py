@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# Decomposition.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to choose the MPI decomposition (nproc_x, nproc_y, nio_groups) of the WRF job. Run this file on its own
+#  to list the choices of the planner next to Tools.detect_ideal_processors() over a sweep of domain sizes and node counts, or to
+#  check the cost model against the step times measured in earlier runs (wrf_timing.db, See StepTiming.py).
+
+import sys
+import math
+import time
+import sqlite3
+import itertools
+import StepTiming
+import Tools
+
+# CostModel: Estimates the time of one model step on the slowest patch, in units of the time taken to compute one grid column.
+#  The patch with the most columns sets the pace (Load imbalance), every row of a patch carries a fixed loop overhead (Patches
+#  that are narrow in x vectorize poorly), and each halo exchange costs a latency per neighbour plus the columns sent along
+#  the patch edges. The weights are rough and can be tuned to a machine by changing the class attributes.
+class CostModel:
+	rowOverhead = 10.0
+	haloWidth = 3
+	haloPointCost = 0.5
+	messageCost = 500.0
+	quiltMismatch = 1.10
+
+	def patch_size(self, gridX, gridY, nprocX, nprocY):
+		return (int(math.ceil(float(gridX) / nprocX)), int(math.ceil(float(gridY) / nprocY)))
+
+	def compute(self, patchX, patchY, numtiles):
+		# numtiles splits the patch by rows, an uneven split leaves the last tile short
+		rows = int(math.ceil(float(patchY) / numtiles)) * numtiles
+		return rows * (patchX + self.rowOverhead)
+
+	def halo(self, patchX, patchY, nprocX, nprocY):
+		neighboursX = min(2, nprocX - 1)
+		neighboursY = min(2, nprocY - 1)
+		points = (neighboursX * patchY + neighboursY * patchX) * self.haloWidth
+		return points * self.haloPointCost + (neighboursX + neighboursY) * self.messageCost
+
+	def cost(self, gridX, gridY, nprocX, nprocY, numtiles, nioTasks):
+		patchX, patchY = self.patch_size(gridX, gridY, nprocX, nprocY)
+		total = self.compute(patchX, patchY, numtiles) + self.halo(patchX, patchY, nprocX, nprocY)
+		if nioTasks > 0 and nprocY % nioTasks != 0:
+			# The quilt servers of a group each collect a band of rows, this works best when the I/O tasks divide nproc_y
+			total *= self.quiltMismatch
+		return total
+
+# Candidate: A single decomposition of the WRF ranks
+class Candidate:
+	nprocX = 0
+	nprocY = 0
+	nioGroups = 0
+	nioTasks = 0
+	patchX = 0
+	patchY = 0
+	cost = 0.0
+
+	def __init__(self, nprocX, nprocY, nioGroups, nioTasks, patchX, patchY, cost):
+		self.nprocX = nprocX
+		self.nprocY = nprocY
+		self.nioGroups = nioGroups
+		self.nioTasks = nioTasks
+		self.patchX = patchX
+		self.patchY = patchY
+		self.cost = cost
+
+	def describe(self):
+		return ("X: " + str(self.nprocX) + ", Y: " + str(self.nprocY) + ", I/O groups: " + str(self.nioGroups) + " x " + str(self.nioTasks) +
+				" (Patch " + str(self.patchX) + " x " + str(self.patchY) + ", cost " + str(int(self.cost)) + ")")
+
+# candidates: Every nproc_x x nproc_y factorization of ranks that leaves more than 10 points per patch in both directions (The rule
+#  of detect_ideal_processors())
+def candidates(gridX, gridY, ranks, numtiles = 1, nioGroups = 0, nioTasks = 0, model = None):
+	model = model if model is not None else CostModel()
+	found = []
+	for nprocX in range(1, int(math.sqrt(ranks)) + 1):
+		if ranks % nprocX != 0:
+			continue
+		for x, y in set([(nprocX, ranks // nprocX), (ranks // nprocX, nprocX)]):
+			if float(gridX) / x <= 10 or float(gridY) / y <= 10:
+				continue
+			patchX, patchY = model.patch_size(gridX, gridY, x, y)
+			if patchY < numtiles:
+				continue
+			found.append(Candidate(x, y, nioGroups, nioTasks, patchX, patchY, model.cost(gridX, gridY, x, y, numtiles, nioTasks if nioGroups > 0 else 0)))
+	return found
+
+# plan_decomposition: Returns the lowest cost decomposition of the WRF job, or None if no valid one exists. When quilting is on
+#  and the requested number of I/O groups leaves no valid decomposition, fewer groups are tried before giving up.
+def plan_decomposition(gridX, gridY, nodes, procsPerNode, nioGroups = 0, nioTasks = 0, numtiles = 1, model = None):
+	totalRanks = nodes * procsPerNode
+	groupOptions = [nioGroups] if nioGroups * nioTasks == 0 else range(nioGroups, 0, -1)
+	for groups in groupOptions:
+		ranks = totalRanks - groups * nioTasks
+		if ranks <= 0:
+			continue
+		found = candidates(gridX, gridY, ranks, max(1, numtiles), groups, nioTasks, model)
+		if found:
+			return min(found, key = lambda c: (c.cost, c.nprocX))
+	return None
+
+# sweep: Lists the choices of the planner and of detect_ideal_processors() over a sweep of domain sizes and node counts, with their
+#  patch sizes. The cost model is what the planner minimizes, so it is not used to score the two against each other, see validate()
+#  for a check against measured step times.
+def sweep(procsPerNode = 32, numtiles = 2):
+	model = CostModel()
+	domains = [(200, 200), (425, 300), (700, 500), (1400, 900), (2000, 2000), (4000, 3000)]
+	nodeCounts = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+	ioSettings = [(0, 0), (4, 16)]
+	timings = [0.0, 0.0]
+	cases = 0
+	differ = 0
+	onlyNew = 0
+	print("Domain     Nodes IO     detect_ideal_processors          plan_decomposition")
+	for gridX, gridY in domains:
+		for nodes in nodeCounts:
+			for nioGroups, nioTasks in ioSettings:
+				start = time.time()
+				old = Tools.detect_ideal_processors(gridX, gridY, nodes, procsPerNode, nioGroups, nioTasks)
+				timings[0] += time.time() - start
+				start = time.time()
+				new = plan_decomposition(gridX, gridY, nodes, procsPerNode, nioGroups, nioTasks, numtiles, model)
+				timings[1] += time.time() - start
+				cases += 1
+				if old is None and new is not None:
+					onlyNew += 1
+				elif old is not None and new is not None and (old[0], old[1]) != (new.nprocX, new.nprocY):
+					differ += 1
+				oldText = "none" if old is None else (str(old[0]) + "x" + str(old[1]) + " patch " + "x".join(str(p) for p in model.patch_size(gridX, gridY, old[0], old[1])))
+				newText = "none" if new is None else (str(new.nprocX) + "x" + str(new.nprocY) + " patch " + str(new.patchX) + "x" + str(new.patchY) +
+													  ("" if new.nioGroups == nioGroups else " io " + str(new.nioGroups)))
+				print((str(gridX) + "x" + str(gridY)).ljust(11) + str(nodes).ljust(6) + (str(nioGroups) + "x" + str(nioTasks)).ljust(7) + oldText.ljust(33) + newText)
+	print("")
+	print("Cases: " + str(cases) + ", different choice: " + str(differ) + ", only the planner found one: " + str(onlyNew))
+	print("Search time: detect_ideal_processors " + ("%.3f" % timings[0]) + "s, plan_decomposition " + ("%.3f" % timings[1]) + "s")
+
+# measured_runs: The decomposition and median seconds per step of each timed run, grouped by domain, compute ranks and numtiles.
+#  Runs that left the decomposition to WRF (nproc_x -1) or have no steps are skipped.
+def measured_runs(dbPaths):
+	groups = {}
+	for dbPath in dbPaths:
+		try:
+			store = StepTiming.TimingStore(dbPath)
+			info = store.info()
+			summary = store.summary()
+			store.close()
+		except sqlite3.Error:
+			continue
+		try:
+			nprocX = int(info.get("nproc_x") or -1)
+			nprocY = int(info.get("nproc_y") or -1)
+		except ValueError:
+			continue
+		ranks = StepTiming.run_ranks(info)
+		if nprocX <= 0 or nprocY <= 0 or not ranks or summary["steps"] == 0:
+			continue
+		key = (int(info["e_we"]), int(info["e_sn"]), ranks, int(info.get("wrf_numtiles") or 1),
+			   int(info.get("wrf_nio_groups") or 0), int(info.get("wrf_nio_tasks_per_group") or 0))
+		groups.setdefault(key, {}).setdefault((nprocX, nprocY), []).append(summary["median"])
+	return groups
+
+# validate: Checks the cost model against the step times of earlier runs. For every domain and rank count timed under more than one
+#  decomposition, each pair of decompositions is checked: the model agrees when it ranks them in the order of their measured median
+#  step times. Where both the planner's and detect_ideal_processors()'s choices were timed, their measured speedup is printed.
+def validate(dbPaths):
+	model = CostModel()
+	agree = 0
+	pairs = 0
+	for key, measured in sorted(measured_runs(dbPaths).items()):
+		gridX, gridY, ranks, numtiles, nioGroups, nioTasks = key
+		if len(measured) < 2:
+			continue
+		print(str(gridX) + "x" + str(gridY) + ", " + str(ranks) + " compute ranks, numtiles " + str(numtiles) + ":")
+		seconds = dict((d, sorted(times)[len(times) // 2]) for d, times in measured.items())
+		costs = dict((d, model.cost(gridX, gridY, d[0], d[1], numtiles, nioTasks if nioGroups > 0 else 0)) for d in measured)
+		for d in sorted(measured, key = lambda d: seconds[d]):
+			print("  " + (str(d[0]) + "x" + str(d[1])).ljust(10) + ("%.3f s/step" % seconds[d]).ljust(16) + "cost " + str(int(costs[d])) +
+				  " (" + str(len(measured[d])) + " run" + ("s" if len(measured[d]) > 1 else "") + ")")
+		for a, b in itertools.combinations(measured, 2):
+			if seconds[a] == seconds[b] or costs[a] == costs[b]:
+				continue
+			pairs += 1
+			if (seconds[a] < seconds[b]) == (costs[a] < costs[b]):
+				agree += 1
+		new = candidates(gridX, gridY, ranks, numtiles, nioGroups, nioTasks, model)
+		new = min(new, key = lambda c: (c.cost, c.nprocX)) if new else None
+		procsPerNode = ranks + nioGroups * nioTasks
+		old = Tools.detect_ideal_processors(gridX, gridY, 1, procsPerNode, nioGroups, nioTasks)
+		if new is not None and old is not None and (new.nprocX, new.nprocY) != (old[0], old[1]) and (new.nprocX, new.nprocY) in seconds and (old[0], old[1]) in seconds:
+			print("  Measured speedup of the planner's " + str(new.nprocX) + "x" + str(new.nprocY) + " over detect_ideal_processors' " + str(old[0]) + "x" + str(old[1]) +
+				  ": " + ("%.3f" % (seconds[(old[0], old[1])] / seconds[(new.nprocX, new.nprocY)])))
+	print("")
+	if pairs == 0:
+		print("No domain was timed under more than one decomposition, there is nothing to check the model against")
+	else:
+		print("The cost model ranks " + str(agree) + " of " + str(pairs) + " pairs of decompositions in the measured order")
+
+if __name__ == "__main__":
+	if len(sys.argv) > 1 and sys.argv[1] == "validate":
+		validate(sys.argv[2:])
+	else:
+		sweep(int(sys.argv[1]) if len(sys.argv) > 1 else 32, int(sys.argv[2]) if len(sys.argv) > 2 else 2)
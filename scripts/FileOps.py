@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# FileOps.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the class used to run batches of file operations (delete, copy, move) inside the program instead of one shell call each
+
+import os
+import glob
+import fnmatch
+import shutil
+import time
+from multiprocessing.pool import ThreadPool
+import Tools
+
+# FileOps: A batch of glob based delete / copy / move / link operations. The operations run in the order they were added, consecutive
+#  operations of the same kind are grouped and their files are handled by a thread pool. Directory listings are read once per
+#  group and matched in memory, so 40 patterns on the output directory cost one readdir instead of 40 rm processes. In debug
+#  mode the operations are printed the same way Tools.popen() prints commands, and nothing is touched.
+class FileOps:
+	aSet = None
+	label = ""
+	ops = []
+	threads = 8
+	listings = {}
+	logger = None
+
+	def __init__(self, settings, label = ""):
+		self.aSet = settings
+		self.label = label
+		self.ops = []
+		self.threads = max(1, int(settings.fetch("fileops_threads")))
+		self.listings = {}
+		self.logger = Tools.loggedPrint.instance()
+
+	# delete: Removes the files matching pattern, directories are only removed when recursive is set (IE: rm -r)
+	def delete(self, pattern, recursive = False):
+		self.ops.append({"kind": "delete", "pattern": pattern, "recursive": recursive, "command": ("rm -r " if recursive else "rm ") + pattern})
+
+	# copy: Copies the files matching pattern into target (A directory, or the new file name for a single file). Names listed in
+	#  exclude are left out, directories are skipped (IE: cp without -r)
+	def copy(self, pattern, target, exclude = None):
+		self.ops.append({"kind": "copy", "pattern": pattern, "target": target, "exclude": exclude if exclude is not None else [], "command": "cp " + pattern + " " + target})
+
+	def move(self, pattern, target):
+		self.ops.append({"kind": "move", "pattern": pattern, "target": target, "exclude": [], "command": "mv " + pattern + " " + target})
+
+	# link: Like copy(), but the files are linked to their source instead, hard links fall back to a symbolic link when the source
+	#  is on another file system. Only use this for files that are never written to, a write through the link changes the source.
+	def link(self, pattern, target, exclude = None, hard = False):
+		self.ops.append({"kind": "hardlink" if hard else "symlink", "pattern": pattern, "target": target, "exclude": exclude if exclude is not None else [],
+						 "command": ("ln -f " if hard else "ln -sf ") + pattern + " " + target})
+
+	# listing: The names in a directory, read once per group of operations
+	def listing(self, dirName):
+		if dirName not in self.listings:
+			try:
+				self.listings[dirName] = os.listdir(dirName if dirName else '.')
+			except OSError:
+				self.listings[dirName] = []
+		return self.listings[dirName]
+
+	# expand: Matches a pattern the same way the shell (And glob) would, hidden files are only matched by a pattern starting with .
+	def expand(self, pattern):
+		dirName, base = os.path.split(pattern)
+		if glob.has_magic(dirName):
+			return sorted(glob.glob(pattern))
+		if not glob.has_magic(base):
+			return [pattern] if base in self.listing(dirName) else []
+		names = fnmatch.filter(self.listing(dirName), base)
+		if not base.startswith('.'):
+			names = [n for n in names if not n.startswith('.')]
+		return sorted(os.path.join(dirName, n) for n in names)
+
+	# target_path: Where a source file ends up, later operations of a group replace the files of earlier ones (IE: cp a/* then cp b/*)
+	def target_path(self, source, target):
+		if os.path.isdir(target):
+			return os.path.join(target, os.path.basename(source))
+		return target
+
+	def tree_size(self, path):
+		total = 0
+		for root, dirs, files in os.walk(path):
+			for fName in files:
+				try:
+					total += os.lstat(os.path.join(root, fName)).st_size
+				except OSError:
+					pass
+		return total
+
+	def do_delete(self, task):
+		path, recursive = task
+		try:
+			if os.path.isdir(path) and not os.path.islink(path):
+				if not recursive:
+					return (0, 0, 0)
+				size = self.tree_size(path)
+				shutil.rmtree(path)
+				return (1, size, 0)
+			size = os.lstat(path).st_size
+			os.remove(path)
+			return (1, size, 0)
+		except OSError as e:
+			self.logger.write("FileOps(" + self.label + "): Could not remove " + path + ": " + str(e))
+			return (0, 0, 1)
+
+	def do_copy(self, task):
+		source, target = task
+		try:
+			if os.path.isdir(source):
+				return (0, 0, 0)
+			if os.path.lexists(target) and not os.path.isdir(target):
+				# May be a link left by an earlier linked staging, copying onto it would write into its source
+				os.remove(target)
+			shutil.copy(source, target)
+			return (1, os.path.getsize(target), 0)
+		except OSError as e:
+			self.logger.write("FileOps(" + self.label + "): Could not copy " + source + " to " + target + ": " + str(e))
+			return (0, 0, 1)
+
+	def do_move(self, task):
+		source, target = task
+		try:
+			size = os.lstat(source).st_size
+			try:
+				os.replace(source, target)
+			except OSError:
+				# Not on the same file system
+				shutil.move(source, target)
+			return (1, size, 0)
+		except OSError as e:
+			self.logger.write("FileOps(" + self.label + "): Could not move " + source + " to " + target + ": " + str(e))
+			return (0, 0, 1)
+
+	def do_symlink(self, task):
+		source, target = task
+		try:
+			if os.path.isdir(source):
+				return (0, 0, 0)
+			if os.path.lexists(target):
+				os.remove(target)
+			os.symlink(os.path.abspath(source), target)
+			return (1, 0, 0)
+		except OSError as e:
+			self.logger.write("FileOps(" + self.label + "): Could not link " + source + " to " + target + ": " + str(e))
+			return (0, 0, 1)
+
+	def do_hardlink(self, task):
+		source, target = task
+		try:
+			if os.path.isdir(source):
+				return (0, 0, 0)
+			if os.path.lexists(target):
+				os.remove(target)
+			os.link(os.path.realpath(source), target)
+			return (1, 0, 0)
+		except OSError:
+			return self.do_symlink(task)
+
+	# tasks: Expands the patterns of a group into the list of files to work on
+	def tasks(self, group):
+		self.listings = {}
+		if group[0]["kind"] == "delete":
+			tasks = {}
+			for op in group:
+				for path in self.expand(op["pattern"]):
+					tasks[path] = tasks.get(path, False) or op["recursive"]
+			return sorted(tasks.items())
+		targets = {}
+		for op in group:
+			for source in self.expand(op["pattern"]):
+				if os.path.basename(source) not in op["exclude"]:
+					targets[self.target_path(source, op["target"])] = source
+		return sorted((source, target) for target, source in targets.items())
+
+	# run: Runs every queued operation and clears the batch, returns the totals as {kind: {"files", "bytes"}, "errors", "seconds"}
+	def run(self):
+		totals = {"delete": {"files": 0, "bytes": 0}, "copy": {"files": 0, "bytes": 0}, "move": {"files": 0, "bytes": 0}, "link": {"files": 0, "bytes": 0}, "errors": 0, "seconds": 0}
+		ops = self.ops
+		self.ops = []
+		if(self.aSet.fetch("debugmode") == '1'):
+			for op in ops:
+				print("D: " + op["command"])
+			return totals
+		groups = []
+		for op in ops:
+			if groups and groups[-1][0]["kind"] == op["kind"]:
+				groups[-1].append(op)
+			else:
+				groups.append([op])
+		startTime = time.time()
+		actions = {"delete": self.do_delete, "copy": self.do_copy, "move": self.do_move, "symlink": self.do_symlink, "hardlink": self.do_hardlink}
+		pool = ThreadPool(processes = self.threads)
+		try:
+			for group in groups:
+				kind = group[0]["kind"]
+				total = totals["link" if kind in ["symlink", "hardlink"] else kind]
+				for files, size, errors in pool.map(actions[kind], self.tasks(group)):
+					total["files"] += files
+					total["bytes"] += size
+					totals["errors"] += errors
+		finally:
+			pool.close()
+			pool.join()
+		totals["seconds"] = time.time() - startTime
+		self.logger.write("FileOps(" + self.label + "): Removed " + str(totals["delete"]["files"]) + " (" + self.megabytes(totals["delete"]["bytes"]) + "), copied " +
+						  str(totals["copy"]["files"]) + " (" + self.megabytes(totals["copy"]["bytes"]) + "), moved " + str(totals["move"]["files"]) +
+						  " (" + self.megabytes(totals["move"]["bytes"]) + "), linked " + str(totals["link"]["files"]) + " in " + ("%.1f" % totals["seconds"]) + "s" +
+						  ("" if totals["errors"] == 0 else ", " + str(totals["errors"]) + " could not be processed"))
+		return totals
+
+	def megabytes(self, size):
+		return ("%.1f" % (size / 1048576.0)) + " MB"
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# IOForms.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the methods used to choose the io_form of each file real.exe and wrf.exe read and write, and the class used to time
+#  wrf.exe's reads and restart writes under each io_form
+
+import os
+import re
+import json
+import datetime
+import Cache
+import StepTiming
+import Tools
+
+# The io_form values offered: serial netCDF (Rank 0 reads or writes the whole domain and scatters / gathers it), parallel netCDF
+#  (Every rank reads or writes its own patch of the same file, needs WRF built with PNETCDF), and split (One file per rank)
+forms = {"2": "netCDF", "11": "pnetcdf", "102": "split"}
+
+# The control.txt key of each stream, the executable using it and its namelist entry
+streams = [("real_io_form_input", "real", "io_form_input"), ("real_io_form_boundary", "real", "io_form_boundary"),
+		   ("wrf_io_form_input", "wrf", "io_form_input"), ("wrf_io_form_boundary", "wrf", "io_form_boundary"),
+		   ("wrf_io_form_restart", "wrf", "io_form_restart")]
+
+# The Timing line of the wrfinput read: Timing for processing wrfinput file (stream 0) for domain        1:    4.59 elapsed seconds
+inputPattern = re.compile(r"Timing for processing wrfinput file \(stream \d+\) for domain\s+(\d+):\s+([0-9.]+) elapsed seconds")
+
+# compute_ranks: The ranks of an executable that read and write the domain (The quilt I/O tasks of wrf.exe are left out)
+def compute_ranks(settings, exe):
+	if exe == "real":
+		return int(settings.fetch("num_prerun_nodes")) * int(settings.fetch("prerun_mpi_ranks_per_node"))
+	return (int(settings.fetch("num_wrf_nodes")) * int(settings.fetch("wrf_mpi_ranks_per_node")) -
+			int(settings.fetch("wrf_nio_groups")) * int(settings.fetch("wrf_nio_tasks_per_group")))
+
+# invalid_reason: Why an io_form cannot be used for a stream (A control.txt key of streams), given the forms chosen for the others, or None
+#  if it can. Split files can only be read back on the decomposition that wrote them: split wrfinput files need real.exe and wrf.exe
+#  on the same compute ranks with the decomposition left to WRF (wrf_detect_proc_count 0), and split restart files a run that cannot
+#  be moved to more nodes by Recovery. serial and parallel netCDF write the same file format, one can read the other.
+def invalid_reason(settings, key, form, chosen):
+	if form not in forms:
+		return "not one of " + ", ".join(sorted(forms, key = int))
+	if form != "102":
+		if key == "wrf_io_form_input" and chosen.get("real_io_form_input") == "102":
+			return "real.exe writes split wrfinput files (real_io_form_input 102)"
+		return None
+	if key.endswith("_boundary"):
+		return "wrfbdy_d01 cannot be split"
+	if key.endswith("_input"):
+		other = "wrf_io_form_input" if key == "real_io_form_input" else "real_io_form_input"
+		if chosen.get(other) != "102":
+			return "split wrfinput files need both real_io_form_input and wrf_io_form_input set to 102"
+		if settings.fetch("wrf_detect_proc_count") == '1' or compute_ranks(settings, "real") != compute_ranks(settings, "wrf"):
+			return "split wrfinput files can only be read on the decomposition real.exe wrote them with (Same compute ranks, wrf_detect_proc_count 0)"
+		return None
+	if int(settings.fetch("wrf_recovery_attempts")) > 0 and int(settings.fetch("wrf_recovery_max_nodes")) > int(settings.fetch("num_wrf_nodes")):
+		return "Recovery may move a failed run to more nodes (wrf_recovery_max_nodes), a split restart can only be read on the nodes that wrote it"
+	return None
+
+# select_io_forms: The io_form of every stream, from its control.txt key. auto uses parallel netCDF when the executable runs on at least
+#  io_form_auto_ranks compute ranks, serial netCDF otherwise. A form that cannot be used is logged and replaced by parallel netCDF
+#  (Or serial netCDF when that cannot be used either). The keys are set to the forms chosen.
+def select_io_forms(settings):
+	logger = Tools.loggedPrint.instance()
+	chosen = {}
+	for key, exe, entry in streams:
+		form = settings.fetch(key)
+		if form == "auto":
+			form = "11" if compute_ranks(settings, exe) >= int(settings.fetch("io_form_auto_ranks")) else "2"
+		chosen[key] = form
+	for key, exe, entry in streams:
+		reason = invalid_reason(settings, key, chosen[key], chosen)
+		if reason is None:
+			continue
+		fallback = "11" if invalid_reason(settings, key, "11", chosen) is None else "2"
+		logger.write("  - " + key + " " + chosen[key] + " cannot be used, " + reason + ", using " + fallback + " (" + forms[fallback] + ")")
+		chosen[key] = fallback
+	for key, form in chosen.items():
+		settings.override(key, form)
+	return chosen
+
+# benchmark_namelist: Writes the namelist of one benchmark run of wrf.exe, a copy of namelist.input.wrf running io_benchmark_minutes of
+#  model time with the given io_form for each stream, writing one restart file at the end. Every file it writes is named iobench_*
+#  so the output of the forecast (And its restart files) are left alone.
+def benchmark_namelist(settings, source, target, ioForms):
+	minutes = int(settings.fetch("io_benchmark_minutes"))
+	end = settings.startTime + datetime.timedelta(minutes = minutes)
+	with open(source, 'r') as source_file:
+		lines = source_file.readlines()
+	with open(target, 'w') as target_file:
+		for line in lines:
+			target_file.write(line)
+			if line.strip().lower() == "&time_control":
+				# The template has no rst_outname, wrf.exe would name the restart file like the ones of the forecast
+				target_file.write(" rst_outname                         = 'iobench_wrfrst_d<domain>_<date>',\n")
+	values = [("run_days", 0), ("run_hours", 0), ("start_year", settings.startTime.year), ("start_month", settings.startTime.month),
+			  ("start_day", settings.startTime.day), ("start_hour", settings.startTime.hour), ("end_year", end.year), ("end_month", end.month),
+			  ("end_day", end.day), ("end_hour", end.hour), ("end_minute", end.minute), ("restart", ".false."), ("restart_interval", minutes),
+			  ("history_outname", "'iobench_wrfout_d<domain>_<date>'"), ("auxhist2_outname", "'iobench_AFWA_d<domain>_<date>'"),
+			  ("auxhist5_outname", "'iobench_subhr_d<domain>_<date>'"), ("auxhist23_outname", "'iobench_pgrb3D_d<domain>_<date>'")]
+	values += [(entry, ioForms[entry]) for entry in ["io_form_input", "io_form_boundary", "io_form_restart"]]
+	for name, value in values:
+		Cache.set_namelist_value(target, name, value)
+
+# IOBenchmark: Times wrf.exe's wrfinput read, boundary read and restart write under each io_form (io_benchmark). iobench.job runs a
+#  short wrf.exe run per form (See benchmark_runs()) on the WRF nodes, after real.exe, and keeps each run's rsl.out.0000 as
+#  iobench_<form>.log. The times are written to the log and io_benchmark.json, with io_benchmark 2 the fastest form of each stream
+#  also replaces the chosen one in namelist.input.wrf before the forecast runs.
+class IOBenchmark:
+	aSet = None
+	runDir = ""
+	logger = None
+
+	def __init__(self, settings, runDir):
+		self.aSet = settings
+		self.runDir = runDir
+		self.logger = Tools.loggedPrint.instance()
+
+	# chosen: The io_form of each wrf.exe stream as namelist.input.wrf was written (See select_io_forms())
+	def chosen(self):
+		return dict((entry, self.aSet.fetch(key)) for key, exe, entry in streams if exe == "wrf")
+
+	# benchmark_runs: The runs of the benchmark, {form: {namelist entry: io_form}}. Each run uses its form on every stream it can be used
+	#  on (wrf.exe reads the wrfinput file real.exe wrote) and the chosen form on the others, runs that would repeat another are left out.
+	def benchmark_runs(self):
+		chosen = self.chosen()
+		realForms = {"real_io_form_input": self.aSet.fetch("real_io_form_input")}
+		runs = {}
+		for form in sorted(forms, key = int):
+			ioForms = dict(chosen)
+			for key, exe, entry in streams:
+				if exe == "wrf" and invalid_reason(self.aSet, key, form, realForms) is None:
+					ioForms[entry] = form
+			if ioForms not in runs.values():
+				runs[form] = ioForms
+		return runs
+
+	# write_namelists: Writes namelist.input.iobench.<form> for each run into the output directory, returns the forms
+	def write_namelists(self):
+		runs = self.benchmark_runs()
+		for form, ioForms in runs.items():
+			benchmark_namelist(self.aSet, self.runDir + "/output/namelist.input.wrf", self.runDir + "/output/namelist.input.iobench." + form, ioForms)
+		return sorted(runs, key = int)
+
+	# parse_log: The seconds of the wrfinput read, the first boundary read, and the restart write of domain 1 in one run's log
+	def parse_log(self, logPath):
+		found = {"input": None, "boundary": None, "restart": None}
+		if not os.path.isfile(logPath):
+			return None
+		with open(logPath, 'r', errors = 'replace') as source_file:
+			for line in source_file:
+				match = inputPattern.search(line)
+				if match and int(match.group(1)) == 1:
+					found["input"] = float(match.group(2))
+					continue
+				entry = StepTiming.parse_line(line)
+				if entry is None or entry[1] != 1:
+					continue
+				if entry[0] == "boundary" and found["boundary"] is None:
+					found["boundary"] = entry[2]
+				elif entry[0] == "write" and "wrfrst" in entry[2]:
+					found["restart"] = entry[4]
+		return found
+
+	# report: Reads the logs of every run, writes the table to the log and io_benchmark.json, and returns the fastest form of each stream
+	#  ({namelist entry: io_form}, only for the streams measured under more than one form)
+	def report(self):
+		runs = self.benchmark_runs()
+		results = {}
+		for form in sorted(runs, key = int):
+			timing = self.parse_log(self.runDir + "/iobench_" + form + ".log")
+			if timing is None or timing["input"] is None:
+				self.logger.write("IOBenchmark: The " + forms[form] + " run did not complete, see iobench_" + form + ".log")
+				continue
+			results[form] = {"io_forms": runs[form], "seconds": timing}
+			self.logger.write("IOBenchmark: " + (forms[form] + " (" + form + ")").ljust(15) + " wrfinput read " + self.seconds(timing["input"]) +
+							  ", boundary read " + self.seconds(timing["boundary"]) + ", restart write " + self.seconds(timing["restart"]) +
+							  " (" + ", ".join(k + " " + v for k, v in sorted(runs[form].items())) + ")")
+		best = {}
+		for entry, measure in [("io_form_input", "input"), ("io_form_boundary", "boundary"), ("io_form_restart", "restart")]:
+			timed = {}
+			for form, result in results.items():
+				seconds = result["seconds"][measure]
+				if seconds is not None:
+					timed.setdefault(result["io_forms"][entry], []).append(seconds)
+			if len(timed) > 1:
+				best[entry] = min(timed, key = lambda f: min(timed[f]))
+		with open(self.runDir + "/io_benchmark.json", 'w') as target_file:
+			json.dump({"time": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "ranks": compute_ranks(self.aSet, "wrf"),
+					   "runs": results, "fastest": best}, target_file, indent = 1, sort_keys = True)
+		return best
+
+	def seconds(self, value):
+		return "n/a" if value is None else ("%.2f s" % value)
+
+	# apply: Sets the fastest form of each stream in namelist.input.wrf (And the namelists of wrf_segments), and in the settings and template
+	#  keys so a namelist written again (Recovery) keeps it
+	def apply(self, best):
+		chosen = self.chosen()
+		keys = dict((entry, key) for key, exe, entry in streams if exe == "wrf")
+		namelists = [self.runDir + "/output/namelist.input.wrf"]
+		namelists += [self.runDir + "/output/" + n for n in sorted(os.listdir(self.runDir + "/output")) if n.startswith("namelist.input.wrf.seg")]
+		for entry, form in sorted(best.items()):
+			if form == chosen[entry]:
+				self.logger.write("IOBenchmark: " + entry + " " + form + " (" + forms[form] + ") is already the fastest")
+				continue
+			self.logger.write("IOBenchmark: " + entry + " " + form + " (" + forms[form] + ", Was " + chosen[entry] + ")")
+			for namelist in namelists:
+				Cache.set_namelist_value(namelist, entry, form)
+			self.aSet.override(keys[entry], form)
+			self.aSet.add_replacementKey("[" + entry + "]", form)
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# IOVars.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the methods used to write IO_VARS.txt from the products the post-processing makes, so the history files only carry
+#  the fields it reads
+
+import os
+import re
+import ast
+import sys
+import Tools
+
+# The fields the Python post-processor reads from every history file whatever is plotted: the map (ArrayTools.make_dataset()), and
+#  the pressure and height the fields are interpolated to (PythonPost.run_calculation_routines()). Entries starting with get_ are
+#  functions of Calculation.py, the fields they read are found in its source (See calculation_fields()).
+pythonBase = ["XLAT", "XLONG", "XTIME", "get_full_p", "get_height"]
+
+# What PythonPost.run_calculation_routines() computes for each flag of Routines.Routines
+pythonProducts = {"need_mslp": ["get_slp"], "need_sim_dbz": ["get_dbz"], "need_ptype": [], "need_acum_pcp": ["get_accum_precip"],
+				  "need_acum_sno": ["SNOWNC"], "need_prec_wat": ["get_pw"], "need_dewpoint": ["get_dewpoint"], "need_RH": ["get_rh"],
+				  "need_Temp": ["get_tk"], "need_winds": ["get_winds_at_level"], "need_theta_e": ["get_eth"], "need_omega": ["get_omega"],
+				  "need_sfc_max_winds": ["WSPD10MAX"], "need_geoht": [], "need_relvort": ["get_rvor"], "need_3d_cape": ["get_cape3d"],
+				  "need_3d_cin": ["get_cape3d"], "need_mucape": ["get_cape2d"], "need_mucin": ["get_cape2d"], "need_lcl": ["get_cape2d"],
+				  "need_lfc": ["get_cape2d"], "need_srh": ["get_srh"], "need_uphel": ["get_udhel"], "need_shear": ["get_wind_shear"],
+				  "need_afwa_hail": ["AFWA_HAIL"], "need_afwa_tor": ["AFWA_TORNADO"]}
+
+# The fields UPP reads for any product: the grid, the model levels, and the surface state
+uppBase = ["XLAT", "XLONG", "XTIME", "HGT", "PH", "PHB", "P", "PB", "T", "QVAPOR", "MU", "MUB", "PSFC", "P_TOP", "ZNU", "ZNW", "MAPFAC_M",
+		   "LANDMASK", "XLAND", "T2", "Q2", "TH2", "U10", "V10", "TSK"]
+
+# The fields behind each product short name (The line after the tmpl4_* line of a record in postxconfig-NT.txt)
+cloudFields = ["CLDFRA", "QCLOUD", "QICE", "QSNOW"]
+precipFields = ["RAINC", "RAINNC", "RAINSH", "SNOWNC", "GRAUPELNC", "HAILNC", "SR", "QRAIN", "QSNOW", "QGRAUP"]
+uppProducts = {"HGT": [], "TMP": [], "SPFH": [], "PRES": [], "POT": [], "DPT": [], "RH": [], "PWAT": [], "PRMSL": [], "MSLET": [],
+			   "CAPE": [], "CIN": [], "PLPL": [], "LFTX": [], "4LFTX": [], "NLAT": [], "ELON": [], "LAND": [],
+			   "UGRD": ["U", "V"], "VGRD": ["U", "V"], "USTM": ["U", "V"], "VSTM": ["U", "V"], "HLCY": ["U", "V"], "VVEL": ["W"],
+			   "REFD": ["REFL_10CM", "QRAIN", "QSNOW", "QGRAUP"], "REFC": ["REFL_10CM", "QRAIN", "QSNOW", "QGRAUP"],
+			   "VIS": ["QCLOUD", "QRAIN", "QICE", "QSNOW"], "TCDC": cloudFields, "LCDC": cloudFields, "MCDC": cloudFields, "HCDC": cloudFields,
+			   "APCP": precipFields, "CRAIN": precipFields, "CSNOW": precipFields, "CFRZR": precipFields, "CICEP": precipFields,
+			   "CICE": ["SEAICE"], "WEASD": ["SNOW"], "SNOWC": ["SNOWC"], "VEG": ["VEGFRA"], "TSOIL": ["TSLB", "ZS", "DZS"],
+			   "SOILW": ["SMOIS", "ZS", "DZS"], "SOILM": ["SMOIS", "ZS", "DZS"], "MSTAV": ["SMOIS", "ZS", "DZS"], "SOILL": ["SH2O", "ZS", "DZS"],
+			   "SBT113": ["QCLOUD", "QICE", "QSNOW", "QRAIN", "QGRAUP", "EMISS"], "SBT114": ["QCLOUD", "QICE", "QSNOW", "QRAIN", "QGRAUP", "EMISS"],
+			   "SBT123": ["QCLOUD", "QICE", "QSNOW", "QRAIN", "QGRAUP", "EMISS"], "SBT124": ["QCLOUD", "QICE", "QSNOW", "QRAIN", "QGRAUP", "EMISS"]}
+
+# A line of IO_VARS.txt, IE: -:h:0:XLAT,XLONG removes XLAT and XLONG from the history stream
+ioVarsPattern = re.compile(r"^([+-]):h:(\d+):(.+)$")
+
+# The longest line written, WRF reads the file a line at a time into a fixed buffer
+maxLine = 200
+
+# call_name: The name of the function a call node calls
+def call_name(node):
+	if isinstance(node.func, ast.Name):
+		return node.func.id
+	if isinstance(node.func, ast.Attribute):
+		return node.func.attr
+	return None
+
+# strings: The string constants of a node (A string, or a list or tuple of them)
+def strings(node):
+	if isinstance(node, ast.Constant) and isinstance(node.value, str):
+		return [node.value]
+	if isinstance(node, (ast.Tuple, ast.List)):
+		return [e.value for e in node.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+	return []
+
+# calculation_fields: Reads the source of Calculation.py (It is not imported, that needs wrf-python and dask) and returns
+#  {function: (fields, functions called)}. A field is what fetch_variable() reads, or the first name wrapped_either() looks for, the
+#  other names it tries are the WPS ones (IE: UU for U) and are left out of the fields.
+def calculation_fields(path):
+	with open(path, 'r') as source_file:
+		tree = ast.parse(source_file.read(), path)
+	defined = set(node.name for node in tree.body if isinstance(node, ast.FunctionDef))
+	graph = {}
+	for function in [node for node in tree.body if isinstance(node, ast.FunctionDef)]:
+		fields = set()
+		alternates = set()
+		calls = set()
+		for node in ast.walk(function):
+			if not isinstance(node, ast.Call):
+				continue
+			name = call_name(node)
+			if name == "fetch_variable" and len(node.args) > 1:
+				fields.update(strings(node.args[1]))
+			elif name == "wrapped_either" and len(node.args) > 1:
+				names = strings(node.args[1])
+				fields.update(names[:1])
+				alternates.update(names[1:])
+			elif name in ["wrapped_lat_varname", "wrapped_lon_varname"]:
+				fields.add("XLAT" if name == "wrapped_lat_varname" else "XLONG")
+			elif name in defined and name != function.name:
+				calls.add(name)
+		graph[function.name] = (fields - alternates, calls)
+	return graph
+
+# resolve: The fields of a list of fields and Calculation functions, following the functions each one calls
+def resolve(entries, graph):
+	fields = set()
+	seen = set()
+	pending = list(entries)
+	while pending:
+		entry = pending.pop()
+		if not entry.startswith("get_"):
+			fields.add(entry)
+			continue
+		if entry in seen:
+			continue
+		seen.add(entry)
+		if entry not in graph:
+			raise KeyError(entry + " is not a function of Calculation.py")
+		fields.update(graph[entry][0])
+		pending.extend(graph[entry][1])
+	return fields
+
+# upp_short_names: The short name of every product of a postxconfig-NT.txt file
+def upp_short_names(path):
+	with open(path, 'r') as source_file:
+		lines = [line.strip() for line in source_file]
+	return sorted(set(lines[i + 1] for i in range(len(lines) - 1) if re.match(r"^tmpl4_\d+$", lines[i])))
+
+# registry_history: The fields the Registry files of the WRF build write to the history stream (An h in the I/O column with no stream
+#  numbers, or with 0 among them), or None if the Registry is not found next to wrfexecutables
+def registry_history(settings):
+	registryDir = os.path.normpath(os.path.join(settings.fetch("wrfexecutables"), "..", "Registry"))
+	try:
+		names = [n for n in os.listdir(registryDir) if n.lower().startswith("registry")]
+	except OSError:
+		return None
+	fields = set()
+	for name in names:
+		with open(os.path.join(registryDir, name), 'r', errors = 'replace') as source_file:
+			for line in source_file:
+				tokens = line.split()
+				if len(tokens) < 9 or tokens[0].lower() != "state":
+					continue
+				io = tokens[7].split('=', 1)[0].lower()
+				if 'h' not in io:
+					continue
+				j = io.index('h') + 1
+				numbers = set()
+				while j < len(io):
+					if io[j].isdigit():
+						numbers.add(int(io[j]))
+						j += 1
+					elif io[j] == '{' and '}' in io[j:]:
+						end = io.index('}', j)
+						numbers.add(int(io[j + 1:end]) if io[j + 1:end].isdigit() else -1)
+						j = end + 1
+					else:
+						break
+				if not numbers or 0 in numbers:
+					fields.add(tokens[8].strip('"'))
+	return fields if fields else None
+
+# needed_fields: The history fields the enabled post-processing reads, and a list of the reasons the history cannot be cut down to
+#  them (A UPP product that is not in uppProducts). The Python products are read from the flags of Routines.Routines with the
+#  post-processor's python_post_control.txt (In postdir/Python), UPP's from post/UPP/parm/postxconfig-NT.txt.
+def needed_fields(settings):
+	fields = set()
+	unknown = []
+	if settings.fetch("post_run_python") == '1':
+		pythonDir = settings.fetch("postdir") + "/Python"
+		if pythonDir not in sys.path:
+			sys.path.insert(0, pythonDir)
+		import Routines
+		routines = Routines.Routines()
+		entries = list(pythonBase)
+		for flag, products in sorted(pythonProducts.items()):
+			if getattr(routines, flag):
+				entries += products
+		fields |= resolve(entries, calculation_fields(pythonDir + "/Calculation.py"))
+	if settings.fetch("post_run_unipost") == '1':
+		fields |= set(uppBase)
+		for shortName in upp_short_names(settings.fetch("headdir") + "post/UPP/parm/postxconfig-NT.txt"):
+			if shortName in uppProducts:
+				fields |= set(uppProducts[shortName])
+			else:
+				unknown.append("UPP product " + shortName)
+	return fields, unknown
+
+# field_lines: The IO_VARS.txt lines adding (+) or removing (-) fields of a stream, split to keep each line under maxLine
+def field_lines(sign, stream, fields):
+	lines = []
+	prefix = sign + ":h:" + str(stream) + ":"
+	current = []
+	for name in sorted(fields):
+		if current and len(prefix) + len(",".join(current + [name])) > maxLine:
+			lines.append(prefix + ",".join(current))
+			current = []
+		current.append(name)
+	if current:
+		lines.append(prefix + ",".join(current))
+	return lines
+
+# io_vars_lines: The lines of IO_VARS.txt for the post-processing in use. The history stream loses every field the Registry writes to
+#  it that is not read, and gets the fields that are (So a field the Registry leaves out is still written). Without the Registry, or
+#  when a UPP product is not known, the removals of io_vars/IO_VARS.txt are kept, less the fields that are read. The lines of the
+#  other streams (auxhist) are taken from io_vars/IO_VARS.txt as they are. Returns the lines and a description of how they were made.
+def io_vars_lines(settings):
+	with open(settings.fetch("headdir") + "io_vars/IO_VARS.txt", 'r') as source_file:
+		static = [line.strip() for line in source_file if line.strip()]
+	fields, unknown = needed_fields(settings)
+	registry = registry_history(settings)
+	lines = []
+	if registry is not None and not unknown:
+		lines += field_lines('-', 0, registry - fields)
+		source = str(len(fields)) + " fields read, " + str(len(registry - fields)) + " of the Registry's history fields removed"
+	else:
+		removed = set()
+		for line in static:
+			match = ioVarsPattern.match(line)
+			if match and match.group(1) == '-' and match.group(2) == '0':
+				removed |= set(n.strip() for n in match.group(3).split(',') if n.strip())
+		lines += field_lines('-', 0, removed - fields)
+		source = (str(len(fields)) + " fields read, " + str(len(removed - fields)) + " fields of io_vars/IO_VARS.txt removed (" +
+				  ("The Registry was not found" if registry is None else ", ".join(unknown) + " not known") + ")")
+	lines += field_lines('+', 0, fields)
+	lines += [line for line in static if not (ioVarsPattern.match(line) and ioVarsPattern.match(line).group(2) == '0')]
+	return lines, source
+
+# write_io_vars: Writes the IO_VARS.txt of the run (See io_vars_lines()) to path
+def write_io_vars(settings, path):
+	lines, source = io_vars_lines(settings)
+	if(settings.fetch("debugmode") == '1'):
+		print("D: write " + path + " (" + source + ")")
+		return
+	with open(path, 'w') as target_file:
+		target_file.write("\n".join(lines) + "\n")
+	Tools.loggedPrint.instance().write(" 3. IO_VARS.txt written from the post-processing products, " + source)
@@ -9,8 +9,11 @@ import os
 import os.path
 import datetime
 import glob
+import re
 import time
 import math
+import shutil
+import threading
 from multiprocessing.pool import ThreadPool
 import ApplicationSettings
 import ModelData
@@ -18,7 +21,63 @@ import Scheduler
 import Tools
 import Wait
 import Template
+import Cache
+import RslLogs
+import RunState
+import Stability
+import StepTiming
+import Telemetry
 import PreparePyJob
+import IOForms
+import Recovery
+
+# historyPattern: The name of a wrfout file (Domain and valid time), WRF writes the time with either '_' or ':' between its fields
+historyPattern = re.compile(r"^wrfout_(d\d\d)_(\d{4})-(\d{2})-(\d{2})_(\d{2})[_:](\d{2})[_:](\d{2})$")
+
+# history_time: The domain and valid time fields (year, month, day, hour, minute, second) of a wrfout file, None for other names
+def history_time(iFile):
+	match = historyPattern.match(os.path.basename(iFile))
+	return match.groups() if match else None
+
+# wrf_segments: The parts a restart-chunked run (wrf_segments) splits the forecast into, a list of (start time, hours). The forecast is cut
+#  every ceil(hours / wrf_segments) hours, so the last segment can be shorter and there can be fewer segments than asked for.
+def wrf_segments(settings):
+	hours = int(settings.fetch("rundays")) * 24 + int(settings.fetch("runhours"))
+	count = max(1, int(settings.fetch("wrf_segments")))
+	if count == 1 or hours <= 1:
+		return [(settings.startTime, hours)]
+	length = int(math.ceil(float(hours) / count))
+	return [(settings.startTime + datetime.timedelta(hours = h), min(length, hours - h)) for h in range(0, hours, length)]
+
+# segment_stage: The name a segment is kept under in the run state
+def segment_stage(k):
+	return "wrf.seg" + str(k)
+
+# segment_walltime: The walltime of a segment's job in minutes, wrf_segment_walltime, or when that is 0 the share of wrf_walltime the
+#  segment's hours make up plus 20% (The restart file is read at the start of each segment and written at the end)
+def segment_walltime(settings, hours):
+	walltime = int(settings.fetch("wrf_segment_walltime"))
+	if walltime > 0:
+		return walltime
+	total = max(1, int(settings.fetch("rundays")) * 24 + int(settings.fetch("runhours")))
+	return max(10, int(math.ceil(int(settings.fetch("wrf_walltime")) * 1.2 * hours / total)))
+
+# write_segment_namelists: Writes namelist.input.wrf.seg<k> for every segment, copies of namelist.input.wrf that run the hours of the
+#  segment and write a restart file at its end. Every segment after the first restarts from the file the one before it wrote.
+def write_segment_namelists(settings, namelist):
+	segments = wrf_segments(settings)
+	paths = []
+	for k, (start, hours) in enumerate(segments):
+		path = namelist + ".seg" + str(k)
+		shutil.copyfile(namelist, path)
+		end = start + datetime.timedelta(hours = hours)
+		values = [("run_days", 0), ("run_hours", hours), ("start_year", start.year), ("start_month", start.month), ("start_day", start.day),
+				  ("start_hour", start.hour), ("end_year", end.year), ("end_month", end.month), ("end_day", end.day), ("end_hour", end.hour),
+				  ("restart", ".true." if k > 0 else ".false."), ("restart_interval", segments[0][1] * 60)]
+		for name, value in values:
+			Cache.set_namelist_value(path, name, value)
+		paths.append(path)
+	return paths
 
 # JobSteps: Class responsible for handling the steps that involve job submission and checkup
 class JobSteps:
@@ -26,260 +85,957 @@ class JobSteps:
 	aSet = None
 	modelParms = None
 	scheduleParms = None
+	tracker = None
+	jobIDs = {}
 	startTime = ""
 	dataDir = ""
 	wrfDir = ""
+	runDir = ""
+	allocationStages = {}
+	geoCache = None
+	geoKey = None
+	ungribCache = None
+	ungribKeys = {}
+	metCache = None
+	metKey = None
+	cachedSteps = []
+	state = None
+	history = None
+	reattached = []
+	allocationBegin = {}
+	timing = None
+	stability = None
+	rsl = None
+	recovery = None
+	segmentIndex = None
 
-	def __init__(self, settings, modelParms, scheduleParms):
+	def __init__(self, settings, modelParms, scheduleParms, state = None):
 		self.aSet = settings
 		self.logger = Tools.loggedPrint.instance()
 		self.modelParms = modelParms
 		self.scheduleParms = scheduleParms
+		self.tracker = Scheduler.JobTracker(scheduleParms, settings)
+		self.jobIDs = {}
 		self.dataDir = settings.fetch("datadir") + '/' + settings.fetch("modeldata")
 		self.wrfDir = settings.fetch("wrfdir")
-		self.startTime = settings.fetch("starttime")	
+		self.startTime = settings.fetch("starttime")
+		self.runDir = self.wrfDir + '/' + self.startTime[0:8]
+		self.allocationStages = {}
+		self.geoCache = Cache.FileCache(settings, "geo_em", "geo_em_cache_gb")
+		self.geoKey = None
+		self.ungribCache = Cache.FileCache(settings, "ungrib", "ungrib_cache_gb")
+		self.ungribKeys = {}
+		self.metCache = Cache.FileCache(settings, "met_em", "met_em_cache_gb")
+		self.metKey = None
+		self.cachedSteps = []
+		self.state = state if state is not None else RunState.RunState(self.runDir)
+		self.history = Telemetry.StageHistory(settings)
+		self.reattached = []
+		self.allocationBegin = {}
+		self.timing = StepTiming.TimingRecorder(settings, self.runDir)
+		self.stability = Stability.StabilityMonitor(settings, self.runDir, self.tracker)
+		self.rsl = RslLogs.RslLogs(settings, self.runDir)
+		self.recovery = Recovery.Recovery(settings, self.runDir, self.tracker, self.stability)
+		self.segmentIndex = None
+		
+	# submit_job: Submits a job file located in the run directory, the job ID is stored under the stage name. When resuming, a stage
+	#  that was still in the queue is attached to its old job instead of being submitted again. A job the scheduler refused (Or whose
+	#  job ID could not be read) is logged and its stage recorded as failed, see submit_failed()
+	def submit_job(self, jobFile, stage, dependsOn = None):
+		if self.in_flight(stage):
+			self.jobIDs[stage] = self.state.job_id(stage)
+			self.tracker.track(self.jobIDs[stage], stage)
+			self.reattached.append(stage)
+			self.logger.write("Re-attached to the " + stage + " job (" + str(self.jobIDs[stage]) + ") of the earlier run")
+			return self.jobIDs[stage]
+		Tools.popen(self.aSet, "chmod +x " + self.runDir + '/' + jobFile)
+		self.jobIDs[stage] = self.tracker.submit(jobFile, name = stage, cwd = self.runDir, dependsOn = dependsOn)
+		if self.submit_failed(stage):
+			self.logger.write("The " + stage + " job (" + jobFile + ") could not be submitted, see the JobTracker line above")
+			self.finish_stage(stage, False)
+			return None
+		self.state.submitted(stage, self.jobIDs[stage])
+		return self.jobIDs[stage]
+		
+	# submit_failed: True if the job of stage was not submitted. Nothing is submitted in debug mode, so it is never True there
+	def submit_failed(self, stage):
+		return self.jobIDs.get(stage) is None and self.aSet.fetch("debugmode") != '1'
+		
+	# in_flight: True if the run being resumed left the job of this stage behind, its log files must not be removed
+	def in_flight(self, stage):
+		return self.state.job_id(stage) is not None
+		
+	# stage_done: True if the stage completed in the run being resumed and its output is unchanged
+	def stage_done(self, stage):
+		if self.state.is_complete(stage):
+			self.logger.write(stage + " completed in an earlier run of this forecast, skipping")
+			return True
+		return False
+		
+	# stage_outputs: The files a stage produces, their checksums are kept in the run state
+	def stage_outputs(self, stage):
+		if stage == "geogrid":
+			return sorted(glob.glob(self.runDir + "/output/geo_em.d0*"))
+		elif stage.startswith("ungrib."):
+			return sorted(glob.glob(self.runDir + '/' + stage.split('.', 1)[1] + ":*"))
+		elif stage == "metgrid":
+			return sorted(glob.glob(self.runDir + "/output/met_em.d0*"))
+		elif stage in ["prerun", "real"]:
+			return sorted(glob.glob(self.runDir + "/output/wrfinput_d0*") + glob.glob(self.runDir + "/output/wrfbdy_d01"))
+		elif stage in ["wrf", "allocation"]:
+			return sorted(glob.glob(self.runDir + "/output/wrfout*"))
+		elif stage.startswith("wrf.seg"):
+			# The restart file the segment ends with, the next segment starts from it
+			segments = wrf_segments(self.aSet)
+			k = int(stage[len("wrf.seg"):])
+			if k >= len(segments) - 1:
+				return sorted(glob.glob(self.runDir + "/output/wrfout*"))
+			return sorted(glob.glob(self.runDir + "/output/wrfrst_d01_" + segments[k + 1][0].strftime('%Y-%m-%d_%H') + "*"))
+		return []
+		
+	# finish_stage: Records the result of a stage in the run state, and the runtime of a completed stage in the telemetry history (Nothing
+	#  is recorded in debug mode, no job was run). The runtime of a job picked up from an earlier run is not known and is left out.
+	def finish_stage(self, stage, result):
+		if(self.aSet.fetch("debugmode") == '1'):
+			return result
+		if result and stage != "allocation" and stage not in self.reattached:
+			self.history.record(stage, self.tracker.runtime(self.jobIDs.get(stage)))
+		return self.state.finished(stage, result, self.stage_outputs(stage))
+		
+	# job_hold: Returns a Wait() hold condition that is met once the job for stage has left the queue
+	def job_hold(self, stage, retCode = 3):
+		return {"jobTracker": self.tracker, "jobID": self.jobIDs.get(stage), "retCode": retCode}
+		
+	def job_left_queue(self, stage):
+		jobID = self.jobIDs.get(stage)
+		self.logger.write("The " + stage + " job (" + str(jobID) + ") left the queue without reporting success, state: " 
+						  + str(self.tracker.state(jobID)) + " " + self.tracker.reason(jobID))
 	
 	def run_geogrid(self):
+		if self.stage_done("geogrid"):
+			return True
 		Tools.Process.instance().Lock()
 		self.logger.write("run_geogrid(): Enter")
-		Tools.popen(self.aSet, "mv namelist.wps.geogrid " + self.wrfDir + '/' + self.startTime[0:8] + "/namelist.wps")
-		with Tools.cd(self.wrfDir + '/' + self.startTime[0:8]):				
-			Tools.popen(self.aSet, "chmod +x geogrid.job")
-			Tools.popen(self.aSet, self.scheduleParms.fetch()["subcmd"] + " geogrid.job " + self.scheduleParms.fetch()["cmdline"], storeOutput = False)
-			self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
-			# Now wait for the log files
-			try:
-				firstWait = [{"waitCommand": "(ls geogrid.log* && echo \"yes\") || echo \"no\"", "contains": "yes", "retCode": 1}]
-				wait1 = Wait.Wait(firstWait, timeDelay = 25)
-				wait1.hold()
-			except Wait.TimeExpiredException:
-				sys.exit("geogrid.exe job not completed, abort.")			
-			# Check for completion
-			self.logger.write("Log file detected, waiting for completion.")
-			try:
-				secondWait = [{"waitCommand": "tail -n 3 geogrid.log*", "contains": "Successful completion of program geogrid.exe", "retCode": 1},
-							  {"waitCommand": "tail -n 3 geogrid.log*", "contains": "fatal", "retCode": 2},
-							  {"waitCommand": "tail -n 3 geogrid.log*", "contains": "runtime", "retCode": 2},
-							  {"waitCommand": "tail -n 3 geogrid.log*", "contains": "error", "retCode": 2},]
-				wait2 = Wait.Wait(secondWait, timeDelay = 25)
-				wRC1 = wait2.hold()
-				if wRC1 == 1:
-					# Success condition, proceed to the next.
-					self.logger.write("Geogrid process sucessfully completed.")
-				elif wRC1 == 2:
-					self.logger.write("run_geogrid(): Exit (Failed, Code 2)")
-					Tools.Process.instance().Unlock()
-					return False
-			except Wait.TimeExpiredException:
-				sys.exit("geogrid.exe job not completed, abort.")					
-		self.logger.write("run_geogrid(): Exit")
+		Tools.popen(self.aSet, "mv namelist.wps.geogrid " + self.runDir + "/namelist.wps")
+		self.submit_job("geogrid.job", "geogrid")
+		if self.submit_failed("geogrid"):
+			self.logger.write("run_geogrid(): Exit (Failed)")
+			Tools.Process.instance().Unlock()
+			return False
+		self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
+		result = self.finish_stage("geogrid", self.monitor_geogrid())
+		self.logger.write("run_geogrid(): Exit" + ("" if result else " (Failed)"))
 		Tools.Process.instance().Unlock()
+		return result
+		
+	def monitor_geogrid(self):
+		# Now wait for the log files
+		try:
+			firstWait = [{"fileExists": self.runDir + "/geogrid.log*", "retCode": 1},
+						 self.job_hold("geogrid")]
+			wait1 = Wait.Wait(firstWait, timeDelay = 25)
+			if wait1.hold() == 3:
+				self.job_left_queue("geogrid")
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("geogrid.exe job not completed, abort.")			
+		# Check for completion
+		self.logger.write("Log file detected, waiting for completion.")
+		try:
+			secondWait = [{"logFile": self.runDir + "/geogrid.log*", "contains": "Successful completion of program geogrid.exe", "retCode": 1},
+						  {"logFile": self.runDir + "/geogrid.log*", "contains": "fatal", "lastLines": 3, "retCode": 2},
+						  {"logFile": self.runDir + "/geogrid.log*", "contains": "runtime", "lastLines": 3, "retCode": 2},
+						  {"logFile": self.runDir + "/geogrid.log*", "contains": "error", "lastLines": 3, "retCode": 2},
+						  self.job_hold("geogrid")]
+			wait2 = Wait.Wait(secondWait, timeDelay = 25)
+			wRC1 = wait2.hold()
+			if wRC1 == 1:
+				# Success condition, proceed to the next.
+				self.logger.write("Geogrid process sucessfully completed.")
+				self.cache_geo_em()
+				return True
+			elif wRC1 == 2:
+				self.logger.write("monitor_geogrid(): Failed, Code 2")
+			elif wRC1 == 3:
+				self.job_left_queue("geogrid")
+			return False
+		except Wait.TimeExpiredException:
+			sys.exit("geogrid.exe job not completed, abort.")					
 	
+	# domain_parts: The &geogrid block of namelist.wps.geogrid along with io_form_geogrid (And the geogrid rank count when the output
+	#  is split per rank), this describes the domain the geo_em and met_em files were made for
+	def domain_parts(self):
+		ioForm = Cache.namelist_value("namelist.wps.geogrid", "io_form_geogrid")
+		parts = Cache.namelist_block("namelist.wps.geogrid", "geogrid") + ["io_form_geogrid = " + str(ioForm)]
+		if ioForm == "102":
+			parts.append("ranks = " + str(int(self.aSet.fetch("num_geogrid_nodes")) * int(self.aSet.fetch("geogrid_mpi_ranks_per_node"))))
+		return parts
+		
+	# check_geo_em_cache: Looks up the geo_em files for the domain in namelist.wps.geogrid. On a hit the files are linked into the
+	#  output directory and geogrid is turned off, on a miss geogrid is turned on so the cache can be filled.
+	def check_geo_em_cache(self):
+		if not self.geoCache.enabled() or not os.path.exists("namelist.wps.geogrid"):
+			return False
+		self.geoKey = Cache.make_key(self.domain_parts())
+		if self.geoCache.has(self.geoKey):
+			self.geoCache.link(self.geoKey, self.runDir + "/output")
+			self.logger.write("geo_em cache hit (" + self.geoKey[:12] + "), geogrid will be skipped")
+			self.aSet.override("run_geogrid", '0')
+			return True
+		self.logger.write("geo_em cache miss (" + self.geoKey[:12] + "), geogrid will be run")
+		self.aSet.override("run_geogrid", '1')
+		return False
+		
+	# check_wps_cache: Looks up the ungrib and metgrid output of this run. The ungrib files of each extension are keyed by the data
+	#  source, initialization time, date range, &ungrib block and Vtable contents, the met_em files by the domain, the &metgrid block
+	#  and every ungrib key. Steps whose output is linked from the cache are listed in cachedSteps and left out of the job files.
+	def check_wps_cache(self):
+		self.cachedSteps = []
+		if self.aSet.fetch("run_preprocessing_jobs") != '1' or not os.path.exists("namelist.wps.geogrid"):
+			return self.cachedSteps
+		if not self.ungribCache.enabled() and not self.metCache.enabled():
+			return self.cachedSteps
+		i = 0
+		for ext in self.modelParms["FileExtentions"]:
+			nlFile = "namelist.wps." + ext
+			parts = ["ungrib", self.aSet.fetch("modeldata"), self.startTime, self.aSet.fetch("modeldataforecasthour"), ext,
+					 Cache.namelist_value(nlFile, "start_date"), Cache.namelist_value(nlFile, "end_date"), Cache.namelist_value(nlFile, "interval_seconds"),
+					 Cache.file_digest(self.aSet.fetch("headdir") + "vtables/" + self.modelParms["VTable"][i])] + Cache.namelist_block(nlFile, "ungrib")
+			self.ungribKeys[ext] = Cache.make_key(parts)
+			i += 1
+		metParts = ["metgrid"] + self.domain_parts() + Cache.namelist_block("namelist.wps.geogrid", "metgrid") + sorted(self.ungribKeys.values())
+		if Cache.namelist_value("namelist.wps.geogrid", "io_form_metgrid") == "102":
+			metParts.append("ranks = " + str(int(self.aSet.fetch("num_prerun_nodes")) * int(self.aSet.fetch("prerun_mpi_ranks_per_node"))))
+		self.metKey = Cache.make_key(metParts)
+		if self.metCache.has(self.metKey):
+			self.metCache.link(self.metKey, self.runDir + "/output")
+			self.logger.write("met_em cache hit (" + self.metKey[:12] + "), ungrib and metgrid will be skipped")
+			self.cachedSteps = ["ungrib." + ext for ext in self.ungribKeys] + ["metgrid"]
+			return self.cachedSteps
+		for ext in self.modelParms["FileExtentions"]:
+			if self.ungribCache.has(self.ungribKeys[ext]):
+				self.ungribCache.link(self.ungribKeys[ext], self.runDir)
+				self.logger.write("ungrib cache hit for " + ext + " (" + self.ungribKeys[ext][:12] + "), ungrib will be skipped for this extension")
+				self.cachedSteps.append("ungrib." + ext)
+		return self.cachedSteps
+		
+	def ungrib_cached(self):
+		return all(("ungrib." + ext) in self.cachedSteps for ext in self.modelParms["FileExtentions"])
+		
+	def cache_ungrib(self, ext):
+		if ext in self.ungribKeys and ("ungrib." + ext) not in self.cachedSteps:
+			self.ungribCache.store(self.ungribKeys[ext], sorted(glob.glob(self.runDir + '/' + ext + ":*")), "ungrib " + ext + " " + self.startTime)
+			
+	def cache_met_em(self):
+		if self.metKey is not None and "metgrid" not in self.cachedSteps:
+			self.metCache.store(self.metKey, sorted(glob.glob(self.runDir + "/output/met_em.d0*")), "metgrid " + self.startTime)
+			
+	# cache_wps_output: Stores the ungrib and metgrid output once metgrid has completed
+	def cache_wps_output(self):
+		for ext in self.modelParms["FileExtentions"]:
+			self.cache_ungrib(ext)
+		self.cache_met_em()
+		
+	# cache_geo_em: Stores the geo_em files of a successful geogrid run
+	def cache_geo_em(self):
+		if self.geoKey is None:
+			return
+		self.geoCache.store(self.geoKey, sorted(glob.glob(self.runDir + "/output/geo_em.d0*")), "geogrid " + self.startTime)
+			
 	def run_preprocessing(self):	
+		if self.stage_done("prerun"):
+			return True
 		#ungrib.exe needs to run in the data directory
 		Tools.Process.instance().Lock()
 		self.logger.write("run_preprocessing(): Enter")
-		Tools.popen(self.aSet, "cp " + self.aSet.fetch("headdir") + "vtables/Vtable." + self.aSet.fetch("modeldata") + "* " + self.wrfDir + '/' + self.startTime[0:8])
-		Tools.popen(self.aSet, "mv namelist.wps* " + self.wrfDir + '/' + self.startTime[0:8])
-		mParms = self.modelParms.fetch()
-		with Tools.cd(self.wrfDir + '/' + self.startTime[0:8]):				
-			Tools.popen(self.aSet, "chmod +x prerun.job")
-			Tools.popen(self.aSet, self.scheduleParms.fetch()["subcmd"] + " prerun.job " + self.scheduleParms.fetch()["cmdline"], storeOutput = False)
-			self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
-			# Now wait for the log files
-			try:
-				firstWait = [{"waitCommand": "(ls ungrib.log* && echo \"yes\") || echo \"no\"", "contains": "yes", "retCode": 1}]
-				wait1 = Wait.Wait(firstWait, timeDelay = 25)
-				wait1.hold()
-			except Wait.TimeExpiredException:
-				sys.exit("ungrib.exe job not completed, abort.")			
-			# Check for completion
-			self.logger.write("Log file detected, waiting for completion.")
+		Tools.popen(self.aSet, "cp " + self.aSet.fetch("headdir") + "vtables/Vtable." + self.aSet.fetch("modeldata") + "* " + self.runDir)
+		Tools.popen(self.aSet, "mv namelist.wps* " + self.runDir)
+		self.submit_job("prerun.job", "prerun")
+		if self.submit_failed("prerun"):
+			self.logger.write("run_preprocessing(): Exit (Failed)")
+			Tools.Process.instance().Unlock()
+			return False
+		self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
+		result = self.finish_stage("prerun", self.monitor_preprocessing())
+		self.logger.write("run_preprocessing(): Exit" + ("" if result else " (Failed)"))
+		Tools.Process.instance().Unlock()
+		return result
+		
+	# monitor_preprocessing: Follows the prerun job. When collectLogs is False the real.exe logs are left in place for the
+	#  next job in a chain (wrf.job moves them to real_log.txt before starting wrf.exe)
+	def monitor_preprocessing(self, collectLogs = True):
+		if self.ungrib_cached():
+			self.logger.write("Ungrib output was linked from the cache, ungrib is not part of the prerun job.")
+		elif not self.monitor_ungrib("prerun", self.runDir + "/ungrib.log*"):
+			return False
+		# Success condition, proceed to the next.
+		self.logger.write("Ungrib process sucessfully completed, starting metgrid process.")
+		if "metgrid" in self.cachedSteps:
+			self.logger.write("met_em files were linked from the cache, metgrid is not part of the prerun job.")
+		elif not self.monitor_metgrid("prerun"):
+			return False
+		self.cache_wps_output()
+		# Success Condition, proceed to real.exe
+		self.logger.write("Metgrid process sucessfully completed, starting real process.")
+		return self.monitor_real("prerun", collectLogs)
+		
+	# monitor_ungrib: Waits for ungrib.exe to report in logPath, stage is the job ungrib is running in. When readyFile is given
+	#  the job moves the ungrib output in place after ungrib.exe completes and touches readyFile once it is done.
+	def monitor_ungrib(self, stage, logPath, readyFile = None):
+		# Now wait for the log files
+		try:
+			firstWait = [{"fileExists": logPath, "retCode": 1},
+						 self.job_hold(stage)]
+			wait1 = Wait.Wait(firstWait, timeDelay = 25)
+			if wait1.hold() == 3:
+				self.job_left_queue(stage)
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("ungrib.exe job not completed, abort.")			
+		# Check for completion
+		self.logger.write("Log file detected, waiting for completion.")
+		try:
+			secondWait = [{"logFile": logPath, "contains": "Successful completion of program ungrib.exe", "retCode": 1},
+						  {"logFile": logPath, "contains": "fatal", "lastLines": 3, "retCode": 2},
+						  {"logFile": logPath, "contains": "runtime", "lastLines": 3, "retCode": 2},
+						  {"logFile": logPath, "contains": "error", "lastLines": 3, "retCode": 2},
+						  self.job_hold(stage)]
+			wait2 = Wait.Wait(secondWait, timeDelay = 25)
+			wRC1 = wait2.hold()
+			if wRC1 == 2:
+				self.logger.write("monitor_ungrib(): Failed at ungrib, Code 2")
+				return False
+			elif wRC1 == 3:
+				self.job_left_queue(stage)
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("ungrib.exe job not completed, abort.")	
+		if readyFile is not None:
 			try:
-				secondWait = [{"waitCommand": "tail -n 3 ungrib.log*", "contains": "Successful completion of program ungrib.exe", "retCode": 1},
-							  {"waitCommand": "tail -n 3 ungrib.log*", "contains": "fatal", "retCode": 2},
-							  {"waitCommand": "tail -n 3 ungrib.log*", "contains": "runtime", "retCode": 2},
-							  {"waitCommand": "tail -n 3 ungrib.log*", "contains": "error", "retCode": 2},]
-				wait2 = Wait.Wait(secondWait, timeDelay = 25)
-				wRC1 = wait2.hold()
-				if wRC1 == 1:
-					# Success condition, proceed to the next.
-					self.logger.write("Ungrib process sucessfully completed, starting metgrid process.")
-					try:
-						thirdWait = [{"waitCommand": "(ls metgrid.log* && echo \"yes\") || echo \"no\"", "contains": "yes", "retCode": 1}]
-						wait3 = Wait.Wait(thirdWait, timeDelay = 25)
-						wait3.hold()
-					except Wait.TimeExpiredException:
-						sys.exit("metgrid.exe job not completed, abort.")
-					self.logger.write("Log file detected, waiting for completion.")
-					#Now wait for the output file to be completed
-					try:
-						fourthWait = [{"waitCommand": "tail -n 3 metgrid.log.0000", "contains": "Successful completion of program metgrid.exe", "retCode": 1},
-									  {"waitCommand": "tail -n 3 metgrid.log.0000", "contains": "fatal", "retCode": 2},
-									  {"waitCommand": "tail -n 3 metgrid.log.0000", "contains": "runtime", "retCode": 2},
-									  {"waitCommand": "tail -n 3 metgrid.log.0000", "contains": "error", "retCode": 2},
-									  {"waitCommand": "tail -n 3 metgrid.log.0000", "contains": "ERROR:", "retCode": 2},]
-						wait4 = Wait.Wait(fourthWait, timeDelay = 25)
-						wRC2 = wait4.hold()
-						if wRC2 == 1:
-							# Success Condition, proceed to real.exe
-							self.logger.write("Metgrid process sucessfully completed, starting real process.")
-							Tools.popen(self.aSet, "mv metgrid.log.0000 metgrid_log.txt")
-							Tools.popen(self.aSet, "rm metgrid.log.*")
-							try:
-								fifthWait = [{"waitCommand": "(ls output/rsl.out.0000 && echo \"yes\") || echo \"no\"", "contains": "yes", "retCode": 1}]
-								wait5 = Wait.Wait(fifthWait, timeDelay = 25)
-								wait5.hold()			
-							except Wait.TimeExpiredException:
-								sys.exit("real.exe job not completed, abort.")
-							self.logger.write("Log file detected, waiting for completion.")
-							#Now wait for the output file to be completed
-							try:
-								sixthWait = [{"waitCommand": "tail -n 3 output/rsl.out.0000", "contains": "SUCCESS COMPLETE REAL_EM", "retCode": 1},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "FATAL CALLED", "retCode": 2},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "FATAL", "retCode": 2},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "RUNTIME", "retCode": 2},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "runtime", "retCode": 2},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "error", "retCode": 2},
-											  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "ERROR", "retCode": 2},]
-								wait6 = Wait.Wait(sixthWait, timeDelay = 60)
-								wRC3 = wait6.hold()
-								if wRC3 == 2:
-									self.logger.write("run_preprocessing(): Exit (Failed at real, Code 2)")
-									Tools.Process.instance().Unlock()
-									return False
-								else:
-									# Copy the log files.
-									Tools.popen(self.aSet, "mv output/rsl.out.0000 real_log.txt")
-									Tools.popen(self.aSet, "mv output/rsl.error.0000 real_error_log.txt")									
-									#Validate the presense of the two files.
-									file1 = os.popen("(ls output/wrfinput_d01 && echo \"yes\") || echo \"no\"").read()
-									file2 = os.popen("(ls output/wrfbdy_d01 && echo \"yes\") || echo \"no\"").read()
-									if("yes" in file1 and "yes" in file2):
-										self.logger.write("run_preprocessing(): Exit")
-										Tools.Process.instance().Unlock()
-										return True
-									self.logger.write("run_preprocessing(): Exit (Failed at real, did not find wrfinput_d01 and wrfbdy_d01")
-									Tools.Process.instance().Unlock()
-									return False					
-							except Wait.TimeExpiredException:
-								sys.exit("real.exe job not completed, abort.")							
-						elif wRC2 == 2:
-							self.logger.write("run_preprocessing(): Exit (Failed at metgrid, Code 2)")
-							Tools.Process.instance().Unlock()
-							return False
-					except Wait.TimeExpiredException:
-						sys.exit("metgrid.exe job not completed, abort.")					
-				elif wRC1 == 2:
-					self.logger.write("run_preprocessing(): Exit (Failed at ungrib, Code 2)")
-					Tools.Process.instance().Unlock()
+				thirdWait = [{"fileExists": readyFile, "retCode": 1},
+							 self.job_hold(stage)]
+				wait3 = Wait.Wait(thirdWait, timeDelay = 10)
+				if wait3.hold() == 3 and not os.path.exists(readyFile):
+					self.job_left_queue(stage)
 					return False
 			except Wait.TimeExpiredException:
-				sys.exit("ungrib.exe job not completed, abort.")			
-		self.logger.write("run_preprocessing(): Failed to enter run directory")
-		Tools.Process.instance().Unlock()
-		return False	
+				sys.exit("ungrib.exe job not completed, abort.")
+		return True
+		
+	def monitor_metgrid(self, stage):
+		try:
+			thirdWait = [{"fileExists": self.runDir + "/metgrid.log*", "retCode": 1},
+						 self.job_hold(stage)]
+			wait3 = Wait.Wait(thirdWait, timeDelay = 25)
+			if wait3.hold() == 3:
+				self.job_left_queue(stage)
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("metgrid.exe job not completed, abort.")
+		self.logger.write("Log file detected, waiting for completion.")
+		#Now wait for the output file to be completed
+		try:
+			fourthWait = [{"logFile": self.runDir + "/metgrid.log.0000", "contains": "Successful completion of program metgrid.exe", "retCode": 1},
+						  {"logFile": self.runDir + "/metgrid.log.0000", "contains": "fatal", "lastLines": 3, "retCode": 2},
+						  {"logFile": self.runDir + "/metgrid.log.0000", "contains": "runtime", "lastLines": 3, "retCode": 2},
+						  {"logFile": self.runDir + "/metgrid.log.0000", "contains": "error", "lastLines": 3, "retCode": 2},
+						  {"logFile": self.runDir + "/metgrid.log.0000", "contains": "ERROR:", "lastLines": 3, "retCode": 2},
+						  self.job_hold(stage)]
+			wait4 = Wait.Wait(fourthWait, timeDelay = 25)
+			wRC2 = wait4.hold()
+			if wRC2 == 2:
+				self.logger.write("monitor_metgrid(): Failed at metgrid, Code 2")
+				return False
+			elif wRC2 == 3:
+				self.job_left_queue(stage)
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("metgrid.exe job not completed, abort.")
+		Tools.popen(self.aSet, "mv " + self.runDir + "/metgrid.log.0000 " + self.runDir + "/metgrid_log.txt")
+		Tools.popen(self.aSet, "rm " + self.runDir + "/metgrid.log.*")
+		return True
+		
+	def monitor_real(self, stage, collectLogs = True):
+		try:
+			fifthWait = [{"fileExists": self.runDir + "/output/rsl.out.0000", "retCode": 1},
+						 {"fileExists": self.runDir + "/real_log.txt", "retCode": 1},
+						 self.job_hold(stage)]
+			wait5 = Wait.Wait(fifthWait, timeDelay = 25)
+			if wait5.hold() == 3:
+				self.job_left_queue(stage)
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("real.exe job not completed, abort.")
+		self.logger.write("Log file detected, waiting for completion.")
+		#Now wait for the output file to be completed
+		try:
+			sixthWait = [{"logFile": self.runDir + "/output/rsl.out.0000", "contains": "SUCCESS COMPLETE REAL_EM", "retCode": 1},
+						  {"logFile": self.runDir + "/real_log.txt", "contains": "SUCCESS COMPLETE REAL_EM", "retCode": 1},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "FATAL CALLED", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "FATAL", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "RUNTIME", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "runtime", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "error", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "ERROR", "lastLines": 5, "retCode": 2},
+						  self.job_hold(stage)]
+			wait6 = Wait.Wait(sixthWait, timeDelay = 60)
+			wRC3 = wait6.hold()
+			if wRC3 == 2:
+				self.logger.write("monitor_real(): Failed at real, Code 2")
+				self.rsl.inspect("real")
+				return False
+			elif wRC3 == 3:
+				self.job_left_queue(stage)
+				self.rsl.inspect("real")
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("real.exe job not completed, abort.")	
+		# Copy the log files.
+		if collectLogs:
+			self.rsl.collect("real", {"rsl.out.0000": self.runDir + "/real_log.txt", "rsl.error.0000": self.runDir + "/real_error_log.txt"})
+		#Validate the presense of the two files.
+		if(self.have_wrf_inputs()):
+			return True
+		self.logger.write("monitor_real(): Failed at real, did not find wrfinput_d01 and wrfbdy_d01")
+		return False
+		
+	# prepare_stages: Moves the namelist and Vtable files into the run directory before the stages of the pipeline start, this
+	#  is done up front as the stages run at the same time and must not depend on the working directory of the script
+	def prepare_stages(self):
+		if(self.aSet.fetch("run_geogrid") == '1'):
+			Tools.popen(self.aSet, "mv namelist.wps.geogrid " + self.runDir + "/namelist.wps")
+		if(self.aSet.fetch("run_preprocessing_jobs") == '1'):
+			Tools.popen(self.aSet, "cp " + self.aSet.fetch("headdir") + "vtables/Vtable." + self.aSet.fetch("modeldata") + "* " + self.runDir)
+			Tools.popen(self.aSet, "mv namelist.wps* " + self.runDir)
+			
+	# run_geogrid_stage: The pipeline version of run_geogrid(), the namelist was already moved by prepare_stages()
+	def run_geogrid_stage(self):
+		if self.stage_done("geogrid"):
+			return True
+		self.submit_job("geogrid.job", "geogrid")
+		if self.submit_failed("geogrid"):
+			return False
+		self.logger.write("run_geogrid_stage(): Job has been submitted to the queue, waiting for log file to appear.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			return True
+		return self.finish_stage("geogrid", self.monitor_geogrid())
+			
+	# run_ungrib: Runs ungrib.exe for one file extension of the model data in its own directory (ungrib_<ext>), so the
+	#  extensions can be processed at the same time
+	def run_ungrib(self, ext):
+		stage = "ungrib." + ext
+		if self.stage_done(stage):
+			return True
+		if not self.in_flight(stage):
+			Tools.popen(self.aSet, "rm -rf " + self.runDir + "/ungrib_" + ext)
+		self.submit_job("ungrib_" + ext + ".job", stage)
+		if self.submit_failed(stage):
+			return False
+		self.logger.write("run_ungrib(" + ext + "): Job has been submitted to the queue, waiting for log file to appear.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			return True
+		if not self.monitor_ungrib(stage, self.runDir + "/ungrib_" + ext + "/ungrib.log", self.runDir + "/ungrib_" + ext + "/output_ready"):
+			return self.finish_stage(stage, False)
+		self.cache_ungrib(ext)
+		return self.finish_stage(stage, True)
+		
+	def run_metgrid(self):
+		if self.stage_done("metgrid"):
+			return True
+		if not self.in_flight("metgrid"):
+			Tools.popen(self.aSet, "rm " + self.runDir + "/metgrid.log*")
+		self.submit_job("metgrid.job", "metgrid")
+		if self.submit_failed("metgrid"):
+			return False
+		self.logger.write("run_metgrid(): Job has been submitted to the queue, waiting for log file to appear.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			return True
+		if not self.monitor_metgrid("metgrid"):
+			return self.finish_stage("metgrid", False)
+		self.cache_met_em()
+		return self.finish_stage("metgrid", True)
+		
+	def run_real(self):
+		if self.stage_done("real"):
+			return True
+		if not self.in_flight("real"):
+			self.rsl.collect("previous")
+			Tools.popen(self.aSet, "rm -f " + self.runDir + "/real_log.txt")
+		self.submit_job("real.job", "real")
+		if self.submit_failed("real"):
+			return False
+		self.logger.write("run_real(): Job has been submitted to the queue, waiting for log file to appear.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			return True
+		return self.finish_stage("real", self.monitor_real("real"))
 		
 	def run_wrf(self):
+		if self.stage_done("wrf"):
+			return True
 		Tools.Process.instance().Lock()
 		self.logger.write("run_wrf(): Enter")
-		with Tools.cd(self.wrfDir + '/' + self.startTime[0:8]):
-			# Do a quick file check to ensure wrf can run
-			file1 = os.popen("(ls output/wrfinput_d01 && echo \"yes\") || echo \"no\"").read()
-			file2 = os.popen("(ls output/wrfbdy_d01 && echo \"yes\") || echo \"no\"").read()
-			if(not ("yes" in file1 and "yes" in file2) and (not self.aSet.fetch("debugmode") == '1')):
-				self.logger.write("run_wrf(): Exit (Failed, cannot run wrf.exe without wrfinput_d01 and wrfbdy_d01)")
-				Tools.Process.instance().Unlock()
+		# Do a quick file check to ensure wrf can run
+		if(not self.have_wrf_inputs() and (not self.aSet.fetch("debugmode") == '1')):
+			self.logger.write("run_wrf(): Exit (Failed, cannot run wrf.exe without wrfinput_d01 and wrfbdy_d01)")
+			Tools.Process.instance().Unlock()
+			return False
+		if(self.aSet.fetch("io_benchmark") in ['1', '2'] and not self.stage_done("iobench")):
+			self.finish_stage("iobench", self.run_io_benchmark())
+		if len(wrf_segments(self.aSet)) > 1:
+			result = self.finish_stage("wrf", self.run_wrf_segments())
+			self.logger.write("run_wrf(): Exit" + ("" if result else " (Failed)"))
+			Tools.Process.instance().Unlock()
+			return result
+		# Archive the old log files, wrf.exe replaces them
+		if not self.in_flight("wrf"):
+			self.rsl.collect("previous")
+		# submit the job
+		self.submit_job("wrf.job", "wrf")
+		if self.submit_failed("wrf"):
+			self.logger.write("run_wrf(): Exit (Failed)")
+			Tools.Process.instance().Unlock()
+			return False
+		self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			self.logger.write("Debug mode is active, skipping")
+			Tools.Process.instance().Unlock()
+			return True
+		result = self.finish_stage("wrf", self.monitor_wrf())
+		self.logger.write("run_wrf(): Exit" + ("" if result else " (Failed)"))
+		Tools.Process.instance().Unlock()
+		return result
+		
+	# have_wrf_inputs: True if real.exe left wrfinput_d01 (One file per rank with real_io_form_input 102) and wrfbdy_d01 behind
+	def have_wrf_inputs(self):
+		return len(glob.glob(self.runDir + "/output/wrfinput_d01*")) > 0 and os.path.isfile(self.runDir + "/output/wrfbdy_d01")
+
+	# run_io_benchmark: Runs iobench.job (io_benchmark) and reports the time wrf.exe took to read its input and write a restart file under
+	#  each io_form, with io_benchmark 2 the fastest forms are used by the forecast (See IOForms.IOBenchmark). A failed benchmark is
+	#  logged, the forecast runs with the forms it was set up with.
+	def run_io_benchmark(self):
+		bench = IOForms.IOBenchmark(self.aSet, self.runDir)
+		forms = bench.write_namelists()
+		Tools.popen(self.aSet, "rm -f " + self.runDir + "/iobench_*.log")
+		self.submit_job("iobench.job", "iobench")
+		if self.submit_failed("iobench"):
+			return False
+		self.logger.write("The I/O benchmark job has been submitted to the queue (io_form " + ", ".join(forms) + "), waiting for it to complete.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			return True
+		try:
+			Wait.Wait([self.job_hold("iobench", retCode = 1)], timeDelay = 60).hold()
+		except Wait.TimeExpiredException:
+			sys.exit("I/O benchmark job not completed, abort.")
+		best = bench.report()
+		if not best:
+			self.logger.write("The I/O benchmark did not time any stream under more than one io_form, see iobench_<form>.log in the run directory")
+			return False
+		if self.aSet.fetch("io_benchmark") == '2':
+			bench.apply(best)
+		else:
+			self.logger.write("The fastest I/O forms: " + ", ".join(entry + " " + form for entry, form in sorted(best.items())) + " (Set io_benchmark 2 to use them)")
+		return True
+
+	# monitor_wrf: Follows the wrf job. When it fails, it is submitted again if prepare_wrf_retry() allows it
+	def monitor_wrf(self, startMarker = None):
+		while True:
+			result = self.follow_wrf(startMarker)
+			if result or not self.prepare_wrf_retry():
+				return result
+			startMarker = None
+			# The cancelled job is recorded as failed, so submit_job() does not attach to it again
+			self.finish_stage("wrf", False)
+			self.submit_job("wrf.job", "wrf")
+			if self.submit_failed("wrf"):
 				return False
-			# Remove the old log files as these are no longer needed
-			Tools.popen(self.aSet, "rm output/rsl.out.*")
-			Tools.popen(self.aSet, "rm output/rsl.error.*")	
-			# chmod the job and submit
-			Tools.popen(self.aSet, "chmod +x wrf.job")			
-			Tools.popen(self.aSet, self.scheduleParms.fetch()["subcmd"] + " wrf.job " + self.scheduleParms.fetch()["cmdline"], storeOutput = False)
 			self.logger.write("Job has been submitted to the queue, waiting for log file to appear.")
-			if(self.aSet.fetch("debugmode") == '1'):
-				self.logger.write("Debug mode is active, skipping")
-				Tools.Process.instance().Unlock()
-				return True			
-			#Submit a wait condition for the file to appear
-			try:
-				firstWait = [{"waitCommand": "(ls output/rsl.out.0000 && echo \"yes\") || echo \"no\"", "contains": "yes", "retCode": 1}]
-				wait1 = Wait.Wait(firstWait, timeDelay = 25)
-				wait1.hold()			
-			except Wait.TimeExpiredException:
-				sys.exit("wrf.exe job not completed, abort.")
-			self.logger.write("Log file detected, waiting for completion.")
-			#Now wait for the output file to be completed (Note: Allow 7 days from the output file first appearing to run)
-			try:
-				secondWait = [{"waitCommand": "tail -n 1 output/rsl.out.0000", "contains": "SUCCESS COMPLETE WRF", "retCode": 1},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "FATAL CALLED", "retCode": 2},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "FATAL", "retCode": 2},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "RUNTIME", "retCode": 2},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "runtime", "retCode": 2},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "error", "retCode": 2},
-							  {"waitCommand": "tail -n 5 output/rsl.error.0000", "contains": "ERROR", "retCode": 2},]
-				# Note: I have the script checking the files once every three minutes so we don't stack five calls rapidly, this can be modified later if needed.
-				wait2 = Wait.Wait(secondWait, timeDelay = 180)
-				wRC = wait2.hold()
-				if wRC == 2:
-					self.logger.write("run_wrf(): Exit (Failed, Code 2)")
-					Tools.Process.instance().Unlock()
+		
+	# follow_wrf: Follows a single run of the wrf job. In a job chain, the rsl files of real.exe may still be present, so the wait
+	#  starts once wrf.job has created startMarker (After moving those files away)
+	def follow_wrf(self, startMarker = None):
+		#Submit a wait condition for the file to appear
+		try:
+			firstWait = [{"fileExists": self.runDir + "/output/rsl.out.0000" if startMarker is None else startMarker, "retCode": 1},
+						 self.job_hold("wrf")]
+			wait1 = Wait.Wait(firstWait, timeDelay = 25)
+			if wait1.hold() == 3:
+				self.job_left_queue("wrf")
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("wrf.exe job not completed, abort.")
+		self.logger.write("Log file detected, waiting for completion.")
+		self.timing.start(self.wrf_deadline(self.tracker.started.get(self.jobIDs.get("wrf"))))
+		self.stability.start(self.jobIDs.get("wrf"))
+		#Now wait for the output file to be completed (Note: Allow 7 days from the output file first appearing to run)
+		try:
+			secondWait = [{"logFile": self.runDir + "/output/rsl.out.0000", "contains": "SUCCESS COMPLETE WRF", "retCode": 1},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "FATAL CALLED", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "FATAL", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "RUNTIME", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "runtime", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "error", "lastLines": 5, "retCode": 2},
+						  {"logFile": self.runDir + "/output/rsl.error.0000", "contains": "ERROR", "lastLines": 5, "retCode": 2},
+						  self.job_hold("wrf")]
+			# Note: The logs are tailed in-process once every three minutes, inotify (When available) starts the check early when the rsl files are closed.
+			wait2 = Wait.Wait(secondWait, timeDelay = 180)
+			wRC = wait2.hold()
+			if wRC == 2:
+				self.logger.write("monitor_wrf(): Failed, Code 2")
+				self.rsl.inspect("wrf")
+				return False
+			elif wRC == 3:
+				self.job_left_queue("wrf")
+				self.rsl.inspect("wrf")
+				return False
+		except Wait.TimeExpiredException:
+			sys.exit("wrf.exe job not completed, abort.")	
+		finally:
+			self.timing.stop()
+			self.stability.stop()
+		self.collect_wrf_logs()
+		return True
+		
+	# prepare_wrf_retry: Decides if a failed wrf job (Or the job of a segment of wrf_segments) runs again and prepares its namelist. A run the
+	#  StabilityMonitor cancelled as unstable runs again with a smaller time step when wrf_stability_action is resubmit (Up to
+	#  wrf_stability_retries times), any other failure is left to Recovery (Up to wrf_recovery_attempts times).
+	def prepare_wrf_retry(self, segment = None):
+		if segment is None:
+			stage = "wrf"
+			namelist = self.runDir + "/output/namelist.input.wrf"
+			walltime = int(self.aSet.fetch("wrf_walltime"))
+		else:
+			stage = segment_stage(segment)
+			namelist = self.runDir + "/output/namelist.input.wrf.seg" + str(segment)
+			walltime = segment_walltime(self.aSet, wrf_segments(self.aSet)[segment][1])
+		if self.stability.reason is not None and self.stability.action() != "warn":
+			return self.stability.should_resubmit() and self.stability.prepare_resubmit(namelist, useRestart = segment is None)
+		self.end_job(stage)
+		if not self.recovery.prepare_retry(self.jobIDs.get(stage), walltime, namelist, useRestart = segment is None,
+										   index = self.segmentIndex if segment is not None else None):
+			return False
+		if segment is not None:
+			write_segment_namelists(self.aSet, self.runDir + "/output/namelist.input.wrf")
+		return True
+
+	# end_job: Makes sure the job of a stage has left the queue (IE: wrf.exe reported FATAL but the job is still winding down), it is
+	#  cancelled if it has not, so it cannot write to the output directory once the next one starts
+	def end_job(self, stage):
+		jobID = self.jobIDs.get(stage)
+		if jobID is None or self.tracker.isTerminal(jobID):
+			return
+		self.tracker.cancel(jobID)
+		try:
+			Wait.Wait([self.job_hold(stage)], abortTime = 1800, timeDelay = 30).hold()
+		except Wait.TimeExpiredException:
+			self.logger.write("The " + stage + " job (" + str(jobID) + ") is still in the queue 30 minutes after it was cancelled")
+
+	# wrf_deadline: When wrf_walltime (Or the given walltime in minutes) runs out for a wrf.exe run that began at the given time (Seconds since the epoch)
+	def wrf_deadline(self, began, walltime = None):
+		if began is None:
+			return None
+		return began + int(walltime if walltime is not None else self.aSet.fetch("wrf_walltime")) * 60
+		
+	def collect_wrf_logs(self):
+		self.rsl.collect("wrf", {"rsl.out.0000": self.runDir + "/wrf_log.txt", "rsl.error.0000": self.runDir + "/wrf_error_log.txt"})
+
+	# run_wrf_segments: Runs a restart-chunked forecast (wrf_segments). Every segment is its own job (wrf_seg<k>.job), all of them are
+	#  submitted at once, each held by the scheduler until the one before it completes. A segment that completed in an earlier run is
+	#  not run again, so after a failure only the segment that failed and the ones after it are lost.
+	def run_wrf_segments(self):
+		segments = wrf_segments(self.aSet)
+		stages = [segment_stage(k) for k in range(len(segments))]
+		done = [self.stage_done(stage) for stage in stages]
+		self.logger.write("Running the forecast in " + str(len(segments)) + " segments of " + str(segments[0][1]) + " hours (" + str(done.count(True)) + " already completed)")
+		if not any(self.in_flight(stage) for stage in stages):
+			self.rsl.collect("previous")
+		if not self.submit_segments(segments, done, 0):
+			self.cancel_segments(stages, done, 0)
+			return False
+		self.logger.write("The segment jobs have been submitted to the queue, following them in order.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			self.logger.write("Debug mode is active, skipping")
+			return True
+		for k, stage in enumerate(stages):
+			if done[k]:
+				continue
+			while True:
+				result = self.follow_segment(k, segments)
+				if result or not self.prepare_wrf_retry(k):
+					break
+				# The segments after this one were held on the cancelled job, they are submitted again behind the new one
+				self.cancel_segments(stages, done, k + 1)
+				self.finish_stage(stage, False)
+				if not self.submit_segments(segments, done, k):
+					self.cancel_segments(stages, done, k)
 					return False
-				else:
-					Tools.popen(self.aSet, "mv output/rsl.out.0000 wrf_log.txt")
-					Tools.popen(self.aSet, "mv output/rsl.error.0000 wrf_error_log.txt")
-					Tools.popen(self.aSet, "rm output/rsl.out.*")
-					Tools.popen(self.aSet, "rm output/rsl.error.*")					
-					self.logger.write("run_wrf(): Exit")
-					Tools.Process.instance().Unlock()
-					return True				
-			except Wait.TimeExpiredException:
-				sys.exit("wrf.exe job not completed, abort.")				
-		self.logger.write("run_wrf(): Failed to enter run directory")
+			if not self.finish_stage(stage, result):
+				self.logger.write("Segment " + str(k) + " failed, the forecast has completed up to " + segments[k][0].strftime('%Y-%m-%d %H:%M') + " UTC")
+				self.cancel_segments(stages, done, k + 1)
+				return False
+		return True
+
+	# cancel_segments: Cancels the jobs of the segments from the first-th on that have not completed, they are recorded as failed so a
+	#  later submit_job() does not attach to them again
+	def cancel_segments(self, stages, done, first):
+		for j in range(first, len(stages)):
+			if not done[j] and self.jobIDs.get(stages[j]) is not None:
+				self.tracker.cancel(self.jobIDs.get(stages[j]))
+				self.finish_stage(stages[j], False)
+
+	# submit_segments: Submits the jobs of the segments from the first-th on that have not completed, each held on the one before it.
+	#  Stops at the first job that could not be submitted (The ones after it would not be held) and returns False
+	def submit_segments(self, segments, done, first):
+		lastJob = None
+		for k in range(first, len(segments)):
+			if done[k]:
+				continue
+			stage = segment_stage(k)
+			if not self.in_flight(stage):
+				Tools.popen(self.aSet, "rm -rf " + self.runDir + "/wrf_seg" + str(k))
+			lastJob = self.submit_job("wrf_seg" + str(k) + ".job", stage, dependsOn = [lastJob])
+			if self.submit_failed(stage):
+				return False
+		return True
+
+	# follow_segment: Follows the job of one segment. The job moves its rsl files to wrf_seg<k> and writes the exit code of wrf.exe
+	#  there before it ends, the next segment can start as soon as it does, so the end of the segment is read from that directory.
+	def follow_segment(self, k, segments):
+		stage = segment_stage(k)
+		segDir = self.runDir + "/wrf_seg" + str(k)
+		start, hours = segments[k]
+		walltime = segment_walltime(self.aSet, hours)
+		try:
+			firstWait = [{"fileExists": segDir + "/exit_code", "retCode": 2},
+						 {"fileExists": self.runDir + "/output/rsl.out.0000", "retCode": 1},
+						 self.job_hold(stage)]
+			wait1 = Wait.Wait(firstWait, timeDelay = 25)
+			wRC = wait1.hold()
+			if wRC == 1:
+				self.logger.write("Segment " + str(k) + " has started (" + start.strftime('%Y-%m-%d %H:%M') + " UTC, " + str(hours) + " hours), waiting for completion.")
+				try:
+					self.timing.start(self.wrf_deadline(self.tracker.started.get(self.jobIDs.get(stage)), walltime), reset = (k == 0),
+									  segmentEnd = start + datetime.timedelta(hours = hours), walltime = walltime)
+					self.stability.start(self.jobIDs.get(stage))
+					secondWait = [{"fileExists": segDir + "/exit_code", "retCode": 1}, self.job_hold(stage)]
+					Wait.Wait(secondWait, timeDelay = 60).hold()
+				finally:
+					self.timing.stop()
+					self.stability.stop()
+		except Wait.TimeExpiredException:
+			sys.exit("wrf.exe job not completed, abort.")
+		self.segmentIndex = None
+		if not os.path.isfile(segDir + "/exit_code"):
+			self.job_left_queue(stage)
+			self.rsl.inspect("wrf_seg" + str(k))
+			return False
+		with open(segDir + "/exit_code", 'r') as source_file:
+			code = source_file.read().strip()
+		keep = {"rsl.out.0000": self.runDir + "/wrf_log_seg" + str(k) + ".txt", "rsl.error.0000": self.runDir + "/wrf_error_log_seg" + str(k) + ".txt"}
+		self.segmentIndex = RslLogs.RslLogs(self.aSet, self.runDir, logDir = segDir).collect("wrf_seg" + str(k), keep)
+		Tools.popen(self.aSet, "rm -rf " + segDir)
+		if code != "0":
+			self.logger.write("Segment " + str(k) + " failed, wrf.exe did not report success (Code " + code + ")")
+			return False
+		if k == len(segments) - 1:
+			Tools.popen(self.aSet, "cp " + keep["rsl.out.0000"] + " " + self.runDir + "/wrf_log.txt")
+		return True
+
+	# run_chain: Submits every enabled job at once, each one held by the scheduler until the previous one completes successfully,
+	#  then follows the chain using the same checks as the individual steps. On a failure the rest of the chain is cancelled.
+	def run_chain(self, post = None):
+		Tools.Process.instance().Lock()
+		self.logger.write("run_chain(): Enter")
+		runGeogrid = self.aSet.fetch("run_geogrid") == '1' and not self.stage_done("geogrid")
+		runPrerun = self.aSet.fetch("run_preprocessing_jobs") == '1' and not self.stage_done("prerun")
+		runWRF = self.aSet.fetch("run_wrf") == '1' and not self.stage_done("wrf")
+		startMarker = self.runDir + "/wrf_job_started"
+		if runGeogrid:
+			Tools.popen(self.aSet, "mv namelist.wps.geogrid " + self.runDir + "/namelist.wps")
+		if runPrerun:
+			Tools.popen(self.aSet, "cp " + self.aSet.fetch("headdir") + "vtables/Vtable." + self.aSet.fetch("modeldata") + "* " + self.runDir)
+			Tools.popen(self.aSet, "mv namelist.wps* " + self.runDir)
+		if runWRF and not self.in_flight("wrf"):
+			self.rsl.collect("previous")
+			Tools.popen(self.aSet, "rm -f " + startMarker)
+			Tools.popen(self.aSet, "rm -f " + self.runDir + "/real_log.txt")
+		lastJob = None
+		submitted = []
+		for jobFile, stage, run in [("geogrid.job", "geogrid", runGeogrid), ("prerun.job", "prerun", runPrerun), ("wrf.job", "wrf", runWRF)]:
+			if not run:
+				continue
+			lastJob = self.submit_job(jobFile, stage, dependsOn = [lastJob])
+			if self.submit_failed(stage):
+				# The jobs after it would not be held by the scheduler, the chain stops and the jobs already in the queue are taken back
+				self.tracker.cancel_pending()
+				for earlier in submitted:
+					self.finish_stage(earlier, False)
+				self.logger.write("run_chain(): Exit (Failed)")
+				Tools.Process.instance().Unlock()
+				return False
+			submitted.append(stage)
+		if post is not None and self.aSet.fetch("run_postprocessing") == '1':
+			post.submit_chained(dependsOn = [lastJob])
+		self.logger.write("All jobs have been submitted to the queue, following the chain.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			self.logger.write("Debug mode is active, skipping")
+			Tools.Process.instance().Unlock()
+			return True
+		result = True
+		if result and runGeogrid:
+			result = self.finish_stage("geogrid", self.monitor_geogrid())
+		if result and runPrerun:
+			result = self.finish_stage("prerun", self.monitor_preprocessing(collectLogs = not runWRF))
+		if result and runWRF:
+			result = self.finish_stage("wrf", self.monitor_wrf(startMarker = startMarker))
+		if not result:
+			self.tracker.cancel_pending()
+		self.logger.write("run_chain(): Exit" + ("" if result else " (Failed)"))
+		Tools.Process.instance().Unlock()
+		return result
+
+	# run_single_allocation: Submits allocation.job, which runs every enabled step on the WRF node set without going back
+	#  into the queue, then follows the stage markers the job writes to allocation_status.log
+	def run_single_allocation(self, post = None):
+		if self.stage_done("allocation"):
+			if post is not None and self.aSet.fetch("run_postprocessing") == '1':
+				post.set_ran_in_allocation()
+			return True
+		Tools.Process.instance().Lock()
+		self.logger.write("run_single_allocation(): Enter")
+		runGeogrid = self.aSet.fetch("run_geogrid") == '1'
+		runPrerun = self.aSet.fetch("run_preprocessing_jobs") == '1'
+		runWRF = self.aSet.fetch("run_wrf") == '1'
+		if runGeogrid:
+			Tools.popen(self.aSet, "mv namelist.wps.geogrid " + self.runDir + "/namelist.wps")
+		if runPrerun:
+			Tools.popen(self.aSet, "cp " + self.aSet.fetch("headdir") + "vtables/Vtable." + self.aSet.fetch("modeldata") + "* " + self.runDir)
+			Tools.popen(self.aSet, "mv namelist.wps* " + self.runDir)
+		if runWRF and not self.in_flight("allocation"):
+			self.rsl.collect("previous")
+		if post is not None and self.aSet.fetch("run_postprocessing") == '1':
+			# UPP needs its links in place before the job reaches the post stage
+			if(post.prepare_postprocessing() == False):
+				self.logger.write("run_single_allocation(): Exit (Failed to prepare post-processing)")
+				Tools.Process.instance().Unlock()
+				return False
+			post.set_ran_in_allocation()
+			# prepare_postprocessing() releases the process lock when it is done, take it back.
+			Tools.Process.instance().Lock()
+		self.submit_job("allocation.job", "allocation")
+		if self.submit_failed("allocation"):
+			self.logger.write("run_single_allocation(): Exit (Failed)")
+			Tools.Process.instance().Unlock()
+			return False
+		self.logger.write("Job has been submitted to the queue, waiting for stage reports.")
+		if(self.aSet.fetch("debugmode") == '1'):
+			self.logger.write("Debug mode is active, skipping")
+			Tools.Process.instance().Unlock()
+			return True
+		result = self.finish_stage("allocation", self.monitor_allocation())
+		if result and runWRF:
+			self.collect_wrf_logs()
+		self.logger.write("run_single_allocation(): Exit" + ("" if result else " (Failed)"))
 		Tools.Process.instance().Unlock()
-		return False			
+		return result
+		
+	# monitor_allocation: Follows allocation_status.log, the job writes one line per stage boundary:
+	#  STAGE <name> BEGIN <time>, STAGE <name> END <code> <time>, and finally ALLOCATION COMPLETE or ALLOCATION FAILED <name> <code>
+	def monitor_allocation(self):
+		statusLog = Wait.LogTail(self.runDir + "/allocation_status.log")
+		watcher = Wait.DirectoryWatcher([self.runDir])
+		self.allocationStages = {}
+		try:
+			while True:
+				result = self.read_allocation_status(statusLog)
+				if result is not None:
+					return result
+				if self.tracker.isTerminal(self.jobIDs.get("allocation")):
+					# Pick up anything written right before the job ended
+					result = self.read_allocation_status(statusLog)
+					if result is not None:
+						return result
+					self.job_left_queue("allocation")
+					return False
+				watcher.wait(60)
+		finally:
+			watcher.close()
+			self.timing.stop()
+			self.stability.stop()
+			
+	def read_allocation_status(self, statusLog):
+		for line in statusLog.read_lines():
+			tokens = line.split()
+			if len(tokens) >= 4 and tokens[0] == "STAGE":
+				stage = tokens[1]
+				if tokens[2] == "BEGIN":
+					self.allocationStages[stage] = "RUNNING"
+					self.allocationBegin[stage] = int(tokens[3])
+					if stage == "wrf":
+						self.timing.start(self.wrf_deadline(self.allocationBegin[stage]))
+						self.stability.start(self.jobIDs.get("allocation"))
+					self.logger.write("  -> allocation.job: " + stage + " started")
+				elif tokens[2] == "END":
+					self.allocationStages[stage] = "COMPLETED" if tokens[3] == '0' else "FAILED"
+					if tokens[3] == '0':
+						self.logger.write("  -> allocation.job: " + stage + " completed")
+						if stage in self.allocationBegin and len(tokens) >= 5:
+							self.history.record(stage, (int(tokens[4]) - self.allocationBegin[stage]) / 60.0)
+						if stage == "geogrid":
+							self.cache_geo_em()
+						elif stage == "metgrid":
+							self.cache_wps_output()
+					else:
+						self.logger.write("  -> allocation.job: " + stage + " failed (Code " + tokens[3] + ")")
+			elif line.startswith("ALLOCATION COMPLETE"):
+				return True
+			elif line.startswith("ALLOCATION FAILED"):
+				self.logger.write("monitor_allocation(): Failed at " + (tokens[2] if len(tokens) > 2 else "unknown stage") + ", check the logs of that step")
+				return False
+		return None
 
 class Postprocessing_Steps:
 	aSet = None
 	modelParms = None
+	scheduleParms = None
+	tracker = None
+	uppJobID = None
+	ranInAllocation = False
+	following = False
+	uppHours = {}
+	uppThread = None
+	wrfEnded = None
+	state = None
 	logger = None
 	startTime = ""
 	wrfDir = ""
 
-	def __init__(self, settings, modelParms):
+	def __init__(self, settings, modelParms, scheduleParms, tracker = None, state = None):
 		self.aSet = settings
 		self.logger = Tools.loggedPrint.instance()
 		self.modelParms = modelParms
+		self.scheduleParms = scheduleParms
+		self.tracker = tracker if tracker is not None else Scheduler.JobTracker(scheduleParms, settings)
+		self.uppJobID = None
+		self.ranInAllocation = False
+		self.following = False
+		self.uppHours = {}
+		self.uppThread = None
+		self.wrfEnded = None
 		self.wrfDir = settings.fetch("wrfdir")
 		self.startTime = settings.fetch("starttime")
 		self.postDir = self.wrfDir + '/' + self.startTime[0:8] + "/postprd/"
+		self.state = state if state is not None else RunState.RunState(self.wrfDir + '/' + self.startTime[0:8])
 		
 	# This method is mainly used for UPP post-processing as it requires some links to be established prior to running a Unipost.exe job. Python is skipped
 	def prepare_postprocessing(self):
 		Tools.Process.instance().Lock()
 		if(self.aSet.fetch("post_run_unipost") == '1'):
 			self.logger.write("  5.a. UPP Flagged Active")
-			uppDir = self.aSet.fetch("headdir") + "post/UPP/"
-			if(self.aSet.fetch("unipost_out") == "grib"):
-				Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/wrf_cntrl.parm " + self.postDir + "wrf_cntrl.parm")
-			elif(self.aSet.fetch("unipost_out") == "grib2"):
-				Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/postcntrl.xml " + self.postDir + "postcntrl.xml")
-				Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/postxconfig-NT.txt " + self.postDir + "postxconfig-NT.txt")
-				Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/post_avblflds.xml " + self.postDir + "post_avblflds.xml")
-				Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/params_grib2_tbl_new " + self.postDir + "params_grib2_tbl_new")
-			else:
-				self.logger.write("  5.a. Error: Neither GRIB or GRIB2 is defined for UPP output processing, please modify control.txt, aborting")
-				Tools.Process.instance().Unlock()
-				return False
-			Tools.popen(self.aSet, "cp " + self.aSet.fetch("uppexecutables") + "unipost.exe " + self.postDir)
-			Tools.popen(self.aSet, "ln -sf " + uppDir + "scripts/cbar.gs " + self.postDir)
-			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/nam_micro_lookup.dat " + self.postDir)
-			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/hires_micro_lookup.dat " + self.postDir)
-			Tools.popen(self.aSet, "ln -fs " + uppDir + "includes/*.bin " + self.postDir)
-			self.logger.write("  5.a. Done")
+			result = self.link_upp_files()
+			if result:
+				self.logger.write("  5.a. Done")
 			Tools.Process.instance().Unlock()
-			return True
+			return result
 		elif(self.aSet.fetch("post_run_python") == '1'):
 			self.logger.write("  5.a. Python Flagged Active, no pre-job work required.")
 			Tools.Process.instance().Unlock()
@@ -289,7 +1045,45 @@ class Postprocessing_Steps:
 			Tools.Process.instance().Unlock()
 			return False
 			
+	# link_upp_files: Links the parameter and lookup files and copies unipost.exe into the postprd directory
+	def link_upp_files(self):
+		uppDir = self.aSet.fetch("headdir") + "post/UPP/"
+		if(self.aSet.fetch("unipost_out") == "grib"):
+			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/wrf_cntrl.parm " + self.postDir + "wrf_cntrl.parm")
+		elif(self.aSet.fetch("unipost_out") == "grib2"):
+			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/postcntrl.xml " + self.postDir + "postcntrl.xml")
+			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/postxconfig-NT.txt " + self.postDir + "postxconfig-NT.txt")
+			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/post_avblflds.xml " + self.postDir + "post_avblflds.xml")
+			Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/params_grib2_tbl_new " + self.postDir + "params_grib2_tbl_new")
+		else:
+			self.logger.write("  5.a. Error: Neither GRIB or GRIB2 is defined for UPP output processing, please modify control.txt, aborting")
+			return False
+		Tools.popen(self.aSet, "cp " + self.aSet.fetch("uppexecutables") + "unipost.exe " + self.postDir)
+		Tools.popen(self.aSet, "ln -sf " + uppDir + "scripts/cbar.gs " + self.postDir)
+		Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/nam_micro_lookup.dat " + self.postDir)
+		Tools.popen(self.aSet, "ln -fs " + uppDir + "parm/hires_micro_lookup.dat " + self.postDir)
+		Tools.popen(self.aSet, "ln -fs " + uppDir + "includes/*.bin " + self.postDir)
+		return True
+		
+	# run_postprocessing: Runs (Or finishes) post-processing, skipped when resuming a run that already completed it
 	def run_postprocessing(self):
+		if self.state.is_complete("post"):
+			self.logger.write("  5. Post-processing completed in an earlier run of this forecast, skipping")
+			return True
+		result = self.run_post_method()
+		if(self.aSet.fetch("debugmode") == '1'):
+			return result
+		return self.state.finished("post", result, sorted(glob.glob(self.postDir + "WRFPRS*")))
+		
+	def run_post_method(self):
+		if self.ranInAllocation:
+			return self.finish_allocation_post()
+		if self.following:
+			self.stop_following(True)
+			if(self.aSet.fetch("post_run_unipost") == '1'):
+				return self.finish_following_upp()
+			post = PreparePyJob.PreparePyJob(self.aSet, self.wrfDir + '/' + self.startTime[0:8] + "/output", self.postDir)
+			return post.wait_job()
 		if(self.aSet.fetch("post_run_unipost") == '1'):
 			return self.run_postprocessing_upp()
 		elif(self.aSet.fetch("post_run_python") == '1'):
@@ -298,108 +1092,332 @@ class Postprocessing_Steps:
 		else:
 			sys.exit("Error: run_postprocessing() called without a mode flagged, abort.")
 			return False
+			
+	# submitted: Returns True if post-processing was already submitted as part of a job chain or the single allocation job, or
+	#  is following the WRF output
+	def submitted(self):
+		return self.uppJobID is not None or self.ranInAllocation or self.following
 		
-	def run_postprocessing_upp(self):
-		# Unipost needs to be run across multiple jobs that are broken up 24 hours of forecast per job.
-		#  this is done to prevent the job time limit from expiring while UPP is running.
+	def set_ran_in_allocation(self):
+		self.ranInAllocation = True
+		
+	# follows: Returns True if post-processing is set to follow the wrfout files while WRF is running
+	def follows(self):
+		if(self.aSet.fetch("post_run_unipost") == '1'):
+			return self.aSet.fetch("upp_follow_wrf") == '1'
+		return self.aSet.fetch("post_run_python") == '1' and self.aSet.fetch("post_follow_wrf") == '1'
+		
+	# start_following: Starts post-processing ahead of WRF so each wrfout file is processed as soon as WRF closes it. UPP submits one job
+	#  per file from a background thread, Python launches the post-processor, leadMinutes is added to the dask worker walltime when it
+	#  starts before the jobs ahead of WRF have run
+	def start_following(self, leadMinutes = 0):
+		if not self.follows() or self.following:
+			return self.following
+		if(self.aSet.fetch("post_run_unipost") == '1'):
+			if(self.link_upp_files() == False):
+				return False
+			Tools.popen(self.aSet, "rm -f " + self.postDir + "upp_f*.done " + self.postDir + "upp_f*.failed")
+			self.uppHours = {}
+			self.wrfEnded = None
+			self.uppThread = threading.Thread(target = self.follow_upp, daemon = True)
+			self.uppThread.start()
+			self.logger.write("  5.b. Following the wrfout files with UPP, up to " + self.aSet.fetch("upp_max_concurrent") + " hours at a time.")
+		else:
+			post = PreparePyJob.PreparePyJob(self.aSet, self.wrfDir + '/' + self.startTime[0:8] + "/output", self.postDir)
+			post.start_follow_job(leadMinutes + int(self.aSet.fetch("wrf_walltime")) + int(self.aSet.fetch("python_walltime")))
+		self.following = True
+		return True
+		
+	# stop_following: Tells the running post-processing that WRF has ended, on success it finishes the last wrfout file, otherwise it stops
+	def stop_following(self, wrfCompleted):
+		if not self.following:
+			return
+		if(self.aSet.fetch("post_run_unipost") == '1'):
+			self.wrfEnded = wrfCompleted
+			if not wrfCompleted:
+				self.uppThread.join()
+		else:
+			Tools.popen(self.aSet, "touch " + self.postDir + ("wrf_complete.flag" if wrfCompleted else "wrf_failed.flag"))
+		if not wrfCompleted:
+			self.following = False
+			
+	# follow_upp: Runs on its own thread while WRF integrates, each finished wrfout file gets its own UPP job, with at most
+	#  upp_max_concurrent of them in the queue at once. Ends once WRF has completed and every hour has been handled, or when WRF fails
+	def follow_upp(self):
+		follower = Wait.OutputFollower(self.wrfDir + '/' + self.startTime[0:8] + "/output/wrfout*", int(self.aSet.fetch("upp_follow_stable_seconds")))
+		maxActive = max(1, int(self.aSet.fetch("upp_max_concurrent")))
+		queued = []
+		while True:
+			wrfEnded = self.wrfEnded
+			if wrfEnded is False:
+				for fStr in self.active_upp_hours():
+					self.tracker.cancel(self.uppHours[fStr]["jobID"])
+					self.uppHours[fStr]["state"] = "CANCELLED"
+				self.write_upp_hours()
+				return
+			queued += follower.completed(finalPass = wrfEnded is True)
+			self.update_upp_hours()
+			while queued and len(self.active_upp_hours()) < maxActive:
+				self.submit_upp_hour(queued.pop(0))
+			if wrfEnded and not queued and not follower.pending() and not self.active_upp_hours():
+				return
+			time.sleep(10)
+			
+	def forecast_hour(self, iFile):
+		validTime = datetime.datetime(*[int(field) for field in history_time(iFile)[1:]])
+		elapsed = validTime - self.aSet.startTime
+		fHour = elapsed.days * 24 + elapsed.seconds // 3600
+		return "0" + str(fHour) if fHour < 10 else str(fHour)
+		
+	def active_upp_hours(self):
+		return [fStr for fStr in self.uppHours if self.uppHours[fStr]["state"] == "SUBMITTED"]
+			
+	# submit_upp_hour: Writes and submits the UPP job for a single wrfout file, it runs in its own upp_f<hour> directory so the
+	#  itag and fort.* files of concurrent hours do not collide
+	def submit_upp_hour(self, iFile):
+		if history_time(iFile) is None:
+			self.logger.write("  5.b. Warning: " + iFile + " is not named as a wrfout file, UPP is not run on it")
+			return
+		fStr = self.forecast_hour(iFile)
+		if not os.path.exists(iFile):
+			# The follower reports split files (io_form_history 102) under their unsplit name, unipost.exe cannot read the patches
+			self.uppHours[fStr] = {"file": iFile, "jobID": None, "state": "FAILED"}
+			self.logger.write("  5.b. Error: " + iFile + " was written split, UPP cannot read it (Forecast hour " + fStr + " failed)")
+			self.write_upp_hours()
+			return
+		jobFile = "upp_f" + fStr + ".job"
+		upp_job_contents = self.upp_job_header(self.aSet.fetch("upp_ensemble_nodes_per_hour"), "upp.f" + fStr)
+		upp_job_contents += self.upp_environment()
+		upp_job_contents += "mkdir -p " + self.postDir + "upp_f" + fStr + "\n"
+		upp_job_contents += "cd " + self.postDir + "upp_f" + fStr + "\n"
+		upp_job_contents += "ln -sf ../unipost.exe ../*.parm ../*.xml ../postxconfig-NT.txt ../params_grib2_tbl_new ../*.dat ../*.bin .\n\n"
+		upp_job_contents += self.upp_file_commands(iFile) + '\n'
+		upp_job_contents += "if [ -s WRFPRS.GrbF" + fStr + " ]; then\n"
+		upp_job_contents += "   mv WRFPRS.GrbF" + fStr + " ../\n"
+		upp_job_contents += "   touch ../upp_f" + fStr + ".done\n"
+		upp_job_contents += "else\n"
+		upp_job_contents += "   touch ../upp_f" + fStr + ".failed\n"
+		upp_job_contents += "fi\n"
+		with open(self.postDir + jobFile, 'w') as target_file:
+			target_file.write(upp_job_contents)
+		Tools.popen(self.aSet, "chmod +x " + self.postDir + jobFile)
+		jobID = self.tracker.submit(jobFile, name = "upp.f" + fStr, cwd = self.postDir)
+		self.uppHours[fStr] = {"file": iFile, "jobID": jobID, "state": "SUBMITTED" if jobID is not None else "FAILED"}
+		self.logger.write("  5.b. UPP for forecast hour " + fStr + (" submitted as job " + str(jobID) if jobID is not None else " could not be submitted"))
+		self.write_upp_hours()
+		
+	# update_upp_hours: An hour is completed once its job has left the .done marker, and failed if the job leaves the queue without it
+	def update_upp_hours(self):
+		changed = False
+		for fStr in self.active_upp_hours():
+			doneFile = self.postDir + "upp_f" + fStr + ".done"
+			if os.path.exists(doneFile):
+				self.uppHours[fStr]["state"] = "COMPLETED"
+			elif os.path.exists(self.postDir + "upp_f" + fStr + ".failed") or self.tracker.isTerminal(self.uppHours[fStr]["jobID"]):
+				self.uppHours[fStr]["state"] = "COMPLETED" if os.path.exists(doneFile) else "FAILED"
+			else:
+				continue
+			changed = True
+			self.logger.write("  5.b. UPP forecast hour " + fStr + " " + self.uppHours[fStr]["state"].lower())
+		if changed:
+			self.write_upp_hours()
+			
+	# write_upp_hours: Records the state of every forecast hour in postprd/upp_hours.txt
+	def write_upp_hours(self):
+		with open(self.postDir + "upp_hours.txt", 'w') as target_file:
+			for fStr in sorted(self.uppHours, key = int):
+				hour = self.uppHours[fStr]
+				target_file.write(fStr + " " + hour["state"] + " " + str(hour["jobID"]) + " " + hour["file"] + "\n")
+				
+	# finish_following_upp: WRF has completed, wait for the remaining hours and verify the output
+	def finish_following_upp(self):
 		Tools.Process.instance().Lock()
-		curDir = os.path.dirname(os.path.abspath(__file__)) 
-		uppDir = self.aSet.fetch("headdir") + "post/UPP/"
-		fList = sorted(glob.glob(self.wrfDir + '/' + self.startTime[0:8] + "/output/wrfout*"))
-		fileCount = len(fList)
-		fLogs = []
-		upp_job_contents = ""
-		self.logger.write("  5.b. Running UPP on " + str(fileCount) + " wrfout files")
-		
-		upp_job_contents += "#!/bin/bash\n"
-		upp_job_contents += "#COBALT -t " + self.aSet.fetch("upp_walltime") + "\n"
-		upp_job_contents += "#COBALT -n " + self.aSet.fetch("num_upp_nodes") + "\n"
-		upp_job_contents += "#COBALT -q default\n"
-		upp_job_contents += "#COBALT -A climate_severe\n\n"
+		self.logger.write("  5.b. WRF has completed, waiting on the remaining UPP hours.")
+		self.uppThread.join()
+		self.following = False
+		failed = [fStr for fStr in sorted(self.uppHours, key = int) if self.uppHours[fStr]["state"] != "COMPLETED"]
+		if failed:
+			self.logger.write("  5.b. Error: UPP did not complete for forecast hours " + ", ".join(failed) + ", see " + self.postDir + "upp_hours.txt")
+			Tools.Process.instance().Unlock()
+			return False
+		result = self.finish_upp(len(self.uppHours))
+		Tools.Process.instance().Unlock()
+		return result
+		
+	# allocation_commands: The shell commands that run post-processing at the end of allocation.job, the exit code of the
+	#  last command is reported as the result of the post stage
+	def allocation_commands(self):
+		if(self.aSet.fetch("post_run_unipost") == '1'):
+			return self.upp_job_commands(self.expected_wrfout_files())
+		elif(self.aSet.fetch("post_run_python") == '1'):
+			post = PreparePyJob.PreparePyJob(self.aSet, self.wrfDir + '/' + self.startTime[0:8] + "/output", self.postDir)
+			return post.job_commands() + "grep -q \"\\*\\*\\*SUCCESS\\*\\*\\*\" " + self.postDir + "pypost.log\n"
+		return None
+		
+	# finish_allocation_post: Post-processing already ran inside allocation.job, verify the UPP output and build the CTL files
+	def finish_allocation_post(self):
+		if(self.aSet.fetch("post_run_unipost") == '1'):
+			Tools.Process.instance().Lock()
+			result = self.finish_upp(len(self.expected_wrfout_files()))
+			Tools.Process.instance().Unlock()
+			return result
+		self.logger.write("  5.b. Python post-processing completed inside the allocation job.")
+		return True
+		
+	# expected_wrfout_files: The wrfout files WRF will write for this run (history_interval is 60 minutes in the namelist template)
+	def expected_wrfout_files(self):
+		fList = []
+		current = self.aSet.startTime
+		while current <= self.aSet.endTime:
+			fList.append(self.wrfDir + '/' + self.startTime[0:8] + "/output/wrfout_d01_" + current.strftime('%Y-%m-%d_%H_%M_%S'))
+			current += datetime.timedelta(minutes = 60)
+		return fList
+		
+	# submit_chained: Submits the post-processing job behind the jobs in dependsOn. This is only possible for UPP since
+	#  the Python post-processor is driven from this script and runs once the chain has completed.
+	def submit_chained(self, dependsOn = None):
+		if(self.aSet.fetch("post_run_unipost") != '1' or self.following):
+			return None
+		if(self.prepare_postprocessing() == False):
+			return None
+		fList = self.expected_wrfout_files()
+		self.write_upp_job(fList)
+		Tools.popen(self.aSet, "rm -f " + self.postDir + "upp_job.log")
+		self.uppJobID = self.tracker.submit("upp.job", name = "upp", cwd = self.postDir, dependsOn = dependsOn)
+		self.logger.write("  5.b. UPP job for " + str(len(fList)) + " wrfout files submitted behind the WRF job.")
+		return self.uppJobID
+		
+	def write_upp_job(self, fList):
+		upp_job_contents = self.upp_job_header(self.aSet.fetch("num_upp_nodes"), "upp")
+		upp_job_contents += self.upp_job_commands(fList)
+		with open(self.postDir + "upp.job", 'w') as target_file:
+			target_file.write(upp_job_contents)
+		Tools.popen(self.aSet, "chmod +x " + self.postDir + "upp.job")
+		
+	# upp_job_header: The scheduler directives of a UPP job (Built from the jobscheduler table) and its environment
+	def upp_job_header(self, nodes, jobName):
+		upp_job_contents = self.scheduleParms.job_header(self.aSet.fetch("accountname"), jobName, nodes, self.aSet.fetch("upp_mpi_ranks_per_node"),
+														 self.aSet.fetch("upp_walltime"), "default").rstrip("\n") + "\n\n"
 		upp_job_contents += "source " + self.aSet.fetch("sourcefile") + "\n"
 		upp_job_contents += "ulimit -s unlimited\n\n"
-		upp_job_contents += "export n_nodes="+ str(self.aSet.fetch("upp_ensemble_nodes_per_hour")) +"\n"
-		upp_job_contents += "export n_mpi_ranks_per_node=32\n"
-		upp_job_contents += "export n_mpi_ranks=$(($n_nodes * $n_mpi_ranks_per_node))\n"
-		upp_job_contents += "export n_openmp_threads_per_rank=" + self.aSet.fetch("mpi_threads_per_rank") +"\n"
-		upp_job_contents += "export n_hardware_threads_per_core=2\n"
-		upp_job_contents += "export n_hardware_threads_skipped_between_ranks=4\n\n"
-
+		return upp_job_contents
+		
+	# upp_job_commands: The body of the UPP job, one unipost.exe run per file in fList. The last command fails when any of the runs
+	#  exited with an error, allocation.job reports its code as the result of the post stage
+	def upp_job_commands(self, fList):
+		upp_job_contents = self.upp_environment()
 		upp_job_contents += "cd " + self.aSet.fetch("wrfdir") + '/' + self.aSet.fetch("starttime")[0:8] + "/postprd" + "\n\n"		
+		upp_job_contents += "UPP_PIDS=\"\"\n"
 		
-		with Tools.cd(self.postDir):
-			for iFile in fList:
-				dNum = iFile[-23:-20]
-				year = iFile[-19:-15]
-				month = iFile[-14:-12]
-				day = iFile[-11:-9]
-				hour = iFile[-8:-6]
-				minute = iFile[-5:-3]
-				second = iFile[-2:]
-				logName = "unipost_log_" + dNum + "_" + year + "_" + month + "_" + day + "_" + hour + ":" + minute + ":" + second + ".log"
-				fLogs.append(logName)
-				catCMD = ""
-				if(self.aSet.fetch("unipost_out") == "grib"):
-					catCMD = "cat > itag <<EOF\n" + iFile + '\n' + "netcdf\n" + str(year) + "-" + str(month) + "-" + str(day) + "_" + str(hour) + ":" + str(minute) + ":" + str(second) + '\n' + "NCAR\nEOF"
-				elif(self.aSet.fetch("unipost_out") == "grib2"):
-					catCMD = "cat > itag <<EOF\n" + iFile + '\n' + "netcdf\n" + "grib2\n" + str(year) + "-" + str(month) + "-" + str(day) + "_"  + str(hour) + ":" + str(minute) + ":" + str(second) + '\n' + "NCAR\nEOF"					
-				else:
-					#You should never end up here...
-					sys.exit("  5.b. Error: grib/grib2 not defined in control.txt")
-				upp_job_contents += catCMD
-				upp_job_contents += '\n' + "rm fort.*"
-				if(self.aSet.fetch("unipost_out") == "grib"):
-					upp_job_contents += "\nln -sf " + uppDir + "parm/wrf_cntrl.parm fort.14"
-				
-				aprun = "aprun -n $n_mpi_ranks -N $n_mpi_ranks_per_node \\" + '\n'
-				aprun += "--env OMP_NUM_THREADS=$n_openmp_threads_per_rank -cc depth \\" + '\n'
-				aprun += "-d $n_hardware_threads_skipped_between_ranks \\" + '\n'
-				aprun += "-j $n_hardware_threads_per_core \\" + '\n'
-				aprun += "./unipost.exe > " + logName + " &\n"
-				aprun += "sleep 5\n"
-				upp_job_contents += "\n" + aprun + '\n\n'
-				
-				aprun = ""
+		for iFile in fList:
+			upp_job_contents += self.upp_file_commands(iFile, background = True)
+			upp_job_contents += "UPP_PIDS=\"$UPP_PIDS $!\"\n\n"
 
-			upp_job_contents += "wait\necho \"Job Complete\""
-			with open("upp.job", 'w') as target_file:
-				target_file.write(upp_job_contents)
-			Tools.popen(self.aSet, "chmod +x upp.job")
+		upp_job_contents += "UPP_FAILED=0\n"
+		upp_job_contents += "for pid in $UPP_PIDS; do\n"
+		upp_job_contents += "   wait $pid || UPP_FAILED=$(($UPP_FAILED + 1))\n"
+		upp_job_contents += "done\n"
+		upp_job_contents += "echo \"Job Complete\" >> upp_job.log\n"
+		upp_job_contents += "[ $UPP_FAILED -eq 0 ]\n"
+		return upp_job_contents
+		
+	# upp_layout: The replacement keys of the scheduler's exports and launcher for one unipost.exe run on upp_ensemble_nodes_per_hour nodes
+	def upp_layout(self):
+		ranksPerNode = int(self.aSet.fetch("upp_mpi_ranks_per_node"))
+		return {"[ranks_per_node]": ranksPerNode, "[omp_threads_per_rank]": self.aSet.fetch("prerun_mpi_threads_per_rank"), "[threads_per_core]": 2,
+				"[threads_skipped_per_rank]": 4, "[total_processors]": int(self.aSet.fetch("upp_ensemble_nodes_per_hour")) * ranksPerNode}
+		
+	# upp_environment: The scheduler's exports (COBALT), every unipost.exe run is counted on upp_ensemble_nodes_per_hour nodes, not the job size
+	def upp_environment(self):
+		exports = self.scheduleParms.fill("extra-exports", self.upp_layout())
+		if exports is None:
+			return ""
+		upp_job_contents = exports + "\n"
+		upp_job_contents += "export n_nodes=" + str(self.aSet.fetch("upp_ensemble_nodes_per_hour")) + "\n"
+		upp_job_contents += "export n_mpi_ranks=$(($n_nodes * $n_mpi_ranks_per_node))\n\n"
+		return upp_job_contents
+		
+	# upp_file_commands: Writes the itag for iFile and runs unipost.exe on it in the current directory, when background is set the
+	#  run is sent to the background (The full UPP job waits on all of them at the end)
+	def upp_file_commands(self, iFile, background = False):
+		uppDir = self.aSet.fetch("headdir") + "post/UPP/"
+		dNum, year, month, day, hour, minute, second = history_time(iFile)
+		logName = "unipost_log_" + dNum + "_" + year + "_" + month + "_" + day + "_" + hour + ":" + minute + ":" + second + ".log"
+		catCMD = ""
+		if(self.aSet.fetch("unipost_out") == "grib"):
+			catCMD = "cat > itag <<EOF\n" + iFile + '\n' + "netcdf\n" + str(year) + "-" + str(month) + "-" + str(day) + "_" + str(hour) + ":" + str(minute) + ":" + str(second) + '\n' + "NCAR\nEOF"
+		elif(self.aSet.fetch("unipost_out") == "grib2"):
+			catCMD = "cat > itag <<EOF\n" + iFile + '\n' + "netcdf\n" + "grib2\n" + str(year) + "-" + str(month) + "-" + str(day) + "_"  + str(hour) + ":" + str(minute) + ":" + str(second) + '\n' + "NCAR\nEOF"					
+		else:
+			#You should never end up here...
+			sys.exit("  5.b. Error: grib/grib2 not defined in control.txt")
+		upp_job_contents = catCMD
+		upp_job_contents += '\n' + "rm fort.*"
+		if(self.aSet.fetch("unipost_out") == "grib"):
+			upp_job_contents += "\nln -sf " + uppDir + "parm/wrf_cntrl.parm fort.14"
+		
+		launcher = self.scheduleParms.fetch()["runcmd"] + " " + self.scheduleParms.fill("subargs", self.upp_layout()) + " \\" + '\n'
+		if background:
+			launcher += "./unipost.exe > " + logName + " &\n"
+			launcher += "sleep 5\n"
+		else:
+			launcher += "./unipost.exe > " + logName + "\n"
+		return upp_job_contents + "\n" + launcher
+		
+	def run_postprocessing_upp(self):
+		# Unipost needs to be run across multiple jobs that are broken up 24 hours of forecast per job.
+		#  this is done to prevent the job time limit from expiring while UPP is running.
+		Tools.Process.instance().Lock()
+		if self.submitted():
+			fileCount = len(self.expected_wrfout_files())
+			self.logger.write("  5.b. UPP job " + str(self.uppJobID) + " was submitted with the job chain, waiting for it to complete.")
+		else:
+			fList = sorted(glob.glob(self.wrfDir + '/' + self.startTime[0:8] + "/output/wrfout*"))
+			fileCount = len(fList)
+			self.logger.write("  5.b. Running UPP on " + str(fileCount) + " wrfout files")
+			self.write_upp_job(fList)
+			Tools.popen(self.aSet, "rm -f " + self.postDir + "upp_job.log")
 			self.logger.write("   -> Submitting upp job to the queue")
-			jobSub = Tools.popen(self.aSet, "qsub upp.job -q default -t " + str(self.aSet.fetch("upp_walltime")) + " -n " + str(self.aSet.fetch("num_upp_nodes")) + " --mode script")
-			self.logger.write("   -> Job file submitted, wait for " + jobSub.fetch()[0].rstrip("\n\r") + ".output")
-			# Wait for all logs to flag as job complete
-			try:
-				wCond = [{"waitCommand": "tail -n 2 " + jobSub.fetch()[0].rstrip("\n\r") + ".output", "contains": "Job Complete", "retCode": 1},]
-				waitCond = Wait.Wait(wCond, timeDelay = 60)
-				wRC = waitCond.hold()			
-				if wRC == 1:
-					Tools.Process.instance().Unlock()
-			except Wait.TimeExpiredException:
-				sys.exit("unipost.exe job not completed, abort.")
-			self.logger.write("   -> Unipost Job Completed, Verifying files.")
-			# Run a quick ls -l test to ensure the number of files present matches what we're expecting
-			fCountTest = Tools.popen(self.aSet, "ls -l WRFPRS*")
-			cmdTxt = fCountTest.fetch()
-			strCount = fCountTest[fCountTest.rfind('F'):]
-			self.logger.write("  5.b. All UPP jobs completed (F" + int(strCount) + " found).")
-			if(not (int(strCount)) == (fileCount - 1)):
-				self.logger.write("  5.b. Error: Number of expected files (" + fileCount + ") does not match actual count (" + int(strCount) + 1 + ").")
+			self.uppJobID = self.tracker.submit("upp.job", name = "upp", cwd = self.postDir)
+			self.logger.write("   -> Job file submitted as " + str(self.uppJobID) + ", waiting for completion")
+		# Wait for all logs to flag as job complete
+		try:
+			wCond = [{"logFile": self.postDir + "upp_job.log", "contains": "Job Complete", "retCode": 1},
+					 {"jobTracker": self.tracker, "jobID": self.uppJobID, "retCode": 2}]
+			waitCond = Wait.Wait(wCond, timeDelay = 60)
+			wRC = waitCond.hold()
+			if wRC == 2:
+				self.logger.write("  5.b. Error: The UPP job left the queue before completing (" + str(self.tracker.state(self.uppJobID)) + " " + self.tracker.reason(self.uppJobID) + ")")
 				Tools.Process.instance().Unlock()
 				return False
-			# Now that we have our PRS files, we can convert those to CTL files
-			self.logger.write("  5.b. Running GRIB to CTL process.")
-			if(self.aSet.fetch("unipost_out") == "grib"):
-				for fHour in range(0, fileCount):
-					fStr = "0" + str(fHour) if fHour < 10 else str(fHour)
-					inFile = "WRFPRS.GrbF" + fStr
-					Tools.popen(self.aSet, uppDir + "scripts/grib2ctl.pl " + self.postDir + '/' + inFile + " > " + self.postDir + "/wrfprs_f" + fStr + ".ctl")
-			elif(self.aSet.fetch("unipost_out") == "grib2"):
-				for fHour in range(0, fileCount):
-					fStr = "0" + str(fHour) if fHour < 10 else str(fHour)
-					inFile = "WRFPRS.GrbF" + fStr
-					Tools.popen(self.aSet, uppDir + "scripts/g2ctl.pl " + self.postDir + '/' + inFile + " > " + self.postDir + "/wrfprs_f" + fStr + ".ctl")
-			#To-Do Note: Fork off to GrADS here...
-			self.logger.write("  5.b. GRIB to CTL processes completed.")
-			Tools.Process.instance().Unlock()
-			return True
\ No newline at end of file
+		except Wait.TimeExpiredException:
+			sys.exit("unipost.exe job not completed, abort.")
+		self.logger.write("   -> Unipost Job Completed, Verifying files.")
+		result = self.finish_upp(fileCount)
+		Tools.Process.instance().Unlock()
+		return result
+		
+	# finish_upp: Verifies the UPP output files and converts them to CTL files
+	def finish_upp(self, fileCount):
+		uppDir = self.aSet.fetch("headdir") + "post/UPP/"
+		# Ensure the number of files present matches what we're expecting
+		prsCount = len(glob.glob(self.postDir + "WRFPRS*"))
+		self.logger.write("  5.b. All UPP jobs completed (" + str(prsCount) + " files found).")
+		if(prsCount != fileCount):
+			self.logger.write("  5.b. Error: Number of expected files (" + str(fileCount) + ") does not match actual count (" + str(prsCount) + ").")
+			return False
+		# Now that we have our PRS files, we can convert those to CTL files
+		self.logger.write("  5.b. Running GRIB to CTL process.")
+		if(self.aSet.fetch("unipost_out") == "grib"):
+			for fHour in range(0, fileCount):
+				fStr = "0" + str(fHour) if fHour < 10 else str(fHour)
+				inFile = "WRFPRS.GrbF" + fStr
+				Tools.popen(self.aSet, uppDir + "scripts/grib2ctl.pl " + self.postDir + '/' + inFile + " > " + self.postDir + "/wrfprs_f" + fStr + ".ctl")
+		elif(self.aSet.fetch("unipost_out") == "grib2"):
+			for fHour in range(0, fileCount):
+				fStr = "0" + str(fHour) if fHour < 10 else str(fHour)
+				inFile = "WRFPRS.GrbF" + fStr
+				Tools.popen(self.aSet, uppDir + "scripts/g2ctl.pl " + self.postDir + '/' + inFile + " > " + self.postDir + "/wrfprs_f" + fStr + ".ctl")
+		#To-Do Note: Fork off to GrADS here...
+		self.logger.write("  5.b. GRIB to CTL processes completed.")
+		return True
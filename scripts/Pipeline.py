@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# Pipeline.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to run the program steps as a graph of stages, stages that do not depend on each other run at the same time
+
+import asyncio
+import datetime
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import Tools
+
+# Stage: A single step of the pipeline, action is a blocking callable that returns False on failure
+class Stage:
+	name = ""
+	action = None
+	dependsOn = []
+	enabled = True
+	status = "PENDING"
+	startTime = None
+	endTime = None
+
+	def __init__(self, name, action, dependsOn = None, enabled = True):
+		self.name = name
+		self.action = action
+		self.dependsOn = dependsOn if dependsOn is not None else []
+		self.enabled = enabled
+		self.status = "PENDING"
+		self.startTime = None
+		self.endTime = None
+
+	def elapsed(self):
+		if self.startTime is None:
+			return None
+		return (self.endTime if self.endTime is not None else datetime.datetime.utcnow()) - self.startTime
+
+	def satisfied(self):
+		return self.status in ["COMPLETED", "DISABLED"]
+
+# Pipeline: Runs a set of stages, each one starts as soon as all of the stages it depends on have completed. The actions run in
+#  a thread pool driven by asyncio so independent stages overlap. Stage states are PENDING, RUNNING, COMPLETED, FAILED,
+#  SKIPPED (A stage it depends on did not complete), or DISABLED (Turned off in control.txt, treated as completed)
+class Pipeline:
+	stages = {}
+	order = []
+	logger = None
+
+	def __init__(self):
+		self.stages = {}
+		self.order = []
+		self.logger = Tools.loggedPrint.instance()
+
+	def add(self, name, action, dependsOn = None, enabled = True):
+		self.stages[name] = Stage(name, action, dependsOn, enabled)
+		self.order.append(name)
+		return self.stages[name]
+
+	def status(self, name):
+		return self.stages[name].status if name in self.stages else None
+
+	# sorted_stages: Returns the stage names in dependency order, or None if a dependency is missing or circular
+	def sorted_stages(self):
+		ordered = []
+		visiting = []
+		def visit(name):
+			if name in ordered:
+				return True
+			if name in visiting or name not in self.stages:
+				self.logger.write("Pipeline: Stage " + str(name) + " is " + ("part of a dependency cycle" if name in visiting else "not defined"))
+				return False
+			visiting.append(name)
+			for dep in self.stages[name].dependsOn:
+				if not visit(dep):
+					return False
+			visiting.remove(name)
+			ordered.append(name)
+			return True
+		for name in self.order:
+			if not visit(name):
+				return None
+		return ordered
+
+	def run(self):
+		ordered = self.sorted_stages()
+		if ordered is None:
+			return False
+		with ThreadPoolExecutor(max_workers = max(1, len(ordered))) as executor:
+			asyncio.run(self.run_stages(ordered, executor))
+		self.write_summary()
+		return all(self.stages[name].satisfied() for name in ordered)
+
+	async def run_stages(self, ordered, executor):
+		tasks = {}
+		for name in ordered:
+			deps = [tasks[dep] for dep in self.stages[name].dependsOn]
+			tasks[name] = asyncio.ensure_future(self.run_stage(self.stages[name], deps, executor))
+		await asyncio.gather(*tasks.values())
+
+	async def run_stage(self, stage, deps, executor):
+		for dep in deps:
+			await dep
+		blocked = [d for d in stage.dependsOn if not self.stages[d].satisfied()]
+		if blocked:
+			stage.status = "SKIPPED"
+			self.logger.write("Pipeline: Skipping " + stage.name + ", " + ", ".join(blocked) + " did not complete")
+			return
+		if not stage.enabled:
+			stage.status = "DISABLED"
+			self.logger.write("Pipeline: " + stage.name + " is turned off, skipping")
+			return
+		stage.status = "RUNNING"
+		stage.startTime = datetime.datetime.utcnow()
+		self.logger.write("Pipeline: Starting " + stage.name)
+		result = await asyncio.get_running_loop().run_in_executor(executor, self.call, stage)
+		stage.endTime = datetime.datetime.utcnow()
+		stage.status = "COMPLETED" if result else "FAILED"
+		self.logger.write("Pipeline: " + stage.name + " " + stage.status.lower() + " after " + str(stage.elapsed()).split('.')[0])
+
+	# call: Runs the action of a stage, the steps call sys.exit() on fatal errors, which only fails the stage here
+	def call(self, stage):
+		try:
+			return stage.action() is not False
+		except SystemExit as e:
+			self.logger.write("Pipeline: " + stage.name + " aborted: " + str(e))
+		except Exception:
+			self.logger.write("Pipeline: " + stage.name + " raised an exception:\n" + traceback.format_exc())
+		return False
+
+	def write_summary(self):
+		self.logger.write("Pipeline: Stage summary")
+		for name in self.order:
+			stage = self.stages[name]
+			elapsed = stage.elapsed()
+			self.logger.write("  " + name.ljust(20) + stage.status.ljust(10) + ("" if elapsed is None else str(elapsed).split('.')[0]))
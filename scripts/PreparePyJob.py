@@ -5,6 +5,7 @@
 # This class instance is responsible for preparing the post-processing job file that submits the python scripts
 #  to clusters
 
+import sys
 import glob
 import Tools
 import Wait
@@ -28,14 +29,60 @@ class PreparePyJob:
 		self.logger.write("  5.b. Entering prepare_job(), constructing job file.")
 		fList = sorted(glob.glob(self.wrfOutDir + "/wrfout*"))
 		fileCount = len(fList)
-		out_job_contents = ""
 		self.logger.write("  5.b. " + str(fileCount) + " wrfout files have been found.")
 		if(fileCount <= 0):
 			# Something went wrong.
 			self.logger.write("  No files found, something is wrong, please check the output directory to ensure the wrfout* files are present.")
 			return False
+		self.write_job()
+		self.logger.write("   -> Starting Python Post Processing Script, moving this script to holding pattern")
+		# The job is started from its directory by the shell, a chdir here would move the other pipeline stages as well
+		jobSub = Tools.popen(self.aSet, "cd " + self.targetDir + " && ./python_post.job")	
+		return self.wait_job()
+		
+	# write_job: Writes python_post.job to the target directory, extraExports are added to the environment of the post-processor
+	def write_job(self, extraExports = ""):
+		out_job_contents = ""
 		out_job_contents += "#!/bin/bash\n"
 		out_job_contents += "source " + self.aSet.fetch("sourcefile") + "\n"
+		out_job_contents += self.job_commands(extraExports)
+		with open(self.targetDir + "/python_post.job", 'w') as target_file:
+			target_file.write(out_job_contents)		
+		Tools.popen(self.aSet, "chmod +x " + self.targetDir + "/python_post.job")
+		
+	# start_follow_job: Launches the post-processor in the background while WRF is still running, it picks up each wrfout file as
+	#  soon as it has been written. workerWalltime (minutes) must cover the rest of the WRF run as well as the post-processing.
+	def start_follow_job(self, workerWalltime):
+		self.logger.write("  5.b. Starting Python post-processing in follow mode, wrfout files are processed as WRF writes them.")
+		Tools.popen(self.aSet, "rm -f " + self.targetDir + "/pypost.log " + self.targetDir + "/wrf_complete.flag " + self.targetDir + "/wrf_failed.flag")
+		exports = ""
+		exports += "export PYTHON_POST_FOLLOW=1\n"
+		exports += "export PYTHON_POST_LASTTIME=" + self.aSet.endTime.strftime('%Y%m%d%H') + "\n"
+		exports += "export PYTHON_POST_WORKER_WALLTIME=" + str(workerWalltime) + "\n"
+		self.write_job(exports)
+		Tools.popen(self.aSet, "cd " + self.targetDir + " && ./python_post.job > python_post_follow.out 2>&1", storeOutput = False)
+		
+	# wait_job: Holds until the post-processor reports success or failure in pypost.log
+	def wait_job(self):
+		Tools.Process.instance().Lock()
+		try:
+			wCond = [{"logFile": self.targetDir + "/pypost.log", "contains": "***SUCCESS***", "retCode": 1},
+					 {"logFile": self.targetDir + "/pypost.log", "contains": "***FAIL***", "retCode": 2}]
+			waitCond = Wait.Wait(wCond, timeDelay = 60)
+			wRC = waitCond.hold()			
+			if wRC == 1:
+				Tools.Process.instance().Unlock()
+			elif wRC == 2:
+				self.logger.write("PreparePyJob(): Exit (Failed at python, Code 2)")
+				Tools.Process.instance().Unlock()
+				return False					
+		except Wait.TimeExpiredException:
+			sys.exit("Python post processing job not completed, abort.")	
+		return True
+			
+	# job_commands: The commands that run the python post-processor, also used by the single allocation job
+	def job_commands(self, extraExports = ""):
+		out_job_contents = ""
 		out_job_contents += "source activate " + self.aSet.fetch("condamodule") + "\n"
 		out_job_contents += "ulimit -s unlimited\n\n"
 		
@@ -44,32 +91,13 @@ class PreparePyJob:
 		out_job_contents += "export PYTHON_POST_NODES=" + self.aSet.fetch("num_python_nodes") + "\n"
 		out_job_contents += "export PYTHON_POST_THREADS=" + self.aSet.fetch("python_threads_per_rank") + "\n"
 		out_job_contents += "export PYTHON_POST_FIRSTTIME=" + self.aSet.fetch("starttime") + "\n"
-		out_job_contents += "export PYTHON_POST_LOG_DIR=" + self.targetDir + "/\n\n"
+		out_job_contents += "export PYTHON_POST_LOG_DIR=" + self.targetDir + "/\n"
+		out_job_contents += "export PYTHON_POST_SCRIPTS_DIR=" + self.aSet.fetch("headdir") + "scripts\n"
+		out_job_contents += extraExports + "\n"
 		
 		out_job_contents += "cd " + self.aSet.fetch("postdir") + "/Python\n\n"
 		
 		out_job_contents += "python PythonPost.py&\n"
 		out_job_contents += "PID_PyPost=$!\n"
 		out_job_contents += "wait $PID_PyPost\n\n"
-		
-		with Tools.cd(self.targetDir):
-			with open("python_post.job", 'w') as target_file:
-				target_file.write(out_job_contents)		
-			Tools.popen(self.aSet, "chmod +x python_post.job")
-			self.logger.write("   -> Starting Python Post Processing Script, moving this script to holding pattern")
-			jobSub = Tools.popen(self.aSet, "./python_post.job")	
-
-			try:
-				wCond = [{"waitCommand": "tail -n 3 pypost.log", "contains": "***SUCCESS***", "retCode": 1},
-						 {"waitCommand": "tail -n 3 pypost.log", "contains": "***FAIL***", "retCode": 2}]
-				waitCond = Wait.Wait(wCond, timeDelay = 60)
-				wRC = waitCond.hold()			
-				if wRC == 1:
-					Tools.Process.instance().Unlock()
-				elif wRC == 2:
-					self.logger.write("PreparePyJob(): Exit (Failed at python, Code 2)")
-					Tools.Process.instance().Unlock()
-					return False					
-			except Wait.TimeExpiredException:
-				sys.exit("Python post processing job not completed, abort.")	
-			return True
\ No newline at end of file
+		return out_job_contents
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+# Quilting.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the class used to estimate the size of each output write of wrf.exe, and the class used to size the I/O quilt servers
+#  (wrf_nio_groups, wrf_nio_tasks_per_group) and the Lustre striping (lfs_stripe_count) from it
+
+import os
+import glob
+import math
+import sqlite3
+import Cache
+import Decomposition
+import IOForms
+import IOVars
+import StepTiming
+import Telemetry
+import Tools
+
+# The output streams of the namelist template: (name, iofields stream number, interval entry, file name the Timing lines use)
+streams = [("history", 0, "history_interval", "wrfout_d01"), ("auxhist2", 2, "auxhist2_interval", "AFWA_d01"),
+		   ("auxhist5", 5, "auxhist5_interval", "subhr_d01"), ("auxhist23", 23, "auxhist23_interval", "pgrb3D_d01")]
+
+# WriteModel: Estimates the bytes of one write of each stream. The Registry is not read, each stream starts from the fields it holds
+#  with the physics of the namelist template: the 3D, soil, and pressure level fields by name, the 2D fields as a count. The lines
+#  of IO_VARS.txt then add or remove fields, a field not named here counts as a 2D field. The lists are rough and can be tuned to
+#  a build of WRF by changing the class attributes.
+class WriteModel:
+	bytesPerValue = 4
+	threeD = ["U", "V", "W", "PH", "PHB", "T", "THM", "P", "PB", "P_HYD", "QVAPOR", "QCLOUD", "QRAIN", "QICE", "QSNOW", "QGRAUP", "QHAIL",
+			  "QNICE", "QNRAIN", "CLDFRA", "REFL_10CM", "TKE_PBL", "EL_PBL", "QKE", "EDMF_A", "EDMF_W", "EDMF_THL", "EDMF_QT", "EDMF_ENT",
+			  "EDMF_QC", "H_DIABATIC"]
+	soil = ["TSLB", "SMOIS", "SH2O", "SMCREL"]
+	pressureLevel = ["T_PL", "S_PL", "U_PL", "V_PL", "Q_PL", "RH_PL", "GHT_PL", "TD_PL"]
+	# Vertical coordinates, constants, and scalars, too small to count
+	notGridded = ["ZNU", "ZNW", "ZS", "DZS", "FNM", "FNP", "RDNW", "RDN", "DNW", "DN", "CFN", "CFN1", "C1H", "C2H", "C1F", "C2F", "C3H",
+				  "C4H", "C3F", "C4F", "P_TOP", "T00", "P00", "TLP", "TISO", "TLP_STRAT", "P_STRAT", "RDX", "RDY", "RESM", "ZETATOP", "CF1",
+				  "CF2", "CF3", "ITIMESTEP", "XTIME", "THIS_IS_AN_IDEAL_RUN", "SAVE_TOPO_FROM_REAL", "MAX_MSTFX", "MAX_MSTFY",
+				  "ISEEDARR_SPPT", "ISEEDARR_SKEBS", "ISEEDARR_RAND_PERTURB", "ISEEDARRAY_SPP_CONV", "ISEEDARRAY_SPP_PBL", "ISEEDARRAY_SPP_LSM"]
+	named = {0: threeD + soil, 23: pressureLevel}
+	twoD = {0: 150, 2: 45, 5: 4, 23: 2}
+
+	# fields: The fields of each stream after the lines of IO_VARS.txt, {stream number: {"named": set of names, "2d": count}}
+	def fields(self, ioVars):
+		found = dict((number, {"named": set(self.named.get(number, [])), "2d": self.twoD.get(number, 0)}) for name, number, entry, prefix in streams)
+		for line in ioVars:
+			match = IOVars.ioVarsPattern.match(line.strip())
+			if not match or int(match.group(2)) not in found:
+				continue
+			entry = found[int(match.group(2))]
+			for name in [n.strip().upper() for n in match.group(3).split(',')]:
+				if not name or name in self.notGridded:
+					continue
+				known = name in self.threeD or name in self.soil or name in self.pressureLevel
+				if match.group(1) == '-':
+					if known:
+						entry["named"].discard(name)
+					else:
+						entry["2d"] = max(0, entry["2d"] - 1)
+				elif known:
+					entry["named"].add(name)
+				else:
+					entry["2d"] += 1
+		return found
+
+	# write_bytes: The bytes of one write of a stream with the given fields (See fields())
+	def write_bytes(self, fields, gridX, gridY, levels, soilLevels, pressureLevels):
+		values = fields["2d"]
+		for name in fields["named"]:
+			values += soilLevels if name in self.soil else pressureLevels if name in self.pressureLevel else (levels - 1)
+		return values * (gridX - 1) * (gridY - 1) * self.bytesPerValue
+
+# QuiltAdvisor: Recommends the I/O quilt servers and the stripe count from the size of each output write (See WriteModel) and how
+#  often it comes due in wall time. The quilt groups take the writes in turn, so a group has the time between writes times the
+#  number of groups to drain one. The write rate of a group is measured from the history writes of an earlier run of the same
+#  domain without quilting (wrf_timing.db), or taken from io_advisor_bandwidth. The wall time per model time comes from the steps
+#  of an earlier run of the same domain, the telemetry history, or wrf_walltime. Earlier quilted runs whose writes stalled the
+#  compute ranks get a group more. With io_advisor 1 the recommendations are only logged, with 2 they replace the control.txt
+#  values before the decomposition is chosen. Quilting is never turned on or off, striping is left off with lfs_stripe_count 0.
+class QuiltAdvisor:
+	headroom = 1.5
+	maxIOShare = 0.10
+	aSet = None
+	runDir = ""
+	model = None
+	logger = None
+
+	def __init__(self, settings, model = None):
+		self.aSet = settings
+		self.runDir = settings.fetch("wrfdir") + '/' + settings.fetch("starttime")[0:8]
+		self.model = model if model is not None else WriteModel()
+		self.logger = Tools.loggedPrint.instance()
+
+	def template(self):
+		return self.aSet.fetch("headdir") + "templates/namelist.input.template"
+
+	# io_vars: The lines of the IO_VARS.txt the run will use
+	def io_vars(self):
+		path = self.aSet.fetch("headdir") + "io_vars/IO_VARS.txt"
+		if self.aSet.fetch("use_io_vars") != '1' or not os.path.isfile(path):
+			return []
+		if self.aSet.fetch("io_vars_generate") == '1':
+			try:
+				return IOVars.io_vars_lines(self.aSet)[0]
+			except Exception as e:
+				self.logger.write("   - Quilting: Could not read the generated IO_VARS.txt fields (" + type(e).__name__ + ": " + str(e) + "), using io_vars/IO_VARS.txt")
+		with open(path, 'r') as source_file:
+			return source_file.readlines()
+
+	def forecast_hours(self):
+		return max(1, int(self.aSet.fetch("rundays")) * 24 + int(self.aSet.fetch("runhours")))
+
+	# estimate: The streams written by this run, [(name, file name in the Timing lines, bytes per write, interval in minutes)]
+	def estimate(self):
+		fields = self.model.fields(self.io_vars())
+		pressureLevels = int(Cache.namelist_value(self.template(), "num_press_levels") or 0)
+		found = []
+		for name, number, entry, prefix in streams:
+			interval = int(Cache.namelist_value(self.template(), entry) or 0)
+			if interval <= 0 or (number == 23 and Cache.namelist_value(self.template(), "p_lev_diags") != "1"):
+				continue
+			size = self.model.write_bytes(fields[number], int(self.aSet.fetch("e_we")), int(self.aSet.fetch("e_sn")), int(self.aSet.fetch("e_vert")),
+										  int(self.aSet.fetch("num_soil_layers")), pressureLevels)
+			if size > 0:
+				found.append((name, prefix, size, interval))
+		return found
+
+	# earlier_runs: The wrf_timing.db of earlier forecasts of the same domain, newest first: [(path, run info, summary, {file name: write seconds}, stalls)]
+	def earlier_runs(self):
+		domain = dict((key, self.aSet.fetch(key)) for key in ["e_we", "e_sn", "e_vert"])
+		paths = [p for p in glob.glob(self.aSet.fetch("wrfdir") + "/*/wrf_timing.db") if os.path.abspath(os.path.dirname(p)) != os.path.abspath(self.runDir)]
+		runs = []
+		for path in sorted(paths, key = os.path.getmtime, reverse = True):
+			try:
+				store = StepTiming.TimingStore(path)
+				info = store.info()
+				if StepTiming.same_domain(info, domain):
+					writes = dict((prefix, store.write_seconds(prefix)) for name, number, entry, prefix in streams)
+					runs.append((path, info, store.summary(), writes, store.stalls()))
+				store.close()
+			except sqlite3.Error:
+				continue
+		return runs
+
+	# step_rate: Wall seconds per model second of this run, and where the value came from. A timed run is scaled to the compute ranks of this run.
+	def step_rate(self, runs):
+		ranks = IOForms.compute_ranks(self.aSet, "wrf")
+		for path, info, summary, writes, stalls in runs:
+			runRanks = StepTiming.run_ranks(info)
+			if summary["steps"] > 0 and summary["dt"] > 0 and runRanks and ranks > 0:
+				return (summary["mean"] / summary["dt"] * runRanks / ranks, "the steps of " + path)
+		history = Telemetry.StageHistory(self.aSet)
+		model = history.model("wrf")
+		if model is not None:
+			return (model.predict(history.work(), int(self.aSet.fetch("num_wrf_nodes"))) * 60.0 / (self.forecast_hours() * 3600.0), "the telemetry history")
+		return (int(self.aSet.fetch("wrf_walltime")) * 60.0 / (self.forecast_hours() * 3600.0), "wrf_walltime")
+
+	# write_rate: The bytes per second one I/O group writes, and where the value came from
+	def write_rate(self, runs, historyBytes):
+		for path, info, summary, writes, stalls in runs:
+			if int(info.get("wrf_nio_groups", 0)) * int(info.get("wrf_nio_tasks_per_group", 0)) == 0 and writes["wrfout_d01"]:
+				median = StepTiming.percentile(writes["wrfout_d01"], 0.5)
+				if median > 0:
+					return (historyBytes / median, "the history writes of " + path)
+		return (float(self.aSet.fetch("io_advisor_bandwidth")) * 1024 * 1024, "io_advisor_bandwidth")
+
+	# tasks_per_group: The fewest I/O tasks that keep the share of the largest write each one gathers under io_advisor_task_mb. When the
+	#  decomposition is planned (wrf_detect_proc_count 1), up to twice as many are tried for a count that divides its nproc_y.
+	def tasks_per_group(self, largest, groups):
+		tasks = max(1, int(math.ceil(largest / (float(self.aSet.fetch("io_advisor_task_mb")) * 1024 * 1024))))
+		if self.aSet.fetch("wrf_detect_proc_count") != '1':
+			return tasks
+		for count in range(tasks, 2 * tasks + 1):
+			det = Decomposition.plan_decomposition(int(self.aSet.fetch("e_we")), int(self.aSet.fetch("e_sn")), int(self.aSet.fetch("num_wrf_nodes")),
+												   int(self.aSet.fetch("wrf_mpi_ranks_per_node")), groups, count, int(self.aSet.fetch("wrf_numtiles")))
+			if det is not None and det.nioGroups == groups and det.nprocY % count == 0:
+				return count
+		return tasks
+
+	def megabytes(self, value):
+		return "%.0f MB" % (value / (1024.0 * 1024.0))
+
+	def advise(self):
+		mode = self.aSet.fetch("io_advisor")
+		if mode not in ['1', '2']:
+			return
+		apply = (mode == '2')
+		found = self.estimate()
+		if not found:
+			self.logger.write("   - Quilting: No output streams are written, nothing to size")
+			return
+		for name, prefix, size, interval in found:
+			self.logger.write("   - Quilting: " + name + " " + self.megabytes(size) + " per write, every " + str(interval) + " minutes of model time")
+		runs = self.earlier_runs()
+		rate, rateSource = self.step_rate(runs)
+		historyBytes = sum(size for name, prefix, size, interval in found if name == "history")
+		bandwidth, bandwidthSource = self.write_rate(runs, historyBytes)
+		# The share of the wall time one I/O group spends writing, each write comes due every interval x 60 x rate wall seconds
+		load = sum((size / bandwidth) / (interval * 60.0 * rate) for name, prefix, size, interval in found)
+		self.logger.write("   - Quilting: The writes take " + ("%.1f" % (load * 100)) + "% of the run at " + self.megabytes(bandwidth) + "/s (From " + bandwidthSource +
+						  "), " + ("%.2f" % rate) + " wall seconds per model second (From " + rateSource + ")")
+		nioGroups = int(self.aSet.fetch("wrf_nio_groups"))
+		nioTasks = int(self.aSet.fetch("wrf_nio_tasks_per_group"))
+		tasks = 1
+		if nioGroups * nioTasks == 0:
+			self.logger.write("   - Quilting: Quilting is off (wrf_nio_groups x wrf_nio_tasks_per_group is 0), the compute ranks wait on every write. " +
+							  str(max(1, int(math.ceil(load * self.headroom)))) + " I/O groups would keep up with the output.")
+		else:
+			groups = max(1, int(math.ceil(load * self.headroom)))
+			for path, info, summary, writes, stalls in runs:
+				runGroups = int(info.get("wrf_nio_groups", 0))
+				if stalls and runGroups * int(info.get("wrf_nio_tasks_per_group", 0)) > 0 and groups <= runGroups:
+					self.logger.write("   - Quilting: " + str(len(stalls)) + " writes stalled the compute ranks with " + str(runGroups) + " I/O groups in " + path)
+					groups = runGroups + 1
+			tasks = self.tasks_per_group(max(size for name, prefix, size, interval in found), groups)
+			totalRanks = int(self.aSet.fetch("num_wrf_nodes")) * int(self.aSet.fetch("wrf_mpi_ranks_per_node"))
+			maxGroups = max(1, int(totalRanks * self.maxIOShare) // tasks)
+			if groups > maxGroups:
+				self.logger.write("   - Quilting: " + str(groups) + " I/O groups of " + str(tasks) + " would take more than " + ("%.0f" % (self.maxIOShare * 100)) +
+								  "% of the WRF ranks, using " + str(maxGroups))
+				groups = maxGroups
+			self.logger.write("   - Quilting: wrf_nio_groups " + str(groups) + " (Set to " + str(nioGroups) + "), wrf_nio_tasks_per_group " + str(tasks) +
+							  " (Set to " + str(nioTasks) + ")")
+			if apply:
+				if groups != nioGroups:
+					self.aSet.apply_setting("wrf_nio_groups", str(groups))
+				if tasks != nioTasks:
+					self.aSet.apply_setting("wrf_nio_tasks_per_group", str(tasks))
+		# The largest file written: with quilting the history is split into one file per I/O task (io_form_history 102), unless UPP runs
+		splitHistory = self.aSet.fetch("post_run_unipost") != '1'
+		largestFile = max((size / tasks if name == "history" and splitHistory else size) for name, prefix, size, interval in found)
+		stripes = max(1, min(int(self.aSet.fetch("io_advisor_max_stripes")), int(math.ceil(largestFile / (float(self.aSet.fetch("io_advisor_stripe_mb")) * 1024 * 1024)))))
+		if int(self.aSet.fetch("lfs_stripe_count")) <= 0:
+			self.logger.write("   - Quilting: lfs_stripe_count is 0, striping is left off (" + str(stripes) + " stripes would fit the largest file of " + self.megabytes(largestFile) + ")")
+			return
+		self.logger.write("   - Quilting: lfs_stripe_count " + str(stripes) + " (Set to " + self.aSet.fetch("lfs_stripe_count") + "), the largest file is " + self.megabytes(largestFile))
+		if apply and str(stripes) != self.aSet.fetch("lfs_stripe_count"):
+			self.aSet.apply_setting("lfs_stripe_count", str(stripes))
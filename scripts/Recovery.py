@@ -0,0 +1,163 @@
+#!/usr/bin/python
+# Recovery.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the class used to run a failed wrf.exe job again from its newest restart file, with settings adjusted to the kind of failure
+
+import math
+import Cache
+import Decomposition
+import RslLogs
+import Stability
+import Template
+import Tools
+
+# The scheduler reasons (JobTracker.reason()) of a job killed at its walltime, lost to a node, or killed for its memory use
+walltimeReasons = ["TIMEOUT", "DEADLINE", "Exit_status -29"]
+nodeReasons = ["NODE_FAIL", "BOOT_FAIL", "LAUNCH_FAILED"]
+memoryReasons = ["OUT_OF_MEMORY"]
+
+# The namelist entries of the time step, they are carried over when namelist.input.wrf is written again (IE: After the StabilityMonitor lowered them)
+timeStepKeys = ["time_step", "max_time_step", "starting_time_step", "min_time_step", "target_cfl"]
+
+# classify: The kind of failure from the scheduler reason of the job, its runtime against its walltime (Both in minutes), and the rsl
+#  index of every rank (See RslLogs.scan()): walltime, node, memory, cfl, io, or other
+def classify(index, reason, runtime, walltime):
+	found = index["signatures"] if index is not None else {}
+	if reason in walltimeReasons or (runtime is not None and runtime >= 0.95 * walltime):
+		return "walltime"
+	if reason in nodeReasons:
+		return "node"
+	if reason in memoryReasons or "memory" in found:
+		return "memory"
+	if "cfl" in found or "nan" in found:
+		return "cfl"
+	if "io" in found:
+		return "io"
+	if ("signal" in found or "mpi_abort" in found) and "fatal" not in found:
+		# A rank died without wrf.exe reporting an error, IE: The node under it went down
+		return "node"
+	return "other"
+
+# Recovery: Decides if a failed wrf job is run again and with what. Each kind of failure (See classify()) has a policy: a CFL blow-up
+#  runs again with a smaller time step (wrf_stability_dt_factor), a run that hit its walltime or ran out of memory on more nodes
+#  (wrf_recovery_node_factor, up to wrf_recovery_max_nodes), an I/O error or a lost node as it was. Any other failure (IE: A bad
+#  namelist) is not run again. namelist.input.wrf is written again from the template with the new settings and set to restart from
+#  the newest complete restart file, at most wrf_recovery_attempts times per forecast. Each attempt is written to the log.
+class Recovery:
+	policies = {"cfl": ["time_step"], "walltime": ["nodes"], "memory": ["nodes"], "io": [], "node": []}
+	aSet = None
+	runDir = ""
+	tracker = None
+	stability = None
+	attempts = 0
+	lastRestart = None
+	rewriteJobs = None
+	logger = None
+
+	# rewriteJobs: Writes the job files again after num_wrf_nodes changed (Set by Application), more nodes are not tried without it
+	def __init__(self, settings, runDir, tracker, stability, rewriteJobs = None):
+		self.aSet = settings
+		self.runDir = runDir
+		self.tracker = tracker
+		self.stability = stability
+		self.attempts = 0
+		self.lastRestart = None
+		self.rewriteJobs = rewriteJobs
+		self.logger = Tools.loggedPrint.instance()
+
+	def enabled(self):
+		return int(self.aSet.fetch("wrf_recovery_attempts")) > 0 and self.aSet.fetch("debugmode") != '1'
+
+	# prepare_retry: Classifies the failure of the wrf job jobID (Run with the given walltime in minutes and namelist) and prepares the run
+	#  again, returns False if it should not be run again. index is the rsl index of the run when its files were already collected,
+	#  otherwise the files in the output directory are scanned. A segment of a restart-chunked run (wrf_segments) passes useRestart
+	#  False, it starts from where it began, the segment namelists are then written again from namelist.input.wrf by the caller.
+	#  A run that would start from the same point with the same settings is not run again, it would fail the same way: a run that hit
+	#  its walltime or ran out of memory needs more nodes or a newer restart file, any other kind a change of settings or a newer restart file.
+	def prepare_retry(self, jobID, walltime, namelist, useRestart = True, index = None):
+		if not self.enabled():
+			return False
+		rsl = RslLogs.RslLogs(self.aSet, self.runDir)
+		if index is None and rsl.files():
+			index = rsl.scan()
+		reason = self.tracker.reason(jobID)
+		kind = classify(index, reason, self.tracker.runtime(jobID), walltime)
+		found = index["signatures"] if index is not None else {}
+		detail = " (Job " + str(jobID) + ("" if not reason else ", " + reason) + ")"
+		for name, entry in RslLogs.signatures_in_order(found)[:1]:
+			detail += ", rank " + str(entry["rank"]) + ": " + entry["line"]
+		if kind not in self.policies:
+			self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail + ", this kind of failure is not run again")
+			return False
+		if self.attempts >= int(self.aSet.fetch("wrf_recovery_attempts")):
+			self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail + ", all " + self.aSet.fetch("wrf_recovery_attempts") + " attempts have been used")
+			return False
+		restartFile, restartTime = self.stability.latest_restart() if useRestart else (None, None)
+		newRestart = restartFile is not None and restartFile != self.lastRestart
+		interval = int(self.aSet.fetch("wrf_recovery_restart_interval")) if useRestart else 0
+		runInterval = Cache.namelist_value(namelist, "restart_interval")
+		lowerInterval = interval > 0 and runInterval is not None and int(runInterval) > interval
+		changes = []
+		if "nodes" in self.policies[kind]:
+			changes.append(self.add_nodes())
+			if changes[-1] is None and not newRestart:
+				self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail + ", no nodes can be added (wrf_recovery_max_nodes) and there is no newer " +
+								  "restart file, it would fail the same way and is not run again")
+				return False
+		elif not self.policies[kind] and not lowerInterval and not newRestart:
+			self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail + ", neither the settings nor the restart point would change, it is not run again")
+			return False
+		self.attempts += 1
+		label = "wrf_failed_" + str(self.attempts)
+		collected = rsl.collect(label)
+		wrfNamelist = self.runDir + "/output/namelist.input.wrf"
+		carried = dict((key, Cache.namelist_value(namelist, key)) for key in timeStepKeys)
+		# The namelist is written from the template with the current settings (IE: The new nproc_x / nproc_y), the time step of the failed run is kept
+		Template.Template_Writer(self.aSet).generateTemplatedFile(self.aSet.fetch("headdir") + "templates/namelist.input.template", wrfNamelist)
+		for key, value in carried.items():
+			if value is not None:
+				Cache.set_namelist_value(wrfNamelist, key, value)
+		if "time_step" in self.policies[kind]:
+			change = self.stability.lower_time_step(wrfNamelist)
+			if change is None:
+				self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail + ", the time step cannot be lowered any further, it is not run again")
+				return False
+			changes.append(change)
+		if useRestart:
+			if interval > 0 and int(Cache.namelist_value(wrfNamelist, "restart_interval")) > interval:
+				# Leave restart files behind this time, so a further failure does not start over
+				Cache.set_namelist_value(wrfNamelist, "restart_interval", interval)
+				if lowerInterval:
+					changes.append("restart_interval " + str(interval) + " minutes")
+			if restartFile is not None:
+				Stability.set_restart(wrfNamelist, restartTime)
+				self.lastRestart = restartFile
+		changes = [c for c in changes if c is not None]
+		self.logger.write("Recovery: wrf.exe failed (" + kind + ")" + detail)
+		self.logger.write("Recovery: Attempt " + str(self.attempts) + " of " + self.aSet.fetch("wrf_recovery_attempts") + ", running wrf.exe again " +
+						  (("from " + restartFile.rsplit('/', 1)[-1]) if restartFile is not None else "from the start" if useRestart else "from the start of the segment") +
+						  (" with " + ", ".join(changes) if changes else " with the same settings") +
+						  ("" if collected is None else ", the logs of the failed run are in rsl_" + label + ".json"))
+		return True
+
+	# add_nodes: Raises num_wrf_nodes by wrf_recovery_node_factor (Up to wrf_recovery_max_nodes), plans the decomposition for the new node
+	#  count and writes the job files again. Returns a description of the change, or None if the node count stays.
+	def add_nodes(self):
+		nodes = int(self.aSet.fetch("num_wrf_nodes"))
+		newNodes = min(int(self.aSet.fetch("wrf_recovery_max_nodes")), int(math.ceil(nodes * float(self.aSet.fetch("wrf_recovery_node_factor")))))
+		if newNodes <= nodes or self.rewriteJobs is None:
+			return None
+		if self.aSet.fetch("wrf_detect_proc_count") == '1':
+			det = Decomposition.plan_decomposition(int(self.aSet.fetch("e_we")), int(self.aSet.fetch("e_sn")), newNodes, int(self.aSet.fetch("wrf_mpi_ranks_per_node")),
+												   int(self.aSet.fetch("wrf_nio_groups")), int(self.aSet.fetch("wrf_nio_tasks_per_group")), int(self.aSet.fetch("wrf_numtiles")))
+			if det is None:
+				self.logger.write("Recovery: No decomposition fits on " + str(newNodes) + " nodes, keeping " + str(nodes))
+				return None
+			self.aSet.add_replacementKey("[nproc_x]", str(det.nprocX))
+			self.aSet.add_replacementKey("[nproc_y]", str(det.nprocY))
+			if det.nioGroups != int(self.aSet.fetch("wrf_nio_groups")):
+				self.aSet.apply_setting("wrf_nio_groups", str(det.nioGroups))
+		self.aSet.apply_setting("num_wrf_nodes", str(newNodes))
+		self.rewriteJobs()
+		return "num_wrf_nodes " + str(newNodes) + " (Was " + str(nodes) + ")"
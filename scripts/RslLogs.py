@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# RslLogs.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the class used to scan the rsl.out / rsl.error files of every rank for errors and pack them into one archive per run
+
+import os
+import re
+import json
+import tarfile
+import datetime
+from multiprocessing.pool import ThreadPool
+import FileOps
+import Tools
+
+# The signatures looked for in each rank's files, the first alternative that matches a line names it (IE: Bus error is a signal, not an error)
+signatures = [("success", rb"SUCCESS COMPLETE"),
+			  ("fatal", rb"FATAL"),
+			  ("signal", rb"forrtl: severe|SIGSEGV|SIGBUS|Segmentation fault|Bus error|signal \d+"),
+			  ("mpi_abort", rb"MPI_ABORT|MPI_Abort"),
+			  ("memory", rb"[Oo]ut of memory|oom-kill|Cannot allocate memory"),
+			  ("nan", rb"\b(?:NaN|nan|NAN|Infinity)\b"),
+			  ("cfl", rb"points exceeded cfl"),
+			  ("io", rb"NetCDF error|ncmpi_|[Uu]nable to open|No space left on device|Input/output error|Stale file handle|Disk quota exceeded"),
+			  ("error", rb"\bERROR\b|\b[Ee]rror\b|RUNTIME|runtime")]
+signaturePattern = re.compile(b"|".join(b"(?P<" + name.encode() + b">" + pattern + b")" for name, pattern in signatures))
+
+rslPattern = re.compile(r"^rsl\.(out|error)\.(\d+)$")
+
+# rank_ranges: Writes a list of ranks as ranges (IE: [0, 1, 2, 3, 7] becomes 0-3,7)
+def rank_ranges(ranks):
+	ranges = []
+	for rank in sorted(set(ranks)):
+		if ranges and rank == ranges[-1][1] + 1:
+			ranges[-1][1] = rank
+		else:
+			ranges.append([rank, rank])
+	return ",".join(str(a) if a == b else str(a) + "-" + str(b) for a, b in ranges)
+
+# scan_file: Counts the lines matching each signature in one file, returns (path, rank, {signature: [count, first matching line]})
+def scan_file(path):
+	found = {}
+	try:
+		with open(path, 'rb') as source_file:
+			data = source_file.read()
+	except OSError:
+		return (path, None, found)
+	lastLines = {}
+	for match in signaturePattern.finditer(data):
+		lineStart = data.rfind(b'\n', 0, match.start()) + 1
+		if lastLines.get(match.lastgroup) == lineStart:
+			# Counted once per line
+			continue
+		lastLines[match.lastgroup] = lineStart
+		entry = found.get(match.lastgroup)
+		if entry is None:
+			lineEnd = data.find(b'\n', match.end())
+			line = data[lineStart:lineEnd if lineEnd != -1 else len(data)].decode('utf-8', errors = 'replace').strip()
+			found[match.lastgroup] = [1, line[:200]]
+		else:
+			entry[0] += 1
+	return (path, int(rslPattern.match(os.path.basename(path)).group(2)), found)
+
+# RslLogs: Handles the rsl files wrf.exe and real.exe leave in the output directory, one for every rank. The files are listed with
+#  a single readdir and scanned by a thread pool. An index of which ranks reported which signature (rsl_<label>.json) and an
+#  archive of every file (rsl_<label>.tar.gz) are written to the run directory, then the files are removed in one FileOps batch.
+#  Rank 0's files can be kept under another name (IE: wrf_log.txt) for the checks that read them after the run.
+class RslLogs:
+	aSet = None
+	runDir = ""
+	outDir = ""
+	threads = 8
+	logger = None
+
+	# logDir: Where the rsl files are when not in the output directory (IE: The wrf_seg<k> directory a segment of wrf.exe moves them to)
+	def __init__(self, settings, runDir, logDir = None):
+		self.aSet = settings
+		self.runDir = runDir
+		self.outDir = logDir if logDir is not None else runDir + "/output"
+		self.threads = max(1, int(settings.fetch("fileops_threads")))
+		self.logger = Tools.loggedPrint.instance()
+
+	def files(self):
+		try:
+			names = os.listdir(self.outDir)
+		except OSError:
+			return []
+		return sorted(os.path.join(self.outDir, n) for n in names if rslPattern.match(n))
+
+	# scan: Scans the rsl files of every rank, returns the index: {"files", "ranks", "signatures": {name: {"ranks", "rank_count", "count", "rank", "line"}}}
+	#  where ranks is a range list of the ranks reporting the signature, count the number of lines, and rank / line the first of them and its line
+	def scan(self, paths = None):
+		paths = self.files() if paths is None else paths
+		pool = ThreadPool(processes = self.threads)
+		try:
+			results = pool.map(scan_file, paths)
+		finally:
+			pool.close()
+			pool.join()
+		ranks = set()
+		bySignature = {}
+		for path, rank, found in results:
+			if rank is None:
+				continue
+			ranks.add(rank)
+			for name, (count, line) in found.items():
+				entry = bySignature.setdefault(name, {"rankList": set(), "count": 0, "rank": None, "line": ""})
+				entry["rankList"].add(rank)
+				entry["count"] += count
+				if entry["rank"] is None or rank < entry["rank"]:
+					entry["rank"] = rank
+					entry["line"] = line
+		index = {"time": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "files": len(paths), "ranks": len(ranks), "signatures": {}}
+		for name, entry in bySignature.items():
+			index["signatures"][name] = {"ranks": rank_ranges(entry["rankList"]), "rank_count": len(entry["rankList"]), "count": entry["count"],
+										 "rank": entry["rank"], "line": entry["line"]}
+		if "success" in bySignature:
+			# The ranks that never got to the end, IE: The one that was killed while the others waited on it
+			index["no_success"] = rank_ranges(ranks - bySignature["success"]["rankList"])
+		return index
+
+	# report: Writes the signatures other than success to the log, along with the number of ranks that reported success
+	def report(self, label, index):
+		found = index["signatures"]
+		self.logger.write("RslLogs(" + label + "): " + str(index["files"]) + " files from " + str(index["ranks"]) + " ranks, " +
+						  str(found["success"]["rank_count"] if "success" in found else 0) + " reported success")
+		if index.get("no_success"):
+			self.logger.write("  - No success reported by ranks " + index["no_success"])
+		for name, entry in signatures_in_order(found):
+			self.logger.write("  - " + name + " on ranks " + entry["ranks"] + " (" + str(entry["count"]) + " lines), rank " + str(entry["rank"]) + ": " + entry["line"])
+
+	# inspect: Scans and reports the rsl files without touching them (IE: After a failed run, before anything is removed)
+	def inspect(self, label):
+		if(self.aSet.fetch("debugmode") == '1'):
+			return None
+		paths = self.files()
+		if not paths:
+			return None
+		index = self.scan(paths)
+		self.report(label, index)
+		return index
+
+	# unique_base: rsl_<label> in the run directory, numbered if an earlier collect() with the same label already used it
+	def unique_base(self, label):
+		base = self.runDir + "/rsl_" + label
+		i = 2
+		while os.path.exists(base + ".json") or os.path.exists(base + ".tar.gz"):
+			base = self.runDir + "/rsl_" + label + "_" + str(i)
+			i += 1
+		return base
+
+	# collect: Scans, indexes, archives (With rsl_archive 1) and removes the rsl files, keep maps file names to where they are moved
+	#  instead (IE: {"rsl.out.0000": runDir + "/wrf_log.txt"}). Returns the index, or None when there were no rsl files.
+	def collect(self, label, keep = None):
+		keep = keep if keep is not None else {}
+		if(self.aSet.fetch("debugmode") == '1'):
+			print("D: scan, archive and remove " + self.outDir + "/rsl.* (" + label + ")")
+			return None
+		paths = self.files()
+		if not paths:
+			return None
+		index = self.scan(paths)
+		base = self.unique_base(label)
+		if self.aSet.fetch("rsl_archive") == '1':
+			archivePath = base + ".tar.gz"
+			try:
+				with tarfile.open(archivePath, "w:gz", compresslevel = 6) as archive:
+					for path in paths:
+						archive.add(path, arcname = "rsl_" + label + "/" + os.path.basename(path))
+				index["archive"] = archivePath
+			except (OSError, tarfile.TarError) as e:
+				self.logger.write("RslLogs(" + label + "): Could not write " + archivePath + " (" + str(e) + "), the rsl files have been left in place")
+				return index
+		with open(base + ".json", 'w') as target_file:
+			json.dump(index, target_file, indent = 1, sort_keys = True)
+		self.report(label, index)
+		ops = FileOps.FileOps(self.aSet, "rsl " + label)
+		for name, target in keep.items():
+			if os.path.exists(os.path.join(self.outDir, name)):
+				ops.move(os.path.join(self.outDir, name), target)
+		ops.delete(self.outDir + "/rsl.out.*")
+		ops.delete(self.outDir + "/rsl.error.*")
+		ops.run()
+		return index
+
+# signatures_in_order: The signatures of an index other than success, in the order of the signatures list
+def signatures_in_order(found):
+	return [(name, found[name]) for name, pattern in signatures if name in found and name != "success"]
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# RunState.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the class used to record the progress of a forecast in its run directory, so an interrupted run can be picked up with --resume
+
+import os
+import json
+import hashlib
+import datetime
+import threading
+import Tools
+
+# quick_checksum: Fingerprints an output file from its size and the first and last megabyte of its contents. The wrfout files are
+#  several GB each, reading all of them back on every resume would take longer than most of the steps they came from.
+def quick_checksum(path):
+	size = os.path.getsize(path)
+	digest = hashlib.sha1()
+	with open(path, 'rb') as source_file:
+		digest.update(source_file.read(1048576))
+		if size > 2097152:
+			source_file.seek(-1048576, os.SEEK_END)
+			digest.update(source_file.read(1048576))
+	return str(size) + ":" + digest.hexdigest()
+
+# RunState: Keeps run_state.json in the run directory, one entry per stage (IE: geogrid, ungrib.3D, wrf) with its status (SUBMITTED,
+#  COMPLETED, FAILED), the job ID it was submitted as, and the checksums of the files it produced. A new run starts with an empty
+#  state, a resumed run loads the file so finished stages can be skipped and jobs still in the queue can be followed again.
+class RunState:
+	path = ""
+	resuming = False
+	stages = {}
+	lock = None
+	logger = None
+
+	def __init__(self, runDir, resume = False):
+		self.path = runDir + "/run_state.json"
+		self.resuming = resume
+		self.stages = {}
+		self.lock = threading.RLock()
+		self.logger = Tools.loggedPrint.instance()
+		if resume:
+			self.load()
+
+	def load(self):
+		if not os.path.isfile(self.path):
+			self.logger.write("RunState: No run state found at " + self.path + ", every stage will run")
+			return
+		try:
+			with open(self.path, 'r') as source_file:
+				self.stages = json.load(source_file).get("stages", {})
+		except (OSError, ValueError) as e:
+			self.logger.write("RunState: Could not read " + self.path + " (" + str(e) + "), every stage will run")
+			self.stages = {}
+			return
+		for stage in sorted(self.stages):
+			self.logger.write("RunState: " + stage + " was " + self.stages[stage]["status"] +
+							  ("" if self.stages[stage].get("jobID") is None else " (Job " + str(self.stages[stage]["jobID"]) + ")"))
+
+	# save: The file is written to a temporary name first, so an interrupted write never leaves a partial state behind
+	def save(self):
+		with self.lock:
+			if not os.path.isdir(os.path.dirname(self.path)):
+				return
+			tmpPath = self.path + ".tmp"
+			with open(tmpPath, 'w') as target_file:
+				json.dump({"updated": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "stages": self.stages}, target_file, indent = 1, sort_keys = True)
+			os.replace(tmpPath, self.path)
+
+	def record(self, stage, status, jobID = None, outputs = None):
+		with self.lock:
+			entry = self.stages.get(stage, {})
+			entry["status"] = status
+			entry["time"] = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+			if jobID is not None:
+				entry["jobID"] = jobID
+			if outputs is not None:
+				entry["outputs"] = {}
+				for fPath in outputs:
+					try:
+						entry["outputs"][fPath] = quick_checksum(fPath)
+					except OSError:
+						pass
+			self.stages[stage] = entry
+			self.save()
+
+	def submitted(self, stage, jobID):
+		self.record(stage, "SUBMITTED", jobID = jobID)
+
+	# finished: Records the result of a stage, the checksums are only taken when it completed
+	def finished(self, stage, result, outputs = None):
+		self.record(stage, "COMPLETED" if result else "FAILED", outputs = (outputs if outputs is not None else []) if result else None)
+		return result
+
+	# job_id: The job a stage was still running as when the state was last saved, or None if it is not waiting on a job
+	def job_id(self, stage):
+		with self.lock:
+			entry = self.stages.get(stage)
+			if entry is None or entry["status"] != "SUBMITTED":
+				return None
+			return entry.get("jobID")
+
+	# is_complete: True if the stage completed and every file it produced is still there unchanged
+	def is_complete(self, stage):
+		with self.lock:
+			entry = self.stages.get(stage)
+			if entry is None or entry["status"] != "COMPLETED":
+				return False
+			for fPath, checksum in entry.get("outputs", {}).items():
+				try:
+					if quick_checksum(fPath) != checksum:
+						self.logger.write("RunState: " + fPath + " changed since " + stage + " completed, the stage will run again")
+						return False
+				except OSError:
+					self.logger.write("RunState: " + fPath + " is missing, " + stage + " will run again")
+					return False
+			return True
@@ -4,15 +4,24 @@
 #
 # Contains methods to generate different job-scripts based on the scheduling system
 
+import re
+import time
+import threading
+import subprocess
 from datetime import timedelta
+import Tools
 
 # Scheduler_Settings: Class responsible for storing the information about different schedulers
 class Scheduler_Settings:
 	stored_table = {}
 	scheduler = ""
+	binDir = None
 	
-	def __init__(self, scheduler):
+	def __init__(self, scheduler, binDir = None):
 		self.scheduler = scheduler
+		# binDir allows the scheduler commands to be taken from a specific directory (IE: A set of stand-in scripts for testing)
+		if binDir is not None and binDir != "none":
+			self.binDir = binDir
 		self.stored_table = {
 			"COBALT": {
 				"header-type": "#!/bin/bash",
@@ -38,6 +47,17 @@ class Scheduler_Settings:
 						   "--env OMP_NUM_THREADS=$n_openmp_threads_per_rank --cc depth \\\n" +
 						   "-d $n_hardware_threads_skipped_between_ranks \\\n" +
 						   "-j $n_hardware_threads_per_core",
+				"jobid-regex": "(\\d+)",
+				"statcmd": "qstat [job_ids]",
+				"acctcmd": None,
+				"acct-per-job": False,
+				"unknown-regex": None,
+				"cancelcmd": "qdel",
+				"id-sep": " ",
+				"dependency": "--dependencies [job_ids]",
+				"dep-sep": ":",
+				"nodecmd": "aprun -n $COBALT_JOBSIZE -N 1",
+				"bcastcmd": None,
 			},
 			
 			"PBS": {
@@ -56,6 +76,17 @@ class Scheduler_Settings:
 				"subcmd": "qsub",				
 				"runcmd": "mpirun",
 				"subargs": "-n [total_processors]",
+				"jobid-regex": "^\\s*(\\d+[\\w\\.\\-\\[\\]]*)",
+				"statcmd": "qstat -f [job_ids]",
+				"acctcmd": "tracejob -q -n 7 [job_ids]",
+				"acct-per-job": True,
+				"unknown-regex": "Unknown Job Id",
+				"cancelcmd": "qdel",
+				"id-sep": " ",
+				"dependency": "-W depend=afterok:[job_ids]",
+				"dep-sep": ":",
+				"nodecmd": "pbsdsh -u",
+				"bcastcmd": None,
 			},
 
 			"SLURM": {
@@ -73,7 +104,18 @@ class Scheduler_Settings:
 				"time-format": "timestring",
 				"subcmd": "sbatch",
 				"runcmd": "srun",
-				"subargs": "-n [total_processors]"
+				"subargs": "-n [total_processors]",
+				"jobid-regex": "Submitted batch job (\\d+)",
+				"statcmd": "squeue -h -o \"%i %T\" -j [job_ids]",
+				"acctcmd": "sacct -n -X -P -o JobID,State -j [job_ids]",
+				"acct-per-job": False,
+				"unknown-regex": "Invalid job id",
+				"cancelcmd": "scancel",
+				"id-sep": ",",
+				"dependency": "--dependency=afterok:[job_ids]",
+				"dep-sep": ":",
+				"nodecmd": "srun --ntasks-per-node=1 -N $SLURM_JOB_NUM_NODES",
+				"bcastcmd": "sbcast -f",
 			},	
 
 		}
@@ -87,6 +129,46 @@ class Scheduler_Settings:
 	def getScheduler(self):
 		return self.scheduler
 		
+	# command: Returns the scheduler command stored under key, prefixed by binDir when one is set
+	def command(self, key):
+		cmd = self.fetch()[key]
+		if cmd is None or self.binDir is None:
+			return cmd
+		return self.binDir.rstrip('/') + '/' + cmd
+		
+	# job_header: The shebang and scheduler directives of a job file, directives the scheduler does not have are left out
+	def job_header(self, account, jobName, nodes, ranksPerNode, walltime, queue):
+		table = self.fetch()
+		header = table["header-type"] + '\n'
+		if table["header-jobname"] is not None:
+			header += table["header-tag"] + " " + table["header-jobname"] + " " + jobName + '\n'
+		if table["header-account"] is not None:
+			header += table["header-tag"] + " " + table["header-account"] + " " + account + '\n'
+		if(self.scheduler == "PBS"):
+			header += (table["header-tag"] + " " + table["header-nodes"] + table["header-sep"] + str(nodes) 
+					   + ":" + table["header-tasks"] + table["header-sep"] + str(ranksPerNode) + '\n')
+		else:
+			if table["header-nodes"] is not None:
+				header += table["header-tag"] + " " + table["header-nodes"] + table["header-sep"] + str(nodes) + '\n'
+			if table["header-tasks"] is not None:
+				header += table["header-tag"] + " " + table["header-tasks"] + table["header-sep"] + str(ranksPerNode) + '\n'
+		if table["header-jobtime"] is not None:
+			header += table["header-tag"] + " " + table["header-jobtime"] + table["header-sep"] + str(self.convert_to_timestring(walltime)) + '\n'
+		if table["header-jobqueue"] is not None:
+			# RF: Eventually I may change this for different schedulers, but for now this is fine.
+			header += table["header-tag"] + " " + table["header-jobqueue"] + " " + queue
+		return header
+		
+	# fill: The table entry under key (IE: extra-exports, subargs) with its replacement keys taken from values, None if the scheduler
+	#  does not have the entry. Used where the settings' own replacement keys cannot be changed (Jobs running on other threads)
+	def fill(self, key, values):
+		entry = self.fetch()[key]
+		if entry is None:
+			return None
+		for rKey in values:
+			entry = entry.replace(rKey, str(values[rKey]))
+		return entry
+		
 	def convert_to_timestring(self, min):
 		if (self.fetch()["time-format"] == "timestring"):
 			delta = timedelta(minutes = int(min))
@@ -95,4 +177,246 @@ class Scheduler_Settings:
 		elif (self.fetch()["time-format"] == "minutes"):
 			return min
 		else:
-			return None
\ No newline at end of file
+			return None
+			
+# JobTracker: Class responsible for submitting job files and tracking their state through the scheduler
+#  All tracked jobs are queried with a single status command, and the result is cached for pollInterval seconds.
+#  States are normalized to PENDING, RUNNING, COMPLETED, FAILED, or FINISHED (Left the queue with an unknown exit status)
+#  The tracker may be shared by stages running in different threads, polling and bookkeeping are done under lock.
+class JobTracker:
+	scheduleParms = None
+	aSet = None
+	logger = None
+	jobs = {}
+	states = {}
+	reasons = {}
+	started = {}
+	ended = {}
+	lastPoll = 0
+	pollInterval = 60
+	lock = None
+	terminalStates = ["COMPLETED", "FAILED", "FINISHED"]
+	
+	slurmStates = {
+		"PENDING": "PENDING", "CONFIGURING": "PENDING", "REQUEUED": "PENDING", "RESV_DEL_HOLD": "PENDING", "REQUEUE_HOLD": "PENDING",
+		"RUNNING": "RUNNING", "COMPLETING": "RUNNING", "SUSPENDED": "RUNNING", "STAGE_OUT": "RUNNING", "SIGNALING": "RUNNING",
+		"COMPLETED": "COMPLETED",
+	}
+	pbsStates = {"Q": "PENDING", "H": "PENDING", "W": "PENDING", "T": "PENDING", "S": "PENDING",
+				 "R": "RUNNING", "E": "RUNNING", "B": "RUNNING", "X": "FINISHED", "F": "FINISHED", "C": "FINISHED"}
+	cobaltStates = {"queued": "PENDING", "user_hold": "PENDING", "admin_hold": "PENDING", "dep_hold": "PENDING", "starting": "RUNNING",
+					"running": "RUNNING", "exiting": "RUNNING", "killing": "RUNNING"}
+	
+	def __init__(self, scheduleParms, settings, pollInterval = 60):
+		self.scheduleParms = scheduleParms
+		self.aSet = settings
+		self.logger = Tools.loggedPrint.instance()
+		self.jobs = {}
+		self.states = {}
+		self.reasons = {}
+		self.started = {}
+		self.ended = {}
+		self.lastPoll = 0
+		self.pollInterval = pollInterval
+		self.lock = threading.RLock()
+		
+	def run(self, command, cwd = None):
+		result = self.query(command, cwd = cwd)
+		return None if result is None else result[0]
+		
+	# query: Runs a scheduler command, returns (stdout, stderr, return code) or None in debugmode or if the command could not be run
+	def query(self, command, cwd = None):
+		if(self.aSet.fetch("debugmode") == '1'):
+			print("D: " + command)
+			return None
+		try:
+			runCmd = subprocess.Popen(command, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			cResult, stderr = runCmd.communicate()
+		except OSError as e:
+			self.logger.write("JobTracker: Failed to run (" + command + "): " + str(e))
+			return None
+		return (cResult.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace'), runCmd.returncode)
+			
+	# submit: Submits jobFile from the directory cwd, returns the job ID or None if it could not be determined
+	#  If dependsOn is a list of job IDs, the job is held by the scheduler until all of them complete successfully
+	def submit(self, jobFile, name = None, cwd = None, dependsOn = None):
+		depArg = ""
+		if dependsOn:
+			depIDs = [j for j in dependsOn if j is not None]
+			if depIDs:
+				depArg = self.scheduleParms.fetch()["dependency"].replace("[job_ids]", self.scheduleParms.fetch()["dep-sep"].join(depIDs)) + " "
+		command = self.scheduleParms.command("subcmd") + " " + depArg + jobFile + " " + self.scheduleParms.fetch()["cmdline"]
+		output = self.run(command, cwd = cwd)
+		if output is None:
+			return None
+		match = re.search(self.scheduleParms.fetch()["jobid-regex"], output, re.MULTILINE)
+		if match is None:
+			self.logger.write("JobTracker: Could not find a job ID in the output of (" + command + "): " + output.strip())
+			return None
+		jobID = match.group(1)
+		self.track(jobID, name if name is not None else jobFile)
+		self.logger.write("JobTracker: " + self.jobs[jobID] + " submitted as job " + jobID)
+		return jobID
+		
+	def track(self, jobID, name):
+		with self.lock:
+			self.jobs[jobID] = name
+			self.states[jobID] = "PENDING"
+			self.lastPoll = 0
+		
+	def untrack(self, jobID):
+		with self.lock:
+			self.jobs.pop(jobID, None)
+			self.states.pop(jobID, None)
+			self.reasons.pop(jobID, None)
+			self.started.pop(jobID, None)
+			self.ended.pop(jobID, None)
+		
+	def idList(self, jobIDs):
+		return self.scheduleParms.fetch()["id-sep"].join(jobIDs)
+			
+	# poll: Queries the scheduler once for every tracked job that has not yet reached a terminal state. A job missing from the
+	#  output has left the queue, its end state is taken from the accounting command when there is one. That is only trusted when the
+	#  status command answered usefully: it listed some of the jobs, said a job is unknown, or succeeded with nothing to list. Any
+	#  other output (An error, or a format the parser does not know) leaves the states as they were.
+	def poll(self, force = False):
+		with self.lock:
+			if not force and (time.time() - self.lastPoll) < self.pollInterval:
+				return self.states
+			self.lastPoll = time.time()
+			active = [j for j in self.jobs if self.states[j] not in self.terminalStates]
+			if not active:
+				return self.states
+			command = self.scheduleParms.command("statcmd").replace("[job_ids]", self.idList(active))
+			result = self.query(command)
+			if result is None:
+				return self.states
+			output, errors, returnCode = result
+			found = self.parse_status(output, active)
+			unknownRegex = self.scheduleParms.fetch()["unknown-regex"]
+			answered = (found or (unknownRegex is not None and re.search(unknownRegex, output + errors, re.IGNORECASE)) or
+						(returnCode == 0 and not output.strip()))
+			if not answered:
+				self.logger.write("JobTracker: (" + command + ") returned no job records, the job states are left as they were: " +
+								  (output + errors).strip()[:200])
+				return self.states
+			gone = [j for j in active if j not in found]
+			if gone and self.scheduleParms.fetch()["acctcmd"] is not None:
+				# Jobs that have left the queue, ask the accounting database how they ended.
+				groups = [[j] for j in gone] if self.scheduleParms.fetch()["acct-per-job"] else [gone]
+				for group in groups:
+					acct = self.run(self.scheduleParms.command("acctcmd").replace("[job_ids]", self.idList(group)))
+					if acct is not None:
+						found.update(self.parse_accounting(acct, group))
+			for jobID in active:
+				if jobID in found:
+					self.states[jobID] = found[jobID]
+				else:
+					self.states[jobID] = "FINISHED"
+				if self.states[jobID] == "RUNNING" and jobID not in self.started:
+					self.started[jobID] = self.lastPoll
+				if self.states[jobID] in self.terminalStates:
+					self.ended[jobID] = self.lastPoll
+					self.logger.write("JobTracker: Job " + jobID + " (" + self.jobs[jobID] + ") left the queue, state " + self.states[jobID] + 
+									  ("" if jobID not in self.reasons else " (" + self.reasons[jobID] + ")"))
+			return self.states
+			
+	# parse_status: The states of the jobs listed in the output of the status command
+	def parse_status(self, output, jobIDs):
+		scheduler = self.scheduleParms.getScheduler()
+		if scheduler == "SLURM":
+			return self.parse_slurm(output, jobIDs)
+		elif scheduler == "PBS":
+			return self.parse_pbs(output, jobIDs)
+		return self.parse_cobalt(output, jobIDs)
+		
+	# parse_accounting: The end states of the jobs listed in the output of the accounting command (sacct, tracejob)
+	def parse_accounting(self, output, jobIDs):
+		if self.scheduleParms.getScheduler() == "SLURM":
+			return self.parse_slurm(output, jobIDs, delimiter = '|')
+		found = self.parse_pbs(output, jobIDs)
+		# tracejob lists the whole history of a job, only an exit status says it has ended
+		return dict((j, state) for j, state in found.items() if state in ["COMPLETED", "FAILED"])
+		
+	def parse_slurm(self, output, jobIDs, delimiter = None):
+		found = {}
+		for line in output.splitlines():
+			tokens = line.split(delimiter) if delimiter is not None else line.split()
+			if len(tokens) < 2 or tokens[0].strip() not in jobIDs:
+				continue
+			rawState = tokens[1].strip().split()[0].rstrip('+') if tokens[1].strip() else "UNKNOWN"
+			found[tokens[0].strip()] = self.slurmStates.get(rawState, "FAILED")
+			if found[tokens[0].strip()] == "FAILED":
+				self.reasons[tokens[0].strip()] = rawState
+		return found
+		
+	# parse_pbs: Reads qstat -f output (Job Id: / job_state = / exit_status = lines) and the tracejob output of finished jobs (Job: and
+	#  Exit_status= in the event lines). The job names of both carry the server (IE: 1234.server) and are matched to the tracked IDs.
+	def parse_pbs(self, output, jobIDs):
+		found = {}
+		current = None
+		for line in output.splitlines():
+			line = line.strip()
+			header = re.match(r"^Job(?: Id)?:\s*(\S+)", line)
+			if header:
+				current = header.group(1)
+				current = current if current in jobIDs else next((j for j in jobIDs if current.startswith(j) or j.startswith(current)), None)
+				continue
+			if current is None:
+				continue
+			exitStatus = re.search(r"(?i)\bexit_status\s*=\s*(-?\d+)", line)
+			if exitStatus:
+				found[current] = "COMPLETED" if exitStatus.group(1) == "0" else "FAILED"
+				if exitStatus.group(1) != "0":
+					self.reasons[current] = "Exit_status " + exitStatus.group(1)
+			elif line.startswith("job_state") and found.get(current) not in ["COMPLETED", "FAILED"]:
+				found[current] = self.pbsStates.get(line.split("=", 1)[1].strip(), "PENDING")
+		return found
+		
+	def parse_cobalt(self, output, jobIDs):
+		found = {}
+		for line in output.splitlines():
+			tokens = line.split()
+			if not tokens or tokens[0] not in jobIDs:
+				continue
+			for token in tokens[1:]:
+				if token.lower() in self.cobaltStates:
+					found[tokens[0]] = self.cobaltStates[token.lower()]
+					break
+			else:
+				found[tokens[0]] = "RUNNING"
+		return found
+		
+	def state(self, jobID):
+		if jobID not in self.jobs:
+			return None
+		self.poll()
+		return self.states[jobID]
+		
+	def reason(self, jobID):
+		return self.reasons[jobID] if jobID in self.reasons else ""
+		
+	def isTerminal(self, jobID):
+		return self.state(jobID) in self.terminalStates
+		
+	# runtime: Minutes between the first poll that saw the job running and the poll that saw it leave the queue (Accurate to the
+	#  poll interval), or None if the job was never seen running
+	def runtime(self, jobID):
+		with self.lock:
+			if jobID not in self.started:
+				return None
+			end = self.ended.get(jobID, time.time())
+			return (end - self.started[jobID]) / 60.0
+		
+	# cancel_pending: Cancels every tracked job that has not yet left the queue (IE: The rest of a dependency chain after a failure)
+	def cancel_pending(self):
+		self.poll(force = True)
+		for jobID in list(self.jobs):
+			if self.states[jobID] not in self.terminalStates:
+				self.cancel(jobID)
+		
+	def cancel(self, jobID):
+		if jobID is None:
+			return
+		self.run(self.scheduleParms.command("cancelcmd") + " " + jobID)
+		self.logger.write("JobTracker: Cancel requested for job " + jobID)
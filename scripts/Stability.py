@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# Stability.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to catch a numerically unstable wrf.exe run early, from the warnings it writes to every rank's rsl.error file
+
+import os
+import re
+import glob
+import datetime
+import threading
+import Cache
+import RslLogs
+import Tools
+import Wait
+
+# The warnings wrf.exe writes before it blows up, they usually start on the rank where the instability is, not on rank 0:
+#  d01 2019-05-26_01:23:20     5 points exceeded cfl=2 in domain d01 at time 2019-05-26_01:23:20 hours
+#  MAX AT i,j,k:   123   45   30 vert_cfl,w,d(eta)=    2.345678    18.12345    0.0123
+cflPattern = re.compile(r"(\d+)\s+points exceeded cfl=\S+ in domain (\S+) at time (\S+)")
+wPattern = re.compile(r"vert_cfl,w,d\(eta\)=\s*(\S+)\s+(\S+)")
+nanPattern = re.compile(r"(?i)\b(nan|infinity)\b")
+
+# The restart files, nocolons in the namelist replaces the colons of the time with underscores, split files (io_form 102) end in the rank
+restartPattern = re.compile(r"wrfrst_d01_(\d{4}-\d{2}-\d{2}_\d{2}[:_]\d{2}[:_]\d{2})(?:_(\d{4,}))?$")
+
+# The first bytes of a netCDF classic / 64-bit offset file and of a netCDF-4 (HDF5) file
+restartMagic = [b"CDF", b"\x89HDF"]
+
+# restart_valid: True if a restart file looks complete, it starts like a netCDF file and is not much smaller than the largest restart
+#  file of the run (A file cut short when the job was killed is). largest is that size in bytes.
+def restart_valid(fPath, largest):
+	try:
+		size = os.path.getsize(fPath)
+		with open(fPath, 'rb') as source_file:
+			head = source_file.read(4)
+	except OSError:
+		return False
+	return size > 0 and size >= 0.9 * largest and any(head.startswith(m) for m in restartMagic)
+
+# set_restart: Sets a namelist to restart from a restart file written at restartTime
+def set_restart(namelist, restartTime):
+	Cache.set_namelist_value(namelist, "restart", ".true.")
+	# run_days / run_hours are counted from the start time and would move the end of the run, the end_* entries are used instead
+	Cache.set_namelist_value(namelist, "run_days", 0)
+	Cache.set_namelist_value(namelist, "run_hours", 0)
+	for name, value in [("start_year", restartTime.year), ("start_month", restartTime.month), ("start_day", restartTime.day),
+						("start_hour", restartTime.hour), ("start_minute", restartTime.minute), ("start_second", restartTime.second)]:
+		Cache.set_namelist_value(namelist, name, value)
+
+# StabilityMonitor: Reads the new lines of every rsl.error.* file while wrf.exe runs (Wait.LogTail keeps an offset per file) and
+#  triggers once the run looks unstable: CFL warnings on wrf_stability_cfl_steps different model times, a vertical velocity of
+#  wrf_stability_max_w m/s or more, or a NaN on any rank. wrf_stability_action then decides what happens: warn only logs it,
+#  cancel cancels the job, resubmit cancels it and lets the driver run it again with a smaller time step (See prepare_resubmit()).
+class StabilityMonitor:
+	aSet = None
+	runDir = ""
+	tracker = None
+	tail = None
+	jobID = None
+	thread = None
+	stopEvent = None
+	cflTimes = set()
+	maxW = 0.0
+	reason = None
+	resubmits = 0
+	logger = None
+
+	def __init__(self, settings, runDir, tracker):
+		self.aSet = settings
+		self.runDir = runDir
+		self.tracker = tracker
+		self.tail = None
+		self.jobID = None
+		self.thread = None
+		self.stopEvent = threading.Event()
+		self.cflTimes = set()
+		self.maxW = 0.0
+		self.reason = None
+		self.resubmits = 0
+		self.logger = Tools.loggedPrint.instance()
+
+	def enabled(self):
+		return self.aSet.fetch("wrf_stability_check") == '1' and self.aSet.fetch("debugmode") != '1'
+
+	def action(self):
+		return self.aSet.fetch("wrf_stability_action")
+
+	# start: Follows the rsl.error files of a wrf.exe run, jobID is the job cancelled when the run is unstable
+	def start(self, jobID):
+		if not self.enabled() or self.thread is not None:
+			return
+		self.tail = Wait.LogTail(self.runDir + "/output/rsl.error.*")
+		self.jobID = jobID
+		self.cflTimes = set()
+		self.maxW = 0.0
+		self.reason = None
+		self.stopEvent.clear()
+		self.thread = threading.Thread(target = self.follow, name = "StabilityMonitor")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def follow(self):
+		interval = max(5, int(self.aSet.fetch("wrf_timing_interval")))
+		while not self.stopEvent.wait(interval):
+			reason = self.scan()
+			if reason is not None:
+				self.trigger(reason)
+				return
+
+	def stop(self):
+		if self.thread is None:
+			return
+		self.stopEvent.set()
+		if self.thread is not threading.current_thread():
+			self.thread.join()
+		self.thread = None
+
+	# scan: Reads the lines written since the last scan on every rank, returns the reason the run is unstable or None
+	def scan(self):
+		cflLimit = int(self.aSet.fetch("wrf_stability_cfl_steps"))
+		wLimit = float(self.aSet.fetch("wrf_stability_max_w"))
+		for fPath in self.tail.files():
+			rank = fPath.rsplit('.', 1)[-1]
+			chunk = self.tail.read_file(fPath)
+			lastLine = chunk.rfind('\n')
+			if lastLine == -1:
+				continue
+			for line in chunk[:lastLine].split('\n'):
+				if "exceeded cfl" in line:
+					match = cflPattern.search(line)
+					if match:
+						self.cflTimes.add(match.group(2) + " " + match.group(3))
+						if cflLimit > 0 and len(self.cflTimes) >= cflLimit:
+							return "CFL exceeded at " + str(len(self.cflTimes)) + " model times (Latest on rank " + rank + " at " + match.group(3) + ")"
+				elif "vert_cfl" in line:
+					match = wPattern.search(line)
+					if match:
+						try:
+							w = abs(float(match.group(2)))
+						except ValueError:
+							return "Vertical velocity is not a number on rank " + rank + ": " + line.strip()
+						self.maxW = max(self.maxW, w)
+						if wLimit > 0 and w >= wLimit:
+							return "Vertical velocity of " + ("%.1f" % w) + " m/s on rank " + rank
+				if nanPattern.search(line):
+					return "NaN on rank " + rank + ": " + line.strip()
+		return None
+
+	# trigger: Applies wrf_stability_action to the unstable run
+	def trigger(self, reason):
+		self.reason = reason
+		self.logger.write("StabilityMonitor: wrf.exe looks unstable, " + reason)
+		if self.action() in ["cancel", "resubmit"]:
+			self.logger.write("StabilityMonitor: Cancelling job " + str(self.jobID) + " (wrf_stability_action " + self.action() + ")")
+			self.tracker.cancel(self.jobID)
+
+	# should_resubmit: True if the last run was cancelled as unstable and may be run again
+	def should_resubmit(self):
+		return (self.reason is not None and self.action() == "resubmit" and self.resubmits < int(self.aSet.fetch("wrf_stability_retries")))
+
+	# latest_restart: The newest complete wrfrst_d01 file in the output directory (See restart_valid()) and its model time, or (None, None).
+	#  Split restart files (io_form_restart 102) are complete when every rank's file is, each is compared with the same rank's other files.
+	def latest_restart(self):
+		found = {}
+		largest = {}
+		for fPath in glob.glob(self.runDir + "/output/wrfrst_d01_*"):
+			match = restartPattern.search(os.path.basename(fPath))
+			if match:
+				stamp = match.group(1)
+				restartTime = datetime.datetime.strptime(stamp[:10] + "_" + stamp[11:13] + ":" + stamp[14:16] + ":" + stamp[17:19], '%Y-%m-%d_%H:%M:%S')
+				found.setdefault(restartTime, []).append((match.group(2), fPath))
+				largest[match.group(2)] = max(largest.get(match.group(2), 0), os.path.getsize(fPath))
+		parts = max([len(files) for files in found.values()] or [0])
+		for restartTime in sorted(found, reverse = True):
+			files = sorted(found[restartTime], key = lambda f: f[1])
+			if len(files) == parts and all(restart_valid(fPath, largest[part]) for part, fPath in files):
+				return (files[0][1], restartTime)
+			self.logger.write("StabilityMonitor: " + os.path.basename(files[0][1]) + " is incomplete, it is not used to restart")
+		return (None, None)
+
+	# lower_time_step: Scales the time step in the namelist by wrf_stability_dt_factor, returns a description of the change or None if the
+	#  step cannot be lowered. With use_adaptive_time_step the step set in time_step is not used after the first one, so the
+	#  upper bound (max_time_step), the first step, and target_cfl are lowered instead (-1 entries use the WRF defaults of 8 x dx
+	#  and 4 x dx in km).
+	def lower_time_step(self, namelist):
+		factor = float(self.aSet.fetch("wrf_stability_dt_factor"))
+		if (Cache.namelist_value(namelist, "use_adaptive_time_step") or "").lower() != ".true.":
+			timeStep = int(Cache.namelist_value(namelist, "time_step"))
+			newStep = max(1, int(timeStep * factor))
+			if newStep >= timeStep:
+				return None
+			Cache.set_namelist_value(namelist, "time_step", newStep)
+			return "time_step " + str(newStep) + " s (Was " + str(timeStep) + " s)"
+		dxKm = float(Cache.namelist_value(namelist, "dx")) / 1000.0
+		maxStep = int(Cache.namelist_value(namelist, "max_time_step"))
+		maxStep = maxStep if maxStep > 0 else int(8 * dxKm)
+		firstStep = int(Cache.namelist_value(namelist, "starting_time_step"))
+		firstStep = firstStep if firstStep > 0 else int(4 * dxKm)
+		newMax = max(1, int(maxStep * factor))
+		if newMax >= maxStep:
+			return None
+		newFirst = max(1, min(int(firstStep * factor), newMax))
+		Cache.set_namelist_value(namelist, "max_time_step", newMax)
+		Cache.set_namelist_value(namelist, "starting_time_step", newFirst)
+		minStep = int(Cache.namelist_value(namelist, "min_time_step"))
+		if minStep > newFirst:
+			Cache.set_namelist_value(namelist, "min_time_step", newFirst)
+		targetCfl = Cache.namelist_value(namelist, "target_cfl")
+		if targetCfl is not None:
+			Cache.set_namelist_value(namelist, "target_cfl", "%.2f" % (float(targetCfl) * factor))
+		return "max_time_step " + str(newMax) + " s (Was " + str(maxStep) + " s), starting_time_step " + str(newFirst) + " s"
+
+	# prepare_resubmit: Archives the logs of the unstable run as rsl_wrf_unstable_<n> (See RslLogs) and lowers the time step in namelist.input.wrf (See
+	#  lower_time_step()), or in the given namelist. If wrf.exe wrote a restart file, the namelist is set to restart from the newest one, otherwise
+	#  the run starts over. A segment of a restart-chunked run (wrf_segments) passes useRestart False, it always starts from where it began.
+	#  Returns False if the time step cannot be lowered any further.
+	def prepare_resubmit(self, namelist = None, useRestart = True):
+		namelist = namelist if namelist is not None else self.runDir + "/output/namelist.input.wrf"
+		change = self.lower_time_step(namelist)
+		if change is None:
+			self.logger.write("StabilityMonitor: The time step cannot be lowered any further, wrf.exe will not be run again")
+			return False
+		self.resubmits += 1
+		label = "wrf_unstable_" + str(self.resubmits)
+		RslLogs.RslLogs(self.aSet, self.runDir).collect(label)
+		restartFile, restartTime = self.latest_restart() if useRestart else (None, None)
+		if restartFile is not None:
+			set_restart(namelist, restartTime)
+		self.logger.write("StabilityMonitor: Running wrf.exe again (" + str(self.resubmits) + " of " + self.aSet.fetch("wrf_stability_retries") + ") with " + change +
+						  ", " + ("from " + os.path.basename(restartFile) if restartFile is not None else "from the start" if useRestart else "from the start of the segment") +
+						  ", the logs of the unstable run are in rsl_" + label + ".tar.gz")
+		return True
@@ -0,0 +1,429 @@
+#!/usr/bin/python
+# StepTiming.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to turn the Timing lines WRF writes to rsl.out.0000 into a per-run SQLite database, and a command line
+#  tool to compare those databases across runs. Run this file on its own for the commands:
+#   python StepTiming.py compare <run1/wrf_timing.db> <run2/wrf_timing.db> ...
+#   python StepTiming.py show <run/wrf_timing.db> [domain]
+#   python StepTiming.py parse <wrf_log.txt> <wrf_timing.db>
+
+import sys
+import os
+import re
+import math
+import json
+import time
+import sqlite3
+import datetime
+import threading
+import Tools
+import Wait
+
+# The Timing lines of rsl.out.0000, adaptive time stepping adds the step in use to the main line: Timing for main (dt= 60.00): ...
+mainPattern = re.compile(r"Timing for main(?:\s*\(dt=\s*([0-9.]+)\))?: time (\S+) on domain\s+(\d+):\s+([0-9.]+) elapsed seconds")
+writePattern = re.compile(r"Timing for Writing (\S+) for domain\s+(\d+):\s+([0-9.]+) elapsed seconds")
+boundaryPattern = re.compile(r"Timing for processing lateral boundary for domain\s+(\d+):\s+([0-9.]+) elapsed seconds")
+# The model time at the end of an output file name (IE: wrfout_d01_2019-05-26_01:00:00)
+fileTimePattern = re.compile(r"(\d{4}-\d{2}-\d{2}_\d{2}:\d{2}:\d{2})$")
+
+modelTimeFormat = '%Y-%m-%d_%H:%M:%S'
+
+# The settings kept with each run, compare uses them to line runs of the same domain up against each other
+runInfoKeys = ["starttime", "num_wrf_nodes", "wrf_mpi_ranks_per_node", "wrf_nio_groups", "wrf_nio_tasks_per_group", "wrf_numtiles",
+			   "e_we", "e_sn", "e_vert"]
+
+# parse_line: Returns ("step", domain, model time, dt, seconds), ("write", domain, stream, model time, seconds),
+#  ("boundary", domain, seconds), or None for any other line
+def parse_line(line):
+	if "Timing for" not in line:
+		return None
+	match = mainPattern.search(line)
+	if match:
+		return ("step", int(match.group(3)), match.group(2), float(match.group(1)) if match.group(1) else None, float(match.group(4)))
+	match = writePattern.search(line)
+	if match:
+		target = match.group(1)
+		timeMatch = fileTimePattern.search(target)
+		stream = target[:timeMatch.start()].rstrip('_') if timeMatch else target
+		return ("write", int(match.group(2)), stream, timeMatch.group(1) if timeMatch else None, float(match.group(3)))
+	match = boundaryPattern.search(line)
+	if match:
+		return ("boundary", int(match.group(1)), float(match.group(2)))
+	return None
+
+def percentile(values, fraction):
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)]
+
+# TimingStore: The SQLite database of one run. steps holds one row per model step (The dt column is the time step in use, read from
+#  the log under adaptive time stepping and from the change in model time otherwise), writes one row per history / restart write,
+#  and boundary one row per lateral boundary read. run_info holds the settings of the run.
+class TimingStore:
+	path = ""
+	db = None
+	lastTimes = {}
+
+	def __init__(self, path):
+		self.path = path
+		self.db = sqlite3.connect(path, check_same_thread = False)
+		self.db.executescript("CREATE TABLE IF NOT EXISTS run_info (key TEXT PRIMARY KEY, value TEXT);"
+							  "CREATE TABLE IF NOT EXISTS steps (seq INTEGER, domain INTEGER, model_time TEXT, dt REAL, seconds REAL);"
+							  "CREATE TABLE IF NOT EXISTS writes (seq INTEGER, domain INTEGER, stream TEXT, model_time TEXT, seconds REAL);"
+							  "CREATE TABLE IF NOT EXISTS boundary (seq INTEGER, domain INTEGER, model_time TEXT, seconds REAL);")
+		self.lastTimes = {}
+		for domain, modelTime in self.db.execute("SELECT domain, MAX(model_time) FROM steps GROUP BY domain"):
+			self.lastTimes[domain] = modelTime
+
+	def set_info(self, info):
+		with self.db:
+			self.db.executemany("INSERT OR REPLACE INTO run_info VALUES (?, ?)", [(k, str(v)) for k, v in info.items()])
+
+	def info(self):
+		return dict(self.db.execute("SELECT key, value FROM run_info"))
+
+	def next_seq(self):
+		return (self.db.execute("SELECT MAX(seq) FROM (SELECT seq FROM steps UNION ALL SELECT seq FROM writes UNION ALL SELECT seq FROM boundary)").fetchone()[0] or 0) + 1
+
+	# add: Stores the parsed lines of one read in a single transaction, the writes and boundary reads are tagged with the model time
+	#  of the last step on their domain
+	def add(self, entries):
+		if not entries:
+			return 0
+		seq = self.next_seq()
+		steps, writes, boundary = [], [], []
+		for entry in entries:
+			if entry[0] == "step":
+				kind, domain, modelTime, dt, seconds = entry
+				if dt is None and domain in self.lastTimes:
+					try:
+						dt = (datetime.datetime.strptime(modelTime, modelTimeFormat) - datetime.datetime.strptime(self.lastTimes[domain], modelTimeFormat)).total_seconds()
+					except ValueError:
+						dt = None
+				self.lastTimes[domain] = modelTime
+				steps.append((seq, domain, modelTime, dt, seconds))
+			elif entry[0] == "write":
+				kind, domain, stream, modelTime, seconds = entry
+				writes.append((seq, domain, stream, modelTime if modelTime is not None else self.lastTimes.get(domain), seconds))
+			else:
+				kind, domain, seconds = entry
+				boundary.append((seq, domain, self.lastTimes.get(domain), seconds))
+			seq += 1
+		with self.db:
+			self.db.executemany("INSERT INTO steps VALUES (?, ?, ?, ?, ?)", steps)
+			self.db.executemany("INSERT INTO writes VALUES (?, ?, ?, ?, ?)", writes)
+			self.db.executemany("INSERT INTO boundary VALUES (?, ?, ?, ?)", boundary)
+		return len(entries)
+
+	def domains(self):
+		return [row[0] for row in self.db.execute("SELECT DISTINCT domain FROM steps ORDER BY domain")]
+
+	# summary: The totals of one domain, as used by compare
+	def summary(self, domain = 1):
+		steps = [row[0] for row in self.db.execute("SELECT seconds FROM steps WHERE domain = ? ORDER BY seq", (domain,))]
+		dts = [row[0] for row in self.db.execute("SELECT dt FROM steps WHERE domain = ? AND dt IS NOT NULL AND dt > 0", (domain,))]
+		writes = [row[0] for row in self.db.execute("SELECT seconds FROM writes WHERE domain = ?", (domain,))]
+		boundary = [row[0] for row in self.db.execute("SELECT seconds FROM boundary WHERE domain = ?", (domain,))]
+		compute = sum(steps)
+		io = sum(writes) + sum(boundary)
+		return {"steps": len(steps), "compute": compute, "mean": compute / len(steps) if steps else 0.0, "median": percentile(steps, 0.5),
+				"p95": percentile(steps, 0.95), "max": max(steps) if steps else 0.0, "dt": sum(dts) / len(dts) if dts else 0.0,
+				"writes": len(writes), "write_total": sum(writes), "write_median": percentile(writes, 0.5), "write_max": max(writes) if writes else 0.0,
+				"boundary": sum(boundary), "io_fraction": io / (compute + io) if compute + io > 0 else 0.0}
+
+	# write_seconds: The seconds of every write of a stream (Every file name starting with prefix, IE: wrfout_d01)
+	def write_seconds(self, prefix, domain = 1):
+		return [row[0] for row in self.db.execute("SELECT seconds FROM writes WHERE domain = ? AND substr(stream, 1, ?) = ? ORDER BY seq", (domain, len(prefix), prefix))]
+
+	# stalls: Writes that took more than factor times the median write of their stream (And at least minSeconds)
+	def stalls(self, domain = 1, factor = 3.0, minSeconds = 5.0):
+		found = []
+		for stream in [row[0] for row in self.db.execute("SELECT DISTINCT stream FROM writes WHERE domain = ?", (domain,))]:
+			rows = list(self.db.execute("SELECT model_time, seconds FROM writes WHERE domain = ? AND stream = ? ORDER BY seq", (domain, stream)))
+			median = percentile([r[1] for r in rows], 0.5)
+			for modelTime, seconds in rows:
+				if seconds >= minSeconds and seconds > factor * median:
+					found.append((stream, modelTime, seconds, median))
+		return found
+
+	def close(self):
+		if self.db is not None:
+			self.db.close()
+			self.db = None
+
+# ProgressReporter: Turns the model time of the last step into progress against the forecast length and the WRF walltime. The speed
+#  (Simulated seconds per wall second) is measured over the last progressWindow seconds of samples, so the time spent on startup
+#  and any earlier slow stretch do not hold the estimate back. Every sample updates wrf_progress.json in the run directory, a line is
+#  written to the log every wrf_progress_interval seconds.
+class ProgressReporter:
+	progressWindow = 1800
+	# The run is at risk when it is expected to finish with less than this share of the walltime left
+	riskMargin = 0.10
+	aSet = None
+	statusPath = ""
+	simStart = None
+	simEnd = None
+	segmentEnd = None
+	deadline = None
+	walltime = 0
+	samples = []
+	lastLog = 0
+	logger = None
+
+	def __init__(self, settings, runDir):
+		self.aSet = settings
+		self.statusPath = runDir + "/wrf_progress.json"
+		self.simStart = settings.startTime
+		self.simEnd = settings.endTime
+		self.segmentEnd = settings.endTime
+		self.deadline = None
+		self.walltime = int(settings.fetch("wrf_walltime")) * 60
+		self.samples = []
+		self.lastLog = 0
+		self.logger = Tools.loggedPrint.instance()
+
+	# begin: deadline is the time (Seconds since the epoch) the walltime of the job runs out, or None if it is not known. When the job
+	#  only runs part of the forecast (wrf_segments), segmentEnd is the model time it stops at and walltime its walltime in minutes.
+	def begin(self, deadline = None, segmentEnd = None, walltime = None):
+		self.deadline = deadline
+		self.segmentEnd = segmentEnd if segmentEnd is not None else self.simEnd
+		self.walltime = int(walltime if walltime is not None else self.aSet.fetch("wrf_walltime")) * 60
+		self.samples = []
+		self.lastLog = time.time()
+
+	def speed(self):
+		now, done = self.samples[-1]
+		window = [s for s in self.samples if s[0] >= now - self.progressWindow]
+		first = window[0] if len(window) > 1 else self.samples[0]
+		if now - first[0] <= 0 or done - first[1] <= 0:
+			return None
+		return (done - first[1]) / (now - first[0])
+
+	# status: The progress of the run as written to wrf_progress.json
+	def status(self, modelTime):
+		now, done = self.samples[-1]
+		total = (self.simEnd - self.simStart).total_seconds()
+		status = {"updated": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "model_time": modelTime, "simulated_hours": round(done / 3600.0, 3),
+				  "forecast_hours": round(total / 3600.0, 3), "percent": round(100.0 * done / total, 2) if total > 0 else 100.0, "speed": None,
+				  "remaining_seconds": None, "finish": None, "deadline": None, "margin_minutes": None, "outlook": "starting"}
+		speed = self.speed()
+		if speed is None:
+			return status
+		remaining = max(0.0, (self.segmentEnd - self.simStart).total_seconds() - done) / speed
+		status["speed"] = round(speed, 3)
+		status["remaining_seconds"] = int(remaining)
+		status["finish"] = datetime.datetime.utcfromtimestamp(now + remaining).strftime('%Y-%m-%d %H:%M:%S')
+		if self.deadline is None:
+			status["outlook"] = "unknown walltime"
+			return status
+		margin = self.deadline - (now + remaining)
+		status["deadline"] = datetime.datetime.utcfromtimestamp(self.deadline).strftime('%Y-%m-%d %H:%M:%S')
+		status["margin_minutes"] = round(margin / 60.0, 1)
+		if margin < 0:
+			status["outlook"] = "will exceed walltime"
+		elif margin < self.riskMargin * self.walltime:
+			status["outlook"] = "at risk"
+		else:
+			status["outlook"] = "on track"
+		return status
+
+	# update: Takes the model time of the last step (IE: 2019-05-26_03:20:00), or None if no step has been written yet
+	def update(self, modelTime, force = False):
+		if modelTime is None:
+			return None
+		try:
+			done = (datetime.datetime.strptime(modelTime, modelTimeFormat) - self.simStart).total_seconds()
+		except ValueError:
+			return None
+		now = time.time()
+		# A read without a new step still adds a sample, so a stall slows the estimate down
+		self.samples.append((now, done))
+		self.samples = [s for s in self.samples if s[0] >= now - 2 * self.progressWindow]
+		status = self.status(modelTime)
+		try:
+			tmpPath = self.statusPath + ".tmp"
+			with open(tmpPath, 'w') as target_file:
+				json.dump(status, target_file, indent = 1, sort_keys = True)
+			os.replace(tmpPath, self.statusPath)
+		except OSError as e:
+			self.logger.write("ProgressReporter: Could not write " + self.statusPath + ": " + str(e))
+		interval = int(self.aSet.fetch("wrf_progress_interval"))
+		if interval > 0 and (force or now - self.lastLog >= interval):
+			self.lastLog = now
+			self.logger.write("  -> wrf.exe: " + modelTime + ", " + ("%.1f" % status["simulated_hours"]) + " of " + ("%.1f" % status["forecast_hours"]) + " forecast hours (" +
+							  ("%.1f" % status["percent"]) + "%)" + ("" if status["speed"] is None else ", " + ("%.2f" % status["speed"]) + "x real time, finishing " +
+							  status["finish"] + " UTC") + ("" if status["margin_minutes"] is None else ", " + ("%.0f" % status["margin_minutes"]) + " minutes before the walltime") +
+							  " (" + status["outlook"] + ")")
+		return status
+
+# TimingRecorder: Follows rsl.out.0000 while wrf.exe runs and adds each new Timing line to wrf_timing.db in the run directory. Only
+#  the bytes appended since the last read are parsed (Wait.LogTail), in a background thread woken every wrf_timing_interval seconds.
+#  stop() reads the log one last time, it must be called before the log is moved to wrf_log.txt. Each read also updates the progress.
+class TimingRecorder:
+	aSet = None
+	logPath = ""
+	dbPath = ""
+	tail = None
+	store = None
+	progress = None
+	thread = None
+	stopEvent = None
+	lock = None
+	logger = None
+
+	def __init__(self, settings, runDir):
+		self.aSet = settings
+		self.logPath = runDir + "/output/rsl.out.0000"
+		self.dbPath = runDir + "/wrf_timing.db"
+		self.tail = None
+		self.store = None
+		self.progress = ProgressReporter(settings, runDir)
+		self.thread = None
+		self.stopEvent = threading.Event()
+		self.lock = threading.Lock()
+		self.logger = Tools.loggedPrint.instance()
+
+	def enabled(self):
+		return self.aSet.fetch("wrf_timing") == '1' and self.aSet.fetch("debugmode") != '1'
+
+	# start: deadline is when the walltime of the job runs out (Seconds since the epoch), used for the progress outlook. The segments of
+	#  a restart-chunked run (wrf_segments) add their steps to the same database, only the first one passes reset.
+	def start(self, deadline = None, reset = True, segmentEnd = None, walltime = None):
+		if not self.enabled() or self.thread is not None:
+			return
+		if reset and os.path.exists(self.dbPath):
+			# A new run of wrf.exe, the steps of the last one would be mixed into this one
+			os.remove(self.dbPath)
+		self.tail = Wait.LogTail(self.logPath)
+		self.store = TimingStore(self.dbPath)
+		info = dict((key, self.aSet.fetch(key)) for key in runInfoKeys if self.aSet.fetch(key) is not None)
+		info["io_form_history"] = self.aSet.replacementKeys.get("[io_form_history]")
+		# The decomposition wrf.exe runs with (-1 when WRF chooses it), Decomposition.validate() checks the cost model against it
+		info["nproc_x"] = self.aSet.replacementKeys.get("[nproc_x]")
+		info["nproc_y"] = self.aSet.replacementKeys.get("[nproc_y]")
+		self.store.set_info(info)
+		self.progress.begin(deadline, segmentEnd, walltime)
+		self.stopEvent.clear()
+		self.thread = threading.Thread(target = self.follow, name = "TimingRecorder")
+		self.thread.daemon = True
+		self.thread.start()
+
+	def follow(self):
+		interval = max(5, int(self.aSet.fetch("wrf_timing_interval")))
+		while not self.stopEvent.wait(interval):
+			self.update()
+
+	# update: Parses the lines written since the last call, returns the number of Timing lines stored
+	def update(self, final = False):
+		with self.lock:
+			if self.store is None:
+				return 0
+			entries = []
+			for line in self.tail.read_lines():
+				entry = parse_line(line)
+				if entry is not None:
+					entries.append(entry)
+			try:
+				count = self.store.add(entries)
+			except sqlite3.Error as e:
+				self.logger.write("TimingRecorder: Could not write to " + self.dbPath + ": " + str(e))
+				count = 0
+			self.progress.update(self.store.lastTimes.get(1), force = final)
+			return count
+
+	def stop(self):
+		if self.thread is None:
+			return
+		self.stopEvent.set()
+		self.thread.join()
+		self.thread = None
+		self.update(final = True)
+		with self.lock:
+			summary = self.store.summary()
+			self.logger.write("TimingRecorder: " + str(summary["steps"]) + " steps on domain 1, " + ("%.3f" % summary["mean"]) + " s per step, " +
+							  str(summary["writes"]) + " writes taking " + ("%.1f" % summary["write_total"]) + " s (" + ("%.1f" % (summary["io_fraction"] * 100)) +
+							  "% of the run in I/O), stored in " + self.dbPath)
+			self.store.close()
+			self.store = None
+
+# parse_file: Reads a finished log (IE: wrf_log.txt of an older run) into a database
+def parse_file(logPath, dbPath):
+	store = TimingStore(dbPath)
+	entries = []
+	with open(logPath, 'r', errors = 'replace') as source_file:
+		for line in source_file:
+			entry = parse_line(line)
+			if entry is not None:
+				entries.append(entry)
+	count = store.add(entries)
+	store.close()
+	print("Stored " + str(count) + " Timing lines from " + logPath + " in " + dbPath)
+
+def show(dbPath, domain = 1):
+	store = TimingStore(dbPath)
+	print("Model time            dt (s)  Step (s)  I/O (s)")
+	writes = {}
+	for modelTime, seconds in store.db.execute("SELECT model_time, SUM(seconds) FROM (SELECT model_time, seconds FROM writes WHERE domain = ? UNION ALL "
+											   "SELECT model_time, seconds FROM boundary WHERE domain = ?) GROUP BY model_time", (domain, domain)):
+		writes[modelTime] = seconds
+	for modelTime, dt, seconds in store.db.execute("SELECT model_time, dt, seconds FROM steps WHERE domain = ? ORDER BY seq", (domain,)):
+		print(str(modelTime).ljust(22) + ("" if dt is None else "%.2f" % dt).ljust(8) + ("%.4f" % seconds).ljust(10) + ("%.3f" % writes[modelTime] if modelTime in writes else ""))
+	store.close()
+
+# compare: Prints the summary of each run next to the first one. Runs of the same domain size are compared step for step, the scaling
+#  efficiency is the speedup over the first run divided by the change in compute ranks. Slow writes (I/O stalls) are listed per run.
+def compare(dbPaths, domain = 1, regression = 0.10):
+	runs = []
+	for dbPath in dbPaths:
+		store = TimingStore(dbPath)
+		info = store.info()
+		runs.append((dbPath, info, store.summary(domain), store.stalls(domain)))
+		store.close()
+	print("Run" + " " * 37 + "Ranks   Steps  s/step  median  p95     Writes  Write s  I/O %   dt     Speedup  Efficiency")
+	base = runs[0]
+	for dbPath, info, summary, stalls in runs:
+		ranks = run_ranks(info)
+		speedup = ""
+		efficiency = ""
+		if same_domain(base[1], info) and summary["median"] > 0 and base[2]["median"] > 0:
+			value = base[2]["median"] / summary["median"]
+			speedup = "%.2f" % value
+			if ranks and run_ranks(base[1]):
+				efficiency = "%.2f" % (value / (float(ranks) / run_ranks(base[1])))
+		name = dbPath if len(dbPath) <= 39 else "..." + dbPath[-36:]
+		print(name.ljust(40) + str(ranks or "?").ljust(8) + str(summary["steps"]).ljust(7) + ("%.3f" % summary["mean"]).ljust(8) + ("%.3f" % summary["median"]).ljust(8) +
+			  ("%.3f" % summary["p95"]).ljust(8) + str(summary["writes"]).ljust(8) + ("%.1f" % summary["write_total"]).ljust(9) +
+			  ("%.1f" % (summary["io_fraction"] * 100)).ljust(8) + ("%.1f" % summary["dt"]).ljust(7) + speedup.ljust(9) + efficiency)
+	print("")
+	for dbPath, info, summary, stalls in runs[1:]:
+		if same_domain(base[1], info) and run_ranks(info) == run_ranks(base[1]) and base[2]["median"] > 0:
+			change = summary["median"] / base[2]["median"] - 1
+			if change > regression:
+				print("Regression: " + dbPath + " takes " + ("%.0f" % (change * 100)) + "% longer per step than " + base[0] + " on the same ranks")
+	for dbPath, info, summary, stalls in runs:
+		for stream, modelTime, seconds, median in stalls:
+			print("I/O stall: " + dbPath + " " + stream + " at " + str(modelTime) + " took " + ("%.1f" % seconds) + " s (Median " + ("%.1f" % median) + " s)")
+
+def run_ranks(info):
+	try:
+		return int(info["num_wrf_nodes"]) * int(info["wrf_mpi_ranks_per_node"]) - int(info.get("wrf_nio_groups", 0)) * int(info.get("wrf_nio_tasks_per_group", 0))
+	except (KeyError, ValueError):
+		return None
+
+def same_domain(a, b):
+	return all(a.get(key) == b.get(key) for key in ["e_we", "e_sn", "e_vert"])
+
+if __name__ == "__main__":
+	usage = "Usage: python StepTiming.py compare <db> <db> ... | show <db> [domain] | parse <wrf_log.txt> <db>"
+	if len(sys.argv) < 3:
+		sys.exit(usage)
+	if sys.argv[1] == "compare":
+		compare(sys.argv[2:])
+	elif sys.argv[1] == "show":
+		show(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 1)
+	elif sys.argv[1] == "parse" and len(sys.argv) > 3:
+		parse_file(sys.argv[2], sys.argv[3])
+	else:
+		sys.exit(usage)
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# Telemetry.py
+# Robert C Fritzen - Dpt. Geographic & Atmospheric Sciences
+#
+# Contains the classes used to keep the runtimes of earlier jobs and to recommend walltimes and node counts from them
+
+import os
+import json
+import math
+import datetime
+import threading
+import Tools
+
+# The namelist options that change the cost of a model step, runs are compared with runs using the same options when there are enough
+physicsKeys = ["mp_physics", "ra_lw_physics", "ra_sw_physics", "radt", "sf_sfclay_physics", "sf_surface_physics", "bl_pbl_physics",
+			   "cu_physics", "sf_urban_physics"]
+
+# stage_group: The control.txt node count and walltime a stage runs under, ungrib, metgrid and real use the prerun settings
+def stage_group(stage):
+	if stage == "geogrid":
+		return "geogrid"
+	elif stage == "wrf":
+		return "wrf"
+	elif stage in ["prerun", "metgrid", "real"] or stage.startswith("ungrib."):
+		return "prerun"
+	return None
+
+# solve: Solves the linear system a x = b by Gaussian elimination (The systems here are 3 x 3), returns None if it is singular
+def solve(a, b):
+	n = len(b)
+	m = [list(a[i]) + [b[i]] for i in range(n)]
+	for col in range(n):
+		pivot = max(range(col, n), key = lambda r: abs(m[r][col]))
+		if abs(m[pivot][col]) < 1e-12:
+			return None
+		m[col], m[pivot] = m[pivot], m[col]
+		for r in range(n):
+			if r != col:
+				f = m[r][col] / m[col][col]
+				for c in range(col, n + 1):
+					m[r][c] -= f * m[col][c]
+	return [m[i][n] / m[i][i] for i in range(n)]
+
+# ScalingModel: log(minutes) = b0 + b1 log(work) + b2 log(nodes), where work is the grid points times the forecast hours. The slopes are
+#  pulled toward ideal scaling (Linear in the work, close to linear speedup in the nodes), so a handful of runs at a single node count
+#  still gives a usable model, and the data takes over as runs at other sizes are added.
+class ScalingModel:
+	priorSlopes = [1.0, -0.8]
+	priorWeight = 0.5
+	coefficients = None
+	spread = 0.2
+	samples = 0
+
+	def __init__(self):
+		self.coefficients = None
+		self.spread = 0.2
+		self.samples = 0
+
+	def fit(self, records):
+		rows = [(1.0, math.log(r["work"]), math.log(r["nodes"])) for r in records]
+		ys = [math.log(r["minutes"]) for r in records]
+		self.samples = len(rows)
+		if self.samples == 0:
+			return False
+		xtx = [[sum(row[i] * row[j] for row in rows) for j in range(3)] for i in range(3)]
+		xty = [sum(rows[k][i] * ys[k] for k in range(len(rows))) for i in range(3)]
+		for i in [1, 2]:
+			xtx[i][i] += self.priorWeight
+			xty[i] += self.priorWeight * self.priorSlopes[i - 1]
+		self.coefficients = solve(xtx, xty)
+		if self.coefficients is None:
+			return False
+		if self.samples >= 4:
+			residuals = [ys[k] - self.log_predict(rows[k][1], rows[k][2]) for k in range(len(rows))]
+			self.spread = math.sqrt(sum(r * r for r in residuals) / (len(residuals) - 1))
+		return True
+
+	def log_predict(self, logWork, logNodes):
+		return self.coefficients[0] + self.coefficients[1] * logWork + self.coefficients[2] * logNodes
+
+	# predict: The expected runtime in minutes
+	def predict(self, work, nodes):
+		return math.exp(self.log_predict(math.log(work), math.log(nodes)))
+
+	# bound: A runtime the job should stay under, the expected runtime widened by two standard deviations of the fit
+	def bound(self, work, nodes):
+		return self.predict(work, nodes) * math.exp(2 * self.spread)
+
+# StageHistory: The runtime of every completed stage along with what it ran (Domain size, e_vert, forecast length, physics options)
+#  and on how many nodes, kept one JSON record per line in telemetry_file so the file can be shared between forecasts
+class StageHistory:
+	aSet = None
+	path = None
+	lock = None
+	logger = None
+
+	def __init__(self, settings):
+		self.aSet = settings
+		path = settings.fetch("telemetry_file")
+		self.path = None if path is None or path.lower() == "none" else path
+		self.lock = threading.Lock()
+		self.logger = Tools.loggedPrint.instance()
+
+	def enabled(self):
+		return self.path is not None
+
+	def forecast_hours(self):
+		return int(self.aSet.fetch("rundays")) * 24 + int(self.aSet.fetch("runhours"))
+
+	def work(self):
+		return int(self.aSet.fetch("e_we")) * int(self.aSet.fetch("e_sn")) * int(self.aSet.fetch("e_vert")) * max(1, self.forecast_hours())
+
+	def physics(self):
+		return dict((key, self.aSet.fetch(key)) for key in physicsKeys)
+
+	def nodes(self, stage):
+		if stage.startswith("ungrib.") and self.aSet.fetch("concurrent_stages") == '1':
+			# The ungrib jobs of the pipeline always run on one node
+			return 1
+		return int(self.aSet.fetch("num_" + stage_group(stage) + "_nodes"))
+
+	def record(self, stage, minutes):
+		if not self.enabled() or minutes is None or minutes <= 0 or stage_group(stage) is None:
+			return
+		entry = {"time": datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "starttime": self.aSet.fetch("starttime"), "stage": stage,
+				 "minutes": round(minutes, 2), "nodes": self.nodes(stage), "ranks_per_node": int(self.aSet.fetch(stage_group(stage) + "_mpi_ranks_per_node")),
+				 "e_we": int(self.aSet.fetch("e_we")), "e_sn": int(self.aSet.fetch("e_sn")), "e_vert": int(self.aSet.fetch("e_vert")),
+				 "forecast_hours": self.forecast_hours(), "work": self.work(), "physics": self.physics()}
+		try:
+			with self.lock:
+				with open(self.path, 'a') as target_file:
+					target_file.write(json.dumps(entry, sort_keys = True) + '\n')
+		except OSError as e:
+			self.logger.write("StageHistory: Could not write to " + self.path + ": " + str(e))
+
+	def records(self, stage):
+		if not self.enabled() or not os.path.isfile(self.path):
+			return []
+		found = []
+		with open(self.path, 'r') as source_file:
+			for line in source_file:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					continue
+				if entry.get("stage") == stage and entry.get("minutes", 0) > 0:
+					found.append(entry)
+		return found
+
+	# model: Fits the scaling model of a stage, only runs with the same physics options are used when there are at least three of them
+	def model(self, stage):
+		found = self.records(stage)
+		samePhysics = [r for r in found if r.get("physics") == self.physics()]
+		if len(samePhysics) >= 3:
+			found = samePhysics
+		model = ScalingModel()
+		if not model.fit(found):
+			return None
+		return model
+
+# Advisor: Recommends the walltime of each job (And the WRF node count when walltime_advisor_target is set) from the StageHistory. With
+#  walltime_advisor 1 the recommendations are only logged, with 2 they replace the control.txt values before the job files are written.
+class Advisor:
+	aSet = None
+	history = None
+	logger = None
+
+	def __init__(self, settings, history):
+		self.aSet = settings
+		self.history = history
+		self.logger = Tools.loggedPrint.instance()
+
+	def round_walltime(self, minutes):
+		return max(10, int(math.ceil(minutes * float(self.aSet.fetch("walltime_advisor_margin")) / 5.0)) * 5)
+
+	# stage_walltime: The walltime recommended for a group of stages, the longest of the stages that ran under it before
+	def stage_walltime(self, group, nodes):
+		longest = None
+		for stage in set(r["stage"] for r in self.all_records() if stage_group(r["stage"]) == group):
+			model = self.history.model(stage)
+			if model is not None:
+				stageNodes = 1 if stage.startswith("ungrib.") and self.aSet.fetch("concurrent_stages") == '1' else nodes
+				bound = model.bound(self.history.work(), stageNodes)
+				longest = bound if longest is None else max(longest, bound)
+		return None if longest is None else self.round_walltime(longest)
+
+	def all_records(self):
+		if not self.history.enabled() or not os.path.isfile(self.history.path):
+			return []
+		found = []
+		with open(self.history.path, 'r') as source_file:
+			for line in source_file:
+				try:
+					found.append(json.loads(line))
+				except ValueError:
+					continue
+		return found
+
+	# wrf_nodes: The smallest node count (Up to walltime_advisor_max_nodes) whose expected WRF runtime fits in the target
+	def wrf_nodes(self, target):
+		model = self.history.model("wrf")
+		if model is None:
+			return None
+		for nodes in range(1, int(self.aSet.fetch("walltime_advisor_max_nodes")) + 1):
+			if model.bound(self.history.work(), nodes) <= target:
+				return nodes
+		return None
+
+	def advise(self):
+		mode = self.aSet.fetch("walltime_advisor")
+		if mode not in ['1', '2'] or not self.history.enabled():
+			return
+		apply = (mode == '2')
+		target = int(self.aSet.fetch("walltime_advisor_target"))
+		if target > 0:
+			nodes = self.wrf_nodes(target)
+			if nodes is None:
+				self.logger.write("   - Advisor: No WRF node count up to " + self.aSet.fetch("walltime_advisor_max_nodes") + " is expected to finish in " + str(target) + " minutes")
+			else:
+				self.logger.write("   - Advisor: num_wrf_nodes " + str(nodes) + " (Set to " + self.aSet.fetch("num_wrf_nodes") + ")")
+				if apply and str(nodes) != self.aSet.fetch("num_wrf_nodes"):
+					self.aSet.apply_setting("num_wrf_nodes", str(nodes))
+		for group in ["geogrid", "prerun", "wrf"]:
+			walltime = self.stage_walltime(group, int(self.aSet.fetch("num_" + group + "_nodes")))
+			if walltime is None:
+				self.logger.write("   - Advisor: No earlier " + group + " runs recorded, keeping " + group + "_walltime " + self.aSet.fetch(group + "_walltime"))
+				continue
+			self.logger.write("   - Advisor: " + group + "_walltime " + str(walltime) + " (Set to " + self.aSet.fetch(group + "_walltime") + ")")
+			if apply and str(walltime) != self.aSet.fetch(group + "_walltime"):
+				self.aSet.apply_setting(group + "_walltime", str(walltime))
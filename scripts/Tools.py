@@ -10,6 +10,7 @@ import os.path
 import datetime
 import ApplicationSettings
 import subprocess
+import threading
 import time
 
 def detect_ideal_processors(grid_x, grid_y, nodes, procs_per_node, wrf_io_groups, wrf_io_procs):
@@ -126,8 +127,11 @@ class Singleton:
 class loggedPrint:
 	f = None
 	filePath = None
+	# Pipeline stages log from different threads, writes are serialized so lines are not interleaved
+	lock = None
 	
 	def __init__(self):
+		self.lock = threading.Lock()
 		curTime = datetime.date.today().strftime("%B%d%Y-%H%M%S")
 		curDir = os.path.dirname(os.path.abspath(__file__)) 	
 		logName = "wrf_run_script_" + str(curTime) + ".log"	
@@ -135,10 +139,11 @@ class loggedPrint:
 		self.filePath = logFile
 	
 	def write(self, out):
-		self.f = open(self.filePath, "a")
-		self.f.write(out + '\n')
-		self.f.close()
-		print(out)
+		with self.lock:
+			self.f = open(self.filePath, "a")
+			self.f.write(out + '\n')
+			self.f.close()
+			print(out)
 	
 	def close(self):
 		self.f.close()
@@ -8,59 +8,381 @@ import datetime
 import time
 import sys
 import os
+import re
+import glob
+import select
+import struct
+import fnmatch
+import ctypes
+import ctypes.util
 import subprocess
 import Tools
 
 #TimeExpiredException: Custom exception that is thrown when the Wait() command expires
 class TimeExpiredException(Exception):
 	pass
-					
+
+# LogTail: Keeps a byte offset for each file matching a path (or glob) and returns only the newly appended text
+class LogTail:
+	path = ""
+	offsets = {}
+	inodes = {}
+	carry = {}
+	recent = {}
+	# The trailing partial line is kept between reads so a match split across two writes is still found
+	maxCarry = 4096
+	# The number of complete lines kept from the end of each file (See last_lines())
+	maxRecent = 10
+
+	def __init__(self, path):
+		self.path = path
+		self.offsets = {}
+		self.inodes = {}
+		self.carry = {}
+		self.recent = {}
+
+	def files(self):
+		if any(c in self.path for c in "*?["):
+			return sorted(glob.glob(self.path))
+		return [self.path] if os.path.exists(self.path) else []
+
+	def exists(self):
+		return len(self.files()) > 0
+
+	def read_file(self, fPath):
+		try:
+			st = os.stat(fPath)
+		except OSError:
+			return ""
+		if self.inodes.get(fPath) != st.st_ino or st.st_size < self.offsets.get(fPath, 0):
+			# The file is new, was replaced, or was truncated, start over from the beginning.
+			self.inodes[fPath] = st.st_ino
+			self.offsets[fPath] = 0
+			self.carry[fPath] = ""
+			self.recent[fPath] = []
+		if st.st_size == self.offsets[fPath]:
+			return ""
+		try:
+			with open(fPath, 'rb') as f:
+				f.seek(self.offsets[fPath])
+				data = f.read(st.st_size - self.offsets[fPath])
+		except (IOError, OSError):
+			return ""
+		self.offsets[fPath] += len(data)
+		chunk = self.carry[fPath] + data.decode('utf-8', errors='replace')
+		lastLine = chunk.rfind('\n')
+		self.carry[fPath] = (chunk[lastLine+1:] if lastLine != -1 else chunk)[-self.maxCarry:]
+		if lastLine != -1:
+			self.recent[fPath] = (self.recent[fPath] + chunk[:lastLine].split('\n'))[-self.maxRecent:]
+		return chunk
+
+	def read_new(self):
+		newText = ""
+		for fPath in self.files():
+			newText += self.read_file(fPath)
+		return newText
+		
+	# last_lines: The last count lines of each file as of the latest read, like tail -n count (A partial last line counts as a line)
+	def last_lines(self, count):
+		lines = []
+		for fPath in self.files():
+			fLines = self.recent.get(fPath, []) + ([self.carry[fPath]] if self.carry.get(fPath) else [])
+			lines.extend(fLines[-count:])
+		return "\n".join(lines)
+
+	# read_lines: Returns the newly completed lines, a partial line is returned once its newline has been written
+	def read_lines(self):
+		lines = []
+		for fPath in self.files():
+			chunk = self.read_file(fPath)
+			lastLine = chunk.rfind('\n')
+			if lastLine != -1:
+				lines.extend(chunk[:lastLine].split('\n'))
+		return lines
+
+# DirectoryWatcher: Wakes the waiting process when one of the watched directories changes. inotify is used when
+#  available, otherwise (Or on filesystems where inotify does not see remote writes) wait() behaves like time.sleep()
+class DirectoryWatcher:
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+
+	fd = None
+	watched = []
+
+	def __init__(self, directories):
+		self.fd = None
+		self.watched = []
+		try:
+			libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+			fd = libc.inotify_init1(os.O_NONBLOCK)
+			if fd < 0:
+				return
+			# Appends (IN_MODIFY) are left out, a log written every time step would wake the waiting process without meeting a hold
+			mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+			for directory in set(directories):
+				if os.path.isdir(directory) and libc.inotify_add_watch(fd, directory.encode(), mask) >= 0:
+					self.watched.append(directory)
+			if not self.watched:
+				os.close(fd)
+				return
+			self.fd = fd
+		except (OSError, AttributeError):
+			self.fd = None
+
+	def usingInotify(self):
+		return self.fd is not None
+
+	# wait: Waits up to timeout seconds for a change, returns the events seen as (mask, file name) pairs (An empty list on a timeout,
+	#  or without inotify)
+	def wait(self, timeout):
+		if self.fd is None:
+			time.sleep(timeout)
+			return []
+		ready, _, _ = select.select([self.fd], [], [], timeout)
+		if not ready:
+			return []
+		data = b""
+		try:
+			while True:
+				block = os.read(self.fd, 65536)
+				if not block:
+					break
+				data += block
+		except (BlockingIOError, OSError):
+			pass
+		events = []
+		offset = 0
+		# struct inotify_event: int wd, uint32_t mask, uint32_t cookie, uint32_t len, char name[len]
+		while offset + 16 <= len(data):
+			wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+			name = data[offset + 16:offset + 16 + length].split(b"\0", 1)[0].decode('utf-8', errors='replace')
+			events.append((mask, name))
+			offset += 16 + length
+		return events
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+# A patch of a split file (io_form 102), WRF adds the rank to the file name: wrfout_d01_2019-05-26_00_00_00_0012
+splitPattern = re.compile(r"^(.+)_(\d{4,})$")
+
+# split_files: The patch files of a split file, name is the file name WRF uses without io_form 102. Empty if it was not split.
+def split_files(name):
+	patches = []
+	for fPath in glob.glob(glob.escape(name) + "_[0-9][0-9][0-9][0-9]*"):
+		match = splitPattern.match(fPath)
+		if match and match.group(1) == name:
+			patches.append(fPath)
+	return sorted(patches)
+
+# series_files: The files matching path (Globs allowed), the patches of each split file are listed once under its unsplit name
+def series_files(path):
+	names = set()
+	for fPath in glob.glob(path):
+		match = splitPattern.match(fPath)
+		names.add(match.group(1) if match else fPath)
+	return sorted(names)
+
+# OutputFollower: Reports each file of a series (IE: wrfout*) once the program writing it is done with it. A file is done when a later
+#  file of the series exists, when finalPass is set (The writer has exited), or when it has not changed for stableSeconds with a closed
+#  netCDF header. The patches of a split file (io_form 102) are followed as one file under its unsplit name, done when all of them are.
+#  The Python post-processor uses this class as well (PyPostTools puts this directory on its path).
+class OutputFollower:
+	path = ""
+	stableSeconds = 60
+	processed = []
+	lastSeen = {}
+
+	def __init__(self, path, stableSeconds = 60):
+		self.path = path
+		self.stableSeconds = stableSeconds
+		self.processed = []
+		self.lastSeen = {}
+
+	def files(self):
+		return series_files(self.path)
+
+	# parts: The files written for fPath, itself or the patches of a split file
+	def parts(self, fPath):
+		return [fPath] if os.path.exists(fPath) else split_files(fPath)
+
+	def pending(self):
+		return [f for f in self.files() if f not in self.processed]
+
+	def has_processed(self, timeStamp):
+		return any(fPath.endswith(timeStamp) for fPath in self.processed)
+
+	# completed: Returns the newly finished files in order, each file is only returned once
+	def completed(self, finalPass = False):
+		fList = self.files()
+		finished = []
+		for i, fPath in enumerate(fList):
+			if fPath in self.processed:
+				continue
+			if i < len(fList) - 1 or finalPass or self.is_stable(fPath):
+				self.processed.append(fPath)
+				finished.append(fPath)
+			else:
+				break
+		return finished
+
+	def is_stable(self, fPath):
+		paths = self.parts(fPath)
+		try:
+			stats = [os.stat(p) for p in paths]
+		except OSError:
+			return False
+		if not stats:
+			return False
+		sig = tuple((st.st_size, st.st_mtime) for st in stats)
+		now = time.time()
+		if fPath not in self.lastSeen or self.lastSeen[fPath][0] != sig:
+			self.lastSeen[fPath] = (sig, now)
+			return False
+		return now - self.lastSeen[fPath][1] >= self.stableSeconds and all(netcdf_header_closed(p) for p in paths)
+
+# netcdf_header_closed: Classic netCDF files carry a record count of 0xFF... while they are still being streamed, HDF5 based files
+#  do not, so those rely on the size check alone
+def netcdf_header_closed(fPath):
+	try:
+		with open(fPath, 'rb') as f:
+			head = f.read(12)
+	except OSError:
+		return False
+	if head[:3] == b'CDF' and len(head) >= 8:
+		if head[3] == 5:
+			return len(head) == 12 and head[4:12] != b'\xff' * 8
+		return head[4:8] != b'\xff' * 4
+	return head[:4] == b'\x89HDF'
+
 # Wait: Class instance designed to establish a hold condition until execution has been completed
+#  Hold conditions are dictionaries using one of the following forms:
+#   {"logFile": path, "contains": text, "retCode": code} - Checked in-process against newly appended bytes of path (Globs allowed)
+#   {"logFile": path, "contains": text, "lastLines": count, "retCode": code} - Checked against the last count lines of path only
+#   {"fileExists": path, "retCode": code} - Checked in-process for the existence of path (Globs allowed)
+#   {"jobTracker": tracker, "jobID": id, "retCode": code} - Met once the scheduler reports the job has left the queue
+#   {"waitCommand": command, ("contains" | "isValue" | "isNotValue"): text, "retCode": code} - Runs command in a shell
 class Wait:
 	holds = []
+	tails = {}
 	currentTime = ""
 	abortTime = ""
 	timeDelay = ""
-	
+	# Seconds to let the writer finish after a change that could meet a hold, before scanning
+	minDelay = 2
+
 	def __init__(self, holdList, abortTime = None, timeDelay=10):
 		self.holds = holdList
+		self.tails = {}
 		self.currentTime = datetime.datetime.utcnow()
 		self.abortTime = self.currentTime + datetime.timedelta(days=int(999))
 		self.timeDelay = timeDelay
 		if(abortTime != None):
 			self.abortTime = self.currentTime + datetime.timedelta(seconds=int(abortTime))
-	
+		for indHold in self.holds:
+			if 'logFile' in indHold and indHold["logFile"] not in self.tails:
+				self.tails[indHold["logFile"]] = LogTail(indHold["logFile"])
+
+	def watchDirectories(self):
+		dirs = []
+		for indHold in self.holds:
+			for key in ["logFile", "fileExists"]:
+				if key in indHold:
+					dirs.append(os.path.dirname(os.path.abspath(indHold[key])))
+		return dirs
+
+	def check_logs(self):
+		newText = {}
+		for path, tail in self.tails.items():
+			newText[path] = tail.read_new()
+		for indHold in self.holds:
+			if 'logFile' not in indHold:
+				continue
+			if 'lastLines' in indHold:
+				text = self.tails[indHold["logFile"]].last_lines(indHold["lastLines"])
+			else:
+				text = newText[indHold["logFile"]]
+			if indHold["contains"] in text:
+				return indHold["retCode"]
+		return None
+
+	def check(self):
+		logResult = self.check_logs()
+		if logResult is not None:
+			return logResult
+		for indHold in self.holds:
+			retCode = indHold["retCode"]
+			if 'logFile' in indHold:
+				continue
+			if 'jobTracker' in indHold:
+				if indHold["jobID"] is not None and indHold["jobTracker"].isTerminal(indHold["jobID"]):
+					# The job may have written its final lines right before leaving the queue, give the logs one last look.
+					lateResult = self.check_logs()
+					return lateResult if lateResult is not None else retCode
+				continue
+			if 'fileExists' in indHold:
+				if glob.glob(indHold["fileExists"]):
+					return retCode
+				continue
+			command = indHold["waitCommand"]
+
+			runCmd = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			runCmd.wait()
+			cResult, stderr = runCmd.communicate()
+			cResult = str(cResult)
+			stderr = str(stderr)
+
+			if 'splitFirst' in indHold:
+				cResult = cResult.split()[0]
+			if 'contains' in indHold:
+				contains = indHold["contains"]
+				if(contains in cResult):
+					return retCode
+			elif 'isValue' in indHold:
+				isValue = indHold["isValue"]
+				if(cResult == isValue):
+					return retCode
+			elif 'isNotValue' in indHold:
+				isValue = indHold["isNotValue"]
+				if(cResult != isValue):
+					return retCode
+			else:
+				return cResult
+		return None
+
+	# changed: True if one of the inotify events could meet a hold: a file named like a logFile or fileExists path was created, moved in,
+	#  or closed by its writer. Lines appended to a log (IE: rsl.out.0000 every time step) wait for the next scan.
+	def changed(self, events):
+		patterns = [os.path.basename(indHold[key]) for indHold in self.holds for key in ["logFile", "fileExists"] if key in indHold]
+		for mask, name in events:
+			if mask & (DirectoryWatcher.IN_CREATE | DirectoryWatcher.IN_MOVED_TO | DirectoryWatcher.IN_CLOSE_WRITE):
+				if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+					return True
+		return False
+
+	# hold: Scans the holds once every timeDelay seconds until one is met, a change seen by the DirectoryWatcher (See changed()) starts
+	#  the next scan early
 	def hold(self):
-		cTime = datetime.datetime.utcnow()
-		while cTime < self.abortTime:
-			for indHold in self.holds:
-				command = indHold["waitCommand"]
-				retCode = indHold["retCode"]
-				#cResult = os.popen(command).read()
-				
-				runCmd = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-				runCmd.wait()
-				cResult, stderr = runCmd.communicate()
-				cResult = str(cResult)
-				stderr = str(stderr)
-				
-				if 'splitFirst' in indHold:
-					cResult = cResult.split()[0]
-				if 'contains' in indHold:
-					contains = indHold["contains"]
-					if(contains in cResult):
-						return retCode
-				elif 'isValue' in indHold:
-					isValue = indHold["isValue"]
-					if(cResult == isValue):
-						return retCode
-				elif 'isNotValue' in indHold:
-					isValue = indHold["isNotValue"]
-					if(cResult != isValue):
-						return retCode
-				else:
-					return cResult	
-			time.sleep(self.timeDelay)
+		watcher = DirectoryWatcher(self.watchDirectories())
+		try:
 			cTime = datetime.datetime.utcnow()
+			while cTime < self.abortTime:
+				result = self.check()
+				if result is not None:
+					return result
+				nextScan = time.time() + self.timeDelay
+				remaining = nextScan - time.time()
+				while remaining > 0:
+					if self.changed(watcher.wait(remaining)):
+						# Give the writer a moment to finish before scanning again
+						time.sleep(self.minDelay)
+						break
+					remaining = nextScan - time.time()
+				cTime = datetime.datetime.utcnow()
+		finally:
+			watcher.close()
 		raise TimeExpiredException
-		return None
\ No newline at end of file
+		return None
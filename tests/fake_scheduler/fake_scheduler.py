@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# fake_scheduler.py
+#
+# Stands in for the scheduler commands JobTracker runs (sbatch, squeue, sacct, scancel, qsub, qstat, tracejob, qdel), set scheduler_bin_dir to this
+#  directory. The jobs are read from the JSON file named by FAKE_SCHEDULER_STATE: {"jobs": {"101": "RUNNING"}, "raw": "..."}. A job is
+#  PENDING, RUNNING, COMPLETED or FAILED, the last two have left the queue. When raw is set it is printed instead of the status of the
+#  jobs (IE: An error or an output format JobTracker does not read). A submitted job is added to the jobs as PENDING with the next ID
+#  from 201 on, and its arguments are appended to "submitted". When "submit" is set it is printed instead (IE: A refused submission), a
+#  job file listed in "refuse" is refused the same way. A cancelled job (scancel, qdel) is FAILED and its ID appended to "cancelled".
+
+import os
+import sys
+import json
+
+pbsCodes = {"PENDING": "Q", "RUNNING": "R"}
+cobaltCodes = {"PENDING": "queued", "RUNNING": "running"}
+
+def load():
+	with open(os.environ["FAKE_SCHEDULER_STATE"], 'r') as state_file:
+		return json.load(state_file)
+		
+def save(state):
+	with open(os.environ["FAKE_SCHEDULER_STATE"], 'w') as state_file:
+		json.dump(state, state_file)
+
+# job_ids: The job IDs given to a command, either as the value of -j or as the arguments that are not options
+def job_ids(args):
+	if "-j" in args:
+		return args[args.index("-j") + 1].split(",")
+	ids = []
+	for i, a in enumerate(args):
+		# -n (tracejob days) and -o (squeue format) take a value
+		if not a.startswith("-") and (i == 0 or args[i - 1] not in ["-n", "-o"]):
+			ids.append(a)
+	return ids
+
+def squeue(jobs, ids):
+	listed = [j for j in ids if jobs.get(j) in ["PENDING", "RUNNING"]]
+	if not listed:
+		sys.stderr.write("slurm_load_jobs error: Invalid job id specified\n")
+		return 1
+	for j in listed:
+		print(j + " " + jobs[j])
+	return 0
+
+def sacct(jobs, ids):
+	for j in ids:
+		if j in jobs:
+			print(j + "|" + ("FAILED" if jobs[j] == "FAILED" else jobs[j]))
+	return 0
+
+def qstat(jobs, ids, full):
+	code = 0
+	if not full and any(jobs.get(j) in ["PENDING", "RUNNING"] for j in ids):
+		print("JobID  User  WallTime  Nodes  State  Location")
+	for j in ids:
+		if jobs.get(j) not in ["PENDING", "RUNNING"]:
+			if full:
+				sys.stderr.write("qstat: Unknown Job Id " + j + ".server\n")
+				code = 153
+			continue
+		if full:
+			print("Job Id: " + j + ".server\n    Job_Name = fake\n    job_state = " + pbsCodes[jobs[j]] + "\n")
+		else:
+			print(j + "  user  00:10:00  1  " + cobaltCodes[jobs[j]] + "  none")
+	return code
+
+def tracejob(jobs, ids):
+	for j in ids:
+		if jobs.get(j) in ["COMPLETED", "FAILED"]:
+			print("\nJob: " + j + ".server\n")
+			print("04/01/2019 10:00:00  S    Job Queued at request of user@host, owner = user@host")
+			print("04/01/2019 10:20:00  S    Exit_status=" + ("0" if jobs[j] == "COMPLETED" else "271") + " resources_used.walltime=00:20:00")
+	return 0
+
+# submit: sbatch and qsub, prints the job ID the way the scheduler does
+def submit(state, command, args):
+	if state.get("submit") is not None or any(a in state.get("refuse", []) for a in args):
+		sys.stderr.write((state.get("submit") or "Batch job submission failed") + "\n")
+		return 1
+	jobID = str(201 + len(state.setdefault("submitted", [])))
+	state["submitted"].append(args)
+	state["jobs"][jobID] = "PENDING"
+	save(state)
+	print("Submitted batch job " + jobID if command == "sbatch" else jobID + ".server")
+	return 0
+
+# cancel: scancel and qdel
+def cancel(state, ids):
+	for j in ids:
+		if state["jobs"].get(j) in ["PENDING", "RUNNING"]:
+			state["jobs"][j] = "FAILED"
+		state.setdefault("cancelled", []).append(j)
+	save(state)
+	return 0
+
+def main():
+	command = os.path.basename(sys.argv[1])
+	args = sys.argv[2:]
+	state = load()
+	if command in ["sbatch", "qsub"]:
+		return submit(state, command, args)
+	elif command in ["scancel", "qdel"]:
+		return cancel(state, job_ids(args))
+	if state.get("raw") is not None:
+		print(state["raw"])
+		return 0
+	jobs = state["jobs"]
+	ids = job_ids(args)
+	if command == "squeue":
+		return squeue(jobs, ids)
+	elif command == "sacct":
+		return sacct(jobs, ids)
+	elif command == "qstat":
+		return qstat(jobs, ids, "-f" in args)
+	elif command == "tracejob":
+		return tracejob(jobs, ids)
+	sys.stderr.write(command + ": not supported\n")
+	return 1
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+# test_jobs.py
+#
+# Drives Jobs.JobSteps against the stand-in scheduler commands of fake_scheduler/ (scheduler_bin_dir)
+
+import os
+import sys
+import json
+import shutil
+import datetime
+import tempfile
+import unittest
+
+testDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(testDir), "scripts"))
+
+import Jobs
+import Scheduler
+import Tools
+
+# FakeSettings: The settings of the shipped control.txt, with the run directory moved into workDir
+class FakeSettings:
+	settings = {}
+	replacementKeys = {}
+	startTime = datetime.datetime(2019, 5, 26)
+	endTime = datetime.datetime(2019, 5, 28)
+
+	def __init__(self, workDir):
+		self.settings = {}
+		self.replacementKeys = {}
+		with open(os.path.join(os.path.dirname(testDir), "control.txt"), 'r') as control_file:
+			for line in control_file:
+				tokenized = line.split()
+				if tokenized and tokenized[0][0] != '#':
+					self.settings[tokenized[0]] = tokenized[1]
+		self.settings.update({"debugmode": "0", "wrfdir": workDir, "headdir": workDir + "/"})
+
+	def fetch(self, key):
+		return self.settings.get(key)
+
+class JobStepsTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp()
+		self.statePath = os.path.join(self.workDir, "state.json")
+		os.environ["FAKE_SCHEDULER_STATE"] = self.statePath
+		Tools.loggedPrint.instance().filePath = os.path.join(self.workDir, "test.log")
+		self.settings = FakeSettings(self.workDir)
+		self.steps = Jobs.JobSteps(self.settings, None, Scheduler.Scheduler_Settings("SLURM", os.path.join(testDir, "fake_scheduler")))
+		os.makedirs(self.steps.runDir + "/output")
+
+	def tearDown(self):
+		shutil.rmtree(self.workDir)
+
+	def set_state(self, state):
+		with open(self.statePath, 'w') as state_file:
+			json.dump(state, state_file)
+
+	def get_state(self):
+		with open(self.statePath, 'r') as state_file:
+			return json.load(state_file)
+
+	# A submission without a job ID fails the stage at once, instead of waiting on a log file the job will never write
+	def test_failed_submission(self):
+		self.set_state({"jobs": {}, "submit": "sbatch: error: Batch job submission failed: Job violates accounting/QOS policy"})
+		self.assertFalse(self.steps.run_geogrid_stage())
+		self.assertTrue(self.steps.submit_failed("geogrid"))
+		self.assertIsNone(self.steps.state.job_id("geogrid"))
+		self.assertFalse(self.steps.state.is_complete("geogrid"))
+
+	# A chain stops at the first job that could not be submitted, the jobs before it are cancelled and the ones after it never submitted
+	def test_chain_stops_on_failed_submission(self):
+		self.settings.settings.update({"run_geogrid": "1", "run_preprocessing_jobs": "1", "run_wrf": "1"})
+		self.set_state({"jobs": {}, "refuse": ["prerun.job"]})
+		self.assertFalse(self.steps.run_chain())
+		state = self.get_state()
+		self.assertEqual(len(state["submitted"]), 1)
+		self.assertEqual(state["cancelled"], ["201"])
+		self.assertIsNone(self.steps.state.job_id("geogrid"))
+
+	# A run killed at its walltime that gets neither more nodes (wrf_recovery_max_nodes 0) nor a restart file is not run again
+	def test_walltime_retry_without_change(self):
+		self.settings.settings.update({"wrf_recovery_attempts": "2", "wrf_recovery_max_nodes": "0"})
+		namelist = self.steps.runDir + "/output/namelist.input.wrf"
+		with open(namelist, 'w') as namelist_file:
+			namelist_file.write(" restart_interval                    = 7000,\n")
+		self.steps.tracker.track("301", "wrf")
+		self.steps.tracker.reasons["301"] = "TIMEOUT"
+		self.assertFalse(self.steps.recovery.prepare_retry("301", 60, namelist))
+		self.assertEqual(self.steps.recovery.attempts, 0)
+
+if __name__ == "__main__":
+	unittest.main()
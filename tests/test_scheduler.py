@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# test_scheduler.py
+#
+# Drives Scheduler.JobTracker against the stand-in scheduler commands of fake_scheduler/ (scheduler_bin_dir)
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+testDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(testDir), "scripts"))
+
+import Scheduler
+import Tools
+
+class FakeSettings:
+	def fetch(self, key):
+		return {"debugmode": "0"}.get(key)
+
+class JobTrackerTest(unittest.TestCase):
+	def setUp(self):
+		self.workDir = tempfile.mkdtemp()
+		self.statePath = os.path.join(self.workDir, "state.json")
+		os.environ["FAKE_SCHEDULER_STATE"] = self.statePath
+		Tools.loggedPrint.instance().filePath = os.path.join(self.workDir, "test.log")
+
+	def tearDown(self):
+		shutil.rmtree(self.workDir)
+
+	def set_jobs(self, jobs, raw = None, submit = None):
+		with open(self.statePath, 'w') as state_file:
+			json.dump({"jobs": jobs, "raw": raw, "submit": submit}, state_file)
+
+	def tracker(self, scheduler):
+		scheduleParms = Scheduler.Scheduler_Settings(scheduler, os.path.join(testDir, "fake_scheduler"))
+		tracker = Scheduler.JobTracker(scheduleParms, FakeSettings())
+		tracker.track("101", "good.job")
+		tracker.track("102", "bad.job")
+		return tracker
+
+	# run_lifecycle: Moves job 101 to COMPLETED and job 102 to FAILED through PENDING and RUNNING, checking the tracker at each step
+	def run_lifecycle(self, scheduler):
+		tracker = self.tracker(scheduler)
+		steps = [({"101": "PENDING", "102": "PENDING"}, "PENDING", "PENDING"),
+				 ({"101": "RUNNING", "102": "PENDING"}, "RUNNING", "PENDING"),
+				 ({"101": "RUNNING", "102": "RUNNING"}, "RUNNING", "RUNNING"),
+				 ({"101": "COMPLETED", "102": "FAILED"}, "COMPLETED", "FAILED")]
+		for jobs, first, second in steps:
+			self.set_jobs(jobs)
+			states = tracker.poll(force = True)
+			self.assertEqual(states["101"], first)
+			self.assertEqual(states["102"], second)
+		return tracker
+
+	def test_slurm(self):
+		tracker = self.run_lifecycle("SLURM")
+		self.assertEqual(tracker.reason("102"), "FAILED")
+
+	def test_pbs(self):
+		tracker = self.run_lifecycle("PBS")
+		self.assertEqual(tracker.reason("102"), "Exit_status 271")
+		self.assertTrue(tracker.isTerminal("101"))
+
+	def test_cobalt(self):
+		tracker = self.tracker("COBALT")
+		self.set_jobs({"101": "PENDING", "102": "PENDING"})
+		self.assertEqual(tracker.poll(force = True)["101"], "PENDING")
+		self.set_jobs({"101": "RUNNING", "102": "PENDING"})
+		self.assertEqual(tracker.poll(force = True)["101"], "RUNNING")
+		# Cobalt has no accounting command, a job that has left the queue ended with an unknown exit status
+		self.set_jobs({"101": "COMPLETED", "102": "RUNNING"})
+		states = tracker.poll(force = True)
+		self.assertEqual(states["101"], "FINISHED")
+		self.assertEqual(states["102"], "RUNNING")
+
+	# An output the parser does not read (IE: qstat -x XML from Torque) must not mark the jobs as finished
+	def test_unusable_output_keeps_states(self):
+		for scheduler in ["SLURM", "PBS", "COBALT"]:
+			tracker = self.tracker(scheduler)
+			self.set_jobs({"101": "RUNNING", "102": "RUNNING"})
+			tracker.poll(force = True)
+			self.set_jobs({}, raw = "<Data><Job><Job_Id>101.server</Job_Id></Job></Data>")
+			states = tracker.poll(force = True)
+			self.assertEqual(states["101"], "RUNNING", scheduler)
+			self.assertEqual(states["102"], "RUNNING", scheduler)
+
+	# A refused submission, or one whose output has no job ID, returns None and tracks nothing
+	def test_submit_without_job_id(self):
+		for scheduler in ["SLURM", "PBS", "COBALT"]:
+			tracker = self.tracker(scheduler)
+			self.set_jobs({})
+			self.assertTrue(tracker.submit("geogrid.job", name = "geogrid", cwd = self.workDir).startswith("201"), scheduler)
+			self.set_jobs({}, submit = "sbatch: error: Batch job submission failed: Invalid account or account/partition combination")
+			self.assertIsNone(tracker.submit("prerun.job", name = "prerun", cwd = self.workDir), scheduler)
+			self.assertNotIn("prerun", tracker.jobs.values(), scheduler)
+
+if __name__ == "__main__":
+	unittest.main()